@@ -1,5 +1,6 @@
-from flask import Flask, redirect, url_for
+from flask import Flask, redirect, send_from_directory, url_for
 from .extensions import db, login_manager
+from . import banco_sqlite, escopo_obra, instrumentacao, metricas, replica
 from .models.user import User
 from config import Config
 import os
@@ -31,8 +32,15 @@ def create_app():
         "dev-secret"
     )
 
+    replica.configurar(app, os.getenv("DATABASE_URL_REPLICA"))
+
     db.init_app(app)
+    banco_sqlite.init_app(app)
     login_manager.init_app(app)
+    instrumentacao.init_app(app)
+    metricas.init_app(app)
+    replica.init_app(app)
+    escopo_obra.init_app(app)
 
     @login_manager.user_loader
     def load_user(user_id):
@@ -52,6 +60,7 @@ def create_app():
 
         db.create_all()
         _seed_admin()
+        _seed_obra()
 
     from app.blueprints.auth import auth_bp
     from app.blueprints.estoque import estoque_bp
@@ -69,6 +78,19 @@ def create_app():
             url_for("estoque.dashboard")
         )
 
+    @app.get("/sw.js")
+    def service_worker():
+        # Servido na raiz, e não em /static, para que o service worker
+        # controle todas as páginas do app.
+        resposta = send_from_directory(
+            app.static_folder,
+            "sw.js",
+            max_age=0,
+        )
+        resposta.headers["Cache-Control"] = "no-cache"
+
+        return resposta
+
     return app
 
 
@@ -92,3 +114,14 @@ def _seed_admin():
 
         db.session.add(usuario)
         db.session.commit()
+
+
+def _seed_obra():
+    from app.models.obra import Obra
+    from app.services import obra_service
+
+    if not Obra.query.first():
+        obra_service.criar_obra(
+            obra_service.NOME_OBRA_PADRAO,
+            *obra_service.layout_padrao(),
+        )
@@ -0,0 +1,97 @@
+"""
+Modo SQLite para produção pequena, com vários workers do gunicorn.
+
+No modo padrão do SQLite (rollback journal) quem lê trava quem grava:
+um relatório longo segura as aprovações, e dois workers gravando ao
+mesmo tempo recebem "database is locked". Com SQLITE_OTIMIZADO ligado,
+cada conexão nova recebe:
+
+- journal_mode=WAL: leituras não bloqueiam a escrita, nem o contrário;
+- synchronous=NORMAL: em WAL, só perde as últimas transações numa queda
+  de energia, sem corromper o banco;
+- mmap_size, cache_size: leituras pela memória em vez de read();
+- busy_timeout: quem encontra o banco travado espera, em vez de falhar.
+
+Escritas são serializadas: transações de requisições que gravam
+(POST etc.) e de scripts abrem com BEGIN IMMEDIATE, pegando a trava de
+escrita logo no início. Com BEGIN comum, duas transações que leram e
+depois tentam gravar fazem o SQLite recusar uma delas na hora, sem
+esperar o busy_timeout. Requisições GET continuam com BEGIN comum e
+não disputam a trava.
+
+WAL exige o banco num disco local (não funciona em NFS/SMB).
+"""
+from flask import has_request_context, request
+from sqlalchemy import event
+
+from app.extensions import db
+
+
+METODOS_LEITURA = ("GET", "HEAD", "OPTIONS")
+
+
+def _pragmas(config):
+    return [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_MB']) * 1024 * 1024}",
+        # negativo: em KiB, e não em páginas
+        f"PRAGMA cache_size={-int(config['SQLITE_CACHE_MB']) * 1024}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+def _transacao_de_escrita():
+    if has_request_context():
+        return request.method not in METODOS_LEITURA
+
+    return True
+
+
+def _ao_conectar(pragmas):
+    def configurar(dbapi_connection, connection_record):
+        # o BEGIN passa a ser emitido por _ao_iniciar, e não pelo
+        # driver, que só o manda antes do primeiro INSERT/UPDATE
+        dbapi_connection.isolation_level = None
+
+        cursor = dbapi_connection.cursor()
+
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    return configurar
+
+
+def _ao_iniciar(conexao):
+    if conexao.get_execution_options().get("isolation_level") == "AUTOCOMMIT":
+        return
+
+    if _transacao_de_escrita():
+        conexao.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        conexao.exec_driver_sql("BEGIN")
+
+
+def configurar_engine(engine, config):
+    if engine.dialect.name != "sqlite":
+        return
+
+    if event.contains(engine, "begin", _ao_iniciar):
+        return
+
+    event.listen(engine, "connect", _ao_conectar(_pragmas(config)))
+    event.listen(engine, "begin", _ao_iniciar)
+
+
+def init_app(app):
+    """Chamar depois de db.init_app() e antes do primeiro acesso ao banco."""
+    if not app.config["SQLITE_OTIMIZADO"]:
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            configurar_engine(engine, app.config)
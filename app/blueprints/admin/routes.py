@@ -2,6 +2,9 @@ from flask import render_template, request, redirect, url_for, flash
 from flask_login import login_required
 from app.extensions import db
 from app.models.user import User
+from app import instrumentacao
+from app.models.obra import Obra
+import app.services.obra_service as obra_service
 
 from . import admin_bp
 from functools import wraps
@@ -33,6 +36,97 @@ def usuarios_lista():
     return render_template("admin/usuarios_lista.html", usuarios=usuarios)
 
 
+# PAINEL DE DESEMPENHO
+@admin_bp.get("/desempenho")
+@login_required
+@role_required("ADMIN")
+def desempenho():
+    requisicoes = instrumentacao.requisicoes_recentes()
+
+    if request.args.get("ordem") == "lentas":
+        requisicoes.sort(key=lambda r: r["total_ms"], reverse=True)
+    elif request.args.get("ordem") == "consultas":
+        requisicoes.sort(key=lambda r: r["consultas"], reverse=True)
+
+    return render_template(
+        "admin/desempenho.html",
+        requisicoes=requisicoes,
+        ordem=request.args.get("ordem", ""),
+    )
+
+
+# OBRAS
+@admin_bp.get("/obras")
+@login_required
+@role_required("ADMIN")
+def obras_lista():
+    return render_template(
+        "admin/obras_lista.html",
+        obras=obra_service.listar_obras(),
+    )
+
+
+def _salvar_obra(obra):
+    torres = obra_service.ler_torres(request.form.get("torres"))
+    pavimentos = obra_service.ler_pavimentos(request.form.get("pavimentos"))
+
+    if obra is None:
+        return obra_service.criar_obra(
+            request.form.get("nome"), torres, pavimentos
+        )
+
+    return obra_service.atualizar_obra(
+        obra,
+        request.form.get("nome"),
+        request.form.get("ativo") == "1",
+        torres,
+        pavimentos,
+    )
+
+
+@admin_bp.route("/obras/nova", methods=["GET", "POST"])
+@admin_bp.route("/obras/<int:obra_id>/editar", methods=["GET", "POST"])
+@login_required
+@role_required("ADMIN")
+def obra_form(obra_id=None):
+    obra = Obra.query.get_or_404(obra_id) if obra_id else None
+
+    if request.method == "POST":
+        try:
+            obra = _salvar_obra(obra)
+        except ValueError as erro:
+            db.session.rollback()
+            flash(str(erro), "warning")
+
+            return render_template(
+                "admin/obra_form.html",
+                obra=obra,
+                torres=request.form.get("torres", ""),
+                pavimentos=request.form.get("pavimentos", ""),
+            )
+
+        flash(f"Obra {obra.nome} salva.", "success")
+        return redirect(url_for("admin.obras_lista"))
+
+    if obra is not None:
+        torres = obra_service.texto_torres(obra)
+        pavimentos = obra_service.texto_pavimentos(obra)
+    else:
+        torres_padrao, pavimentos_padrao = obra_service.layout_padrao()
+        torres = "\n".join(torres_padrao)
+        pavimentos = "\n".join(
+            nome + (": " + ", ".join(unidades) if unidades else "")
+            for nome, unidades in pavimentos_padrao
+        )
+
+    return render_template(
+        "admin/obra_form.html",
+        obra=obra,
+        torres=torres,
+        pavimentos=pavimentos,
+    )
+
+
 # NOVO USUÁRIO
 @admin_bp.route("/usuarios/novo", methods=["GET", "POST"])
 @login_required
@@ -54,6 +148,7 @@ def usuario_novo():
 
         u = User(nome=nome, login=login, role=role, ativo=True)
         u.set_password(senha)
+        obra_service.definir_obras_do_usuario(u, request.form.getlist("obras"))
 
         db.session.add(u)
         db.session.commit()
@@ -61,7 +156,11 @@ def usuario_novo():
         flash("Usuário criado.", "success")
         return redirect(url_for("admin.usuarios_lista"))
 
-    return render_template("admin/usuario_form.html", usuario=None)
+    return render_template(
+        "admin/usuario_form.html",
+        usuario=None,
+        obras=obra_service.listar_obras(),
+    )
 
 
 # EDITAR USUÁRIO
@@ -75,12 +174,17 @@ def usuario_editar(user_id):
         u.nome = request.form.get("nome")
         u.login = request.form.get("login")
         u.role = request.form.get("role")
+        obra_service.definir_obras_do_usuario(u, request.form.getlist("obras"))
 
         db.session.commit()
         flash("Usuário atualizado.", "success")
         return redirect(url_for("admin.usuarios_lista"))
 
-    return render_template("admin/usuario_form.html", usuario=u)
+    return render_template(
+        "admin/usuario_form.html",
+        usuario=u,
+        obras=obra_service.listar_obras(),
+    )
 
 
 # RESETAR SENHA
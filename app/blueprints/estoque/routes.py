@@ -2,17 +2,26 @@ from app.models.solicitacao_historico import (
     SolicitacaoHistorico,
 )
 import app.services.solicitacao_service as solicitacao_service
+import app.services.solicitacao_lote_service as solicitacao_lote_service
 from datetime import datetime
 from flask import send_file
 import app.services.relatorio_solicitacoes_service as relatorio_solicitacoes_service
+import app.services.previsao_service as previsao_service
+import app.services.codigo_material_service as codigo_material_service
+import app.services.material_importacao_service as material_importacao_service
+import app.services.material_consulta_service as material_consulta_service
+import app.services.obra_service as obra_service
+import app.services.estoque_service as estoque_service
+import app.services.local_estoque_service as local_estoque_service
+from app import escopo_obra
 from app.models.user import User
 from decimal import Decimal, InvalidOperation
 import re
 import xml.etree.ElementTree as ET
 
-from flask import render_template, request, redirect, url_for, flash, current_app
+from flask import render_template, request, redirect, url_for, flash, current_app, abort, g
 from flask_login import current_user, login_required
-from flask import jsonify
+from flask import jsonify, Response, stream_with_context
 
 from sqlalchemy import or_
 from sqlalchemy.orm import joinedload
@@ -20,6 +29,7 @@ from sqlalchemy.orm import joinedload
 from app.extensions import db
 
 from app.models import Material, Solicitacao, SolicitacaoItem, Categoria, Entrada, EntradaItem, Fornecedor
+from app.models import LocalEstoque, TransferenciaEstoque
 
 from app.blueprints.estoque import estoque_bp
 from app.blueprints.relatorios import relatorios_bp
@@ -66,29 +76,37 @@ def _local_format(torre, pav, ap, txt):
     if ap: parts.append(f"Apt {ap}")
     return " · ".join(parts) if parts else "-"
 
-def _torres():
-    # Aruana Garden: 6 torres
-    return [f"{i:02d}" for i in range(1, 7)]
-
-def _pavs():
-    return ["Térreo"] + [f"Pav {i}" for i in range(1, 8)] + ["Cobertura"]
-
-def _aptos_por_pav():
-    d = {}
-    d["Térreo"] = [f"{i:02d}" for i in range(1, 9)]
-    for p in range(1, 8):
-        d[f"Pav {p}"] = [f"{p}{i:02d}" for i in range(1, 9)]
-    d["Cobertura"] = []
-    return d
-
 def gerar_codigo_material():
-    ultimo = db.session.query(func.max(Material.id)).scalar()
-    proximo = (ultimo or 0) + 1
-    return str(proximo)
+    return codigo_material_service.alocar_codigo()
 from sqlalchemy import text
 from app.extensions import db
 
 
+# ------------------------- obra -------------------------
+@estoque_bp.get("/obras")
+@login_required
+def obras_selecao():
+    return render_template(
+        "estoque/obras_selecao.html",
+        obras=obra_service.obras_do_usuario(current_user),
+    )
+
+@estoque_bp.post("/obras/selecionar")
+@login_required
+def obra_selecionar():
+    obra = escopo_obra.selecionar_obra(
+        request.form.get("obra_id", type=int)
+    )
+
+    if obra is None:
+        flash("Obra não encontrada ou sem acesso.", "warning")
+        return redirect(url_for("estoque.obras_selecao"))
+
+    flash(f"Trabalhando na obra {obra.nome}.", "success")
+
+    return redirect(url_for("estoque.dashboard"))
+
+
 # ------------------------- dashboard -------------------------
 from sqlalchemy import func
 from datetime import datetime
@@ -220,7 +238,7 @@ def dashboard():
         db.session.query(
             Categoria.nome,
             func.coalesce(
-                func.sum(SolicitacaoItem.qtd_aprovada),
+                func.sum(SolicitacaoItem.qtd_entregue),
                 0
             ).label("total")
         )
@@ -233,7 +251,9 @@ def dashboard():
             SolicitacaoItem.material_id == Material.id
         )
         .filter(
-            SolicitacaoItem.status == "ENTREGUE"
+            SolicitacaoItem.status.in_(
+                ["ENTREGUE", "ENTREGUE_PARCIAL"]
+            )
         )
         .group_by(
             Categoria.id,
@@ -241,7 +261,7 @@ def dashboard():
         )
         .order_by(
             func.sum(
-                SolicitacaoItem.qtd_aprovada
+                SolicitacaoItem.qtd_entregue
             ).desc()
         )
         .all()
@@ -272,6 +292,14 @@ def dashboard():
         .all()
     )
 
+    # -----------------------------
+    # REPOSIÇÃO SUGERIDA
+    # Lida da previsão calculada à noite
+    # -----------------------------
+    reposicao_sugerida = (
+        previsao_service.listar_reposicao_sugerida()
+    )
+
     return render_template(
         "estoque/dashboard.html",
 
@@ -296,6 +324,7 @@ def dashboard():
         categorias_valores=categorias_valores,
 
         materiais_criticos=materiais_criticos,
+        reposicao_sugerida=reposicao_sugerida,
         ultimas_solicitacoes=ultimas_solicitacoes,
     )
 
@@ -404,29 +433,61 @@ def solicitacao_analisar_itens(id):
         )
     )
 
+def _criar_solicitacao_com_chave():
+    """
+    Formulário enviado pelo service worker, com chave de idempotência:
+    passa pelo lote para que um reenvio da fila com a mesma chave não
+    crie outra solicitação.
+    """
+    envio = {
+        "chave": request.form.get("chave"),
+        "observacao": request.form.get("observacao"),
+        "local_torre": request.form.get("local_torre"),
+        "local_pav": request.form.get("local_pav"),
+        "local_apto": request.form.get("local_apto"),
+        "itens": [
+            {"material_id": material_id, "qtd": qtd}
+            for material_id, qtd in zip(
+                request.form.getlist("material_id[]"),
+                request.form.getlist("qtd[]"),
+            )
+        ],
+    }
+
+    resultado, = solicitacao_lote_service.enviar_lote(
+        current_user.id,
+        [envio],
+    )
+
+    if resultado["resultado"] == solicitacao_lote_service.RESULTADO_RECUSADA:
+        raise ValueError(resultado["erro"])
+
 @estoque_bp.route("/solicitacoes/nova", methods=["GET", "POST"])
 @login_required
 def solicitacao_nova():
 
     if request.method == "POST":
         try:
-            solicitacao_service.criar_solicitacao(
-                usuario_id=current_user.id,
-                observacao=(
-                    request.form.get("observacao") or ""
-                ).strip(),
-                local_torre=(
-                    request.form.get("local_torre") or ""
-                ).strip(),
-                local_pav=(
-                    request.form.get("local_pav") or ""
-                ).strip(),
-                local_apto=(
-                    request.form.get("local_apto") or ""
-                ).strip(),
-                materiais_ids=request.form.getlist("material_id[]"),
-                quantidades=request.form.getlist("qtd[]"),
-            )
+            if request.form.get("chave"):
+                _criar_solicitacao_com_chave()
+            else:
+                solicitacao_service.criar_solicitacao(
+                    usuario_id=current_user.id,
+                    observacao=(
+                        request.form.get("observacao") or ""
+                    ).strip(),
+                    local_torre=(
+                        request.form.get("local_torre") or ""
+                    ).strip(),
+                    local_pav=(
+                        request.form.get("local_pav") or ""
+                    ).strip(),
+                    local_apto=(
+                        request.form.get("local_apto") or ""
+                    ).strip(),
+                    materiais_ids=request.form.getlist("material_id[]"),
+                    quantidades=request.form.getlist("qtd[]"),
+                )
 
             flash(
                 "Solicitação criada com sucesso!",
@@ -468,24 +529,45 @@ def solicitacao_nova():
                 url_for("estoque.solicitacao_nova")
             )
 
-    materiais = (
-        Material.query
-        .filter_by(ativo=True)
-        .order_by(Material.nome.asc())
-        .all()
-    )
-
+    # os materiais vêm da busca (ou do catálogo offline), não da página
     return render_template(
         "estoque/solicitacao_form.html",
-        materiais=materiais,
+        layout=obra_service.obter_layout(g.obra) if g.get("obra") else None,
     )
   
+@estoque_bp.post("/solicitacoes/lote")
+@login_required
+def solicitacoes_lote():
+    dados = request.get_json(silent=True)
+
+    if not isinstance(dados, dict):
+        dados = {}
+
+    try:
+        resultados = solicitacao_lote_service.enviar_lote(
+            current_user.id,
+            dados.get("solicitacoes"),
+        )
+
+    except ValueError as erro:
+        return jsonify({"erro": str(erro)}), 400
+
+    except Exception:
+        current_app.logger.exception(
+            "Erro inesperado no lote de solicitações"
+        )
+
+        return jsonify({"erro": "Erro ao salvar as solicitações."}), 500
+
+    return jsonify({"resultados": resultados})
+
 @estoque_bp.route("/solicitacoes/<int:id>")
 @login_required
 def solicitacao_detalhe(id):
-    try:
-        solicitacao = solicitacao_service.obter_solicitacao(id)
+    # fora do try: solicitação de outra obra (ou inexistente) é 404
+    solicitacao = solicitacao_service.obter_solicitacao(id)
 
+    try:
         perfis_com_acesso_total = {
             "ADMIN",
             "ENGENHEIRO",
@@ -623,6 +705,34 @@ def solicitacao_rejeitar(id):
         )
     )
 
+@estoque_bp.get("/solicitacoes/<int:id>/entrega")
+@login_required
+@role_required("ALMOXARIFE", "AUX_ALMOX")
+def solicitacao_entrega(id):
+    cabecalho, itens = solicitacao_service.obter_resumo_entrega(id)
+
+    if cabecalho is None:
+        abort(404)
+
+    if not itens:
+        flash(
+            "Não existem itens aprovados para entrega.",
+            "info"
+        )
+
+        return redirect(
+            url_for(
+                "estoque.solicitacao_detalhe",
+                id=id
+            )
+        )
+
+    return render_template(
+        "estoque/solicitacao_entrega.html",
+        solicitacao=cabecalho,
+        itens=itens,
+    )
+
 @estoque_bp.route(
     "/solicitacoes/<int:id>/entregar",
     methods=["POST"]
@@ -632,14 +742,29 @@ def solicitacao_rejeitar(id):
 def solicitacao_entregar(id):
     solicitacao = solicitacao_service.obter_solicitacao(id)
 
+    # Sem campos de quantidade, entrega todo o saldo aprovado.
+    quantidades = None
+
+    if any(
+        chave.startswith("qtd_entregar_")
+        for chave in request.form
+    ):
+        quantidades = {
+            item.id: request.form.get(
+                f"qtd_entregar_{item.id}"
+            )
+            for item in solicitacao.itens
+        }
+
     try:
         solicitacao_service.entregar_itens_aprovados(
             solicitacao=solicitacao,
             usuario_id=current_user.id,
+            quantidades=quantidades,
         )
 
         flash(
-            "Itens aprovados entregues e estoque atualizado.",
+            "Entrega registrada e estoque atualizado.",
             "success"
         )
 
@@ -685,7 +810,12 @@ def entrada_editar(entrada_id):
     materiais = Material.query.filter_by(ativo=True).order_by(Material.nome.asc()).all()
 
     if request.method == "GET":
-        return render_template("estoque/entrada_form.html", ent=ent, materiais=materiais)
+        return render_template(
+            "estoque/entrada_form.html",
+            ent=ent,
+            materiais=materiais,
+            locais=local_estoque_service.listar_locais(apenas_ativos=True),
+        )
 
     acao = request.form.get("acao") or "salvar"
 
@@ -693,6 +823,11 @@ def entrada_editar(entrada_id):
         flash("Entrada cancelada (sem salvar alterações).", "info")
         return redirect(url_for("estoque.entradas_lista"))
 
+    # concluída, o saldo já está no local; mudar só deixaria o estorno
+    # (na exclusão) apontando para outro lugar
+    if ent.status != "CONCLUIDA":
+        ent.local_id = request.form.get("local_id", type=int) or None
+
     ent.numero_nf = (request.form.get("numero_nf") or "").strip()
     ent.documento_fornecedor = _clean_doc(request.form.get("documento_fornecedor") or "")
     ent.nome_fornecedor = (request.form.get("nome_fornecedor") or "").strip()
@@ -744,10 +879,16 @@ def entrada_concluir(entrada_id):
         flash("Sem itens para concluir.", "warning")
         return redirect(url_for("estoque.entrada_editar", entrada_id=ent.id))
 
-    for it in ent.itens:
-        mat = it.material
-        mat.saldo_atual = (mat.saldo_atual or 0) + it.qtd
+    local_id = ent.local_id or estoque_service.local_central_id(ent.obra_id)
 
+    totais = estoque_service.agrupar_por_material(
+        (it.material_id, it.qtd) for it in ent.itens
+    )
+
+    for material_id in sorted(totais):
+        estoque_service.movimentar_local(material_id, local_id, totais[material_id])
+
+    ent.local_id = local_id
     ent.status = "CONCLUIDA"
     db.session.commit()
     flash("Entrada concluída e estoque atualizado.", "success")
@@ -758,13 +899,16 @@ def entrada_concluir(entrada_id):
 def entrada_excluir(entrada_id):
     entrada = Entrada.query.get_or_404(entrada_id)
 
-    # se a entrada estiver concluída, devolve o saldo
+    # se a entrada estiver concluída, devolve o saldo (do local onde entrou)
     if entrada.status == "CONCLUIDA":
-        for item in entrada.itens:
-            mat = Material.query.get(item.material_id)
-            if mat:
-                qtd = Decimal(str(item.qtd))
-                mat.saldo_atual = (mat.saldo_atual or Decimal("0")) - qtd
+        local_id = entrada.local_id or estoque_service.local_central_id(entrada.obra_id)
+
+        totais = estoque_service.agrupar_por_material(
+            (item.material_id, item.qtd) for item in entrada.itens
+        )
+
+        for material_id in sorted(totais):
+            estoque_service.movimentar_local(material_id, local_id, -totais[material_id])
 
     db.session.delete(entrada)
     db.session.commit()
@@ -874,7 +1018,7 @@ def buscar_material_inteligente(codigo, nome, unidade):
 
     # 3) Se não achou, cria material novo
     novo = Material(
-        codigo=codigo,
+        codigo=codigo or gerar_codigo_material(),
         nome=nome,
         unidade=unidade or "UN",
         saldo_atual=0,
@@ -918,6 +1062,8 @@ def entrada_importar_xml(entrada_id):
     ent.itens.clear()
     db.session.flush()
 
+    linhas = []
+    novos = {}
     for det in dets:
         cProd = det.findtext(".//{*}prod/{*}cProd") or det.findtext(".//prod/cProd") or ""
         xProd = det.findtext(".//{*}prod/{*}xProd") or det.findtext(".//prod/xProd") or ""
@@ -934,17 +1080,171 @@ def entrada_importar_xml(entrada_id):
         else:
             mat = Material.query.filter_by(nome=xProd).first()
 
-        if not mat:
-            mat = Material(codigo=(cProd or None), nome=(xProd or "SEM DESCRIÇÃO"), unidade=(uCom or "un"), ativo=True)
-            db.session.add(mat)
-            db.session.flush()
+        linhas.append((mat, cProd or xProd, qtd))
 
+        # linhas repetidas de um material novo viram um único cadastro
+        if not mat and (cProd or xProd) not in novos:
+            novos[cProd or xProd] = (cProd, xProd, uCom)
+
+    # Um único bloco de códigos para os materiais novos sem cProd
+    codigos_novos = iter(codigo_material_service.alocar_codigos(
+        sum(1 for cProd, *_ in novos.values() if not cProd)
+    ))
+
+    for chave, (cProd, xProd, uCom) in novos.items():
+        novos[chave] = Material(
+            codigo=(cProd or next(codigos_novos)),
+            nome=(xProd or "SEM DESCRIÇÃO"),
+            unidade=(uCom or "un"),
+            ativo=True,
+        )
+        db.session.add(novos[chave])
+
+    db.session.flush()
+
+    for mat, chave, qtd in linhas:
+        mat = mat or novos[chave]
         db.session.add(EntradaItem(entrada_id=ent.id, material_id=mat.id, qtd=qtd))
 
     db.session.commit()
     flash("XML importado. Confira os itens e salve.", "success")
     return redirect(url_for("estoque.entrada_editar", entrada_id=ent.id))
 
+# ------------------------- locais de estoque -------------------------
+@estoque_bp.get("/locais")
+@login_required
+@role_required("ALMOXARIFE", "ENGENHEIRO")
+def locais_lista():
+    return render_template(
+        "estoque/locais.html",
+        locais=local_estoque_service.listar_locais(),
+    )
+
+@estoque_bp.route("/locais/novo", methods=["GET", "POST"])
+@estoque_bp.route("/locais/<int:local_id>/editar", methods=["GET", "POST"])
+@login_required
+@role_required("ALMOXARIFE", "ENGENHEIRO")
+def local_form(local_id=None):
+    if g.get("obra") is None:
+        abort(404)
+
+    local = LocalEstoque.query.get_or_404(local_id) if local_id else None
+    layout = obra_service.obter_layout(g.obra)
+
+    if request.method == "POST":
+        try:
+            local_estoque_service.salvar_local(
+                local,
+                g.obra,
+                nome=request.form.get("nome"),
+                torre=request.form.get("torre"),
+                pavimento=request.form.get("pavimento"),
+                central=request.form.get("central") == "1",
+                ativo=request.form.get("ativo") == "1",
+            )
+        except ValueError as erro:
+            db.session.rollback()
+            flash(str(erro), "warning")
+
+            return render_template(
+                "estoque/local_form.html",
+                local=local,
+                layout=layout,
+            )
+
+        flash("Local de estoque salvo.", "success")
+        return redirect(url_for("estoque.locais_lista"))
+
+    return render_template(
+        "estoque/local_form.html",
+        local=local,
+        layout=layout,
+    )
+
+@estoque_bp.route("/transferencias", methods=["GET", "POST"])
+@login_required
+@role_required("ALMOXARIFE", "ENGENHEIRO", "AUX_ALMOX")
+def transferencias():
+    if request.method == "POST":
+        material = Material.query.filter_by(
+            id=request.form.get("material_id", type=int)
+        ).first_or_404()
+        origem = LocalEstoque.query.filter_by(
+            id=request.form.get("origem_id", type=int)
+        ).first_or_404()
+        destino = LocalEstoque.query.filter_by(
+            id=request.form.get("destino_id", type=int)
+        ).first_or_404()
+        quantidade = _to_decimal(request.form.get("qtd"))
+
+        try:
+            estoque_service.transferir(
+                material,
+                origem,
+                destino,
+                quantidade,
+                usuario_id=current_user.id,
+                observacao=request.form.get("observacao"),
+            )
+            db.session.commit()
+
+        except ValueError as erro:
+            db.session.rollback()
+            flash(str(erro), "warning")
+
+        else:
+            flash(
+                f"Transferido {quantidade} {material.unidade or ''} de "
+                f"{material.nome}: {origem.nome} → {destino.nome}.",
+                "success",
+            )
+
+        return redirect(
+            url_for("estoque.transferencias", material_id=material.id)
+        )
+
+    material_id = request.args.get("material_id", type=int)
+    material = (
+        Material.query.filter_by(id=material_id).first()
+        if material_id
+        else None
+    )
+
+    # o join com material aplica o filtro da obra
+    recentes = (
+        TransferenciaEstoque.query
+        .join(Material, Material.id == TransferenciaEstoque.material_id)
+        .options(
+            joinedload(TransferenciaEstoque.material),
+            joinedload(TransferenciaEstoque.origem),
+            joinedload(TransferenciaEstoque.destino),
+            joinedload(TransferenciaEstoque.usuario),
+        )
+    )
+
+    if material is not None:
+        recentes = recentes.filter(
+            TransferenciaEstoque.material_id == material.id
+        )
+
+    return render_template(
+        "estoque/transferencias.html",
+        material=material,
+        saldos=(
+            local_estoque_service.saldos_por_local(material.id)
+            if material is not None
+            else []
+        ),
+        locais=local_estoque_service.listar_locais(apenas_ativos=True),
+        transferencias=(
+            recentes
+            .order_by(TransferenciaEstoque.id.desc())
+            .limit(50)
+            .all()
+        ),
+    )
+
+
 # =========================
 # CATEGORIAS
 # =========================
@@ -1061,6 +1361,63 @@ def material_inativar(id):
 
     return redirect(url_for("estoque.materiais"))
 
+
+@estoque_bp.route("/materiais/importar", methods=["GET", "POST"])
+@login_required
+@role_required("ADMIN", "ALMOXARIFE", "ENGENHEIRO")
+def materiais_importar():
+    resultado = None
+
+    if request.method == "POST":
+        arq = request.files.get("arquivo")
+
+        if not arq or not arq.filename:
+            flash("Selecione um arquivo CSV ou XLSX.", "warning")
+            return redirect(url_for("estoque.materiais_importar"))
+
+        try:
+            resultado = material_importacao_service.importar_materiais(
+                arq.stream,
+                arq.filename,
+            )
+        except ValueError as e:
+            flash(str(e), "danger")
+            return redirect(url_for("estoque.materiais_importar"))
+
+        flash(
+            f"{resultado['gravadas']} material(is) importado(s) de "
+            f"{resultado['linhas']} linha(s).",
+            "success" if not resultado["total_erros"] else "warning",
+        )
+
+    return render_template(
+        "estoque/materiais_importar.html",
+        resultado=resultado,
+        colunas=material_importacao_service.COLUNAS_EXPORTACAO,
+    )
+
+
+@estoque_bp.get("/materiais/exportar.csv")
+@login_required
+def materiais_exportar_csv():
+    # o CSV sai em pedaços enquanto o cursor percorre o catálogo
+    return Response(
+        stream_with_context(material_importacao_service.gerar_csv_catalogo()),
+        mimetype="text/csv; charset=utf-8",
+        headers={"Content-Disposition": "attachment; filename=materiais.csv"},
+    )
+
+
+@estoque_bp.get("/materiais/exportar.xlsx")
+@login_required
+def materiais_exportar_xlsx():
+    return send_file(
+        material_importacao_service.gerar_xlsx_catalogo(),
+        as_attachment=True,
+        download_name="materiais.xlsx",
+        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
 @estoque_bp.get("/materiais/buscar")
 @login_required
 def materiais_buscar():
@@ -1073,10 +1430,7 @@ def materiais_buscar():
         Material.query
         .filter(
             Material.ativo == True,
-            or_(
-                Material.nome.ilike(f"%{termo}%"),
-                Material.codigo.ilike(f"%{termo}%")
-            )
+            material_consulta_service.filtro_busca(termo)
         )
         .order_by(Material.nome.asc())
         .limit(30)
@@ -1089,12 +1443,30 @@ def materiais_buscar():
                 "id": m.id,
                 "text": f"{m.codigo or '-'} - {m.nome}",
                 "saldo": float(m.saldo_atual or 0),
+                "disponivel": float(m.disponivel_decimal),
                 "unidade": m.unidade or ""
             }
             for m in materiais
         ]
     })
 
+@estoque_bp.get("/materiais/catalogo")
+@login_required
+def materiais_catalogo():
+    versao, materiais = material_consulta_service.catalogo_compacto()
+
+    resposta = jsonify({
+        "versao": versao,
+        "colunas": material_consulta_service.COLUNAS_CATALOGO,
+        "materiais": materiais,
+    })
+
+    # o aparelho reenvia a versão que tem e recebe 304 se nada mudou
+    resposta.set_etag(versao)
+    resposta.headers["Cache-Control"] = "private, no-cache"
+
+    return resposta.make_conditional(request)
+
 @estoque_bp.get("/relatorios/solicitacoes")
 @login_required
 def relatorio_solicitacoes():
@@ -1109,18 +1481,22 @@ def relatorio_solicitacoes():
         "data_final": request.args.get("data_final", ""),
     }
 
+    pagina = None
+    totais_status = {}
+
     try:
-        solicitacoes = (
+        pagina, totais_status = (
             relatorio_solicitacoes_service
-            .listar_solicitacoes(
+            .paginar_solicitacoes(
                 filtros,
                 current_user,
+                pagina=request.args.get("page", 1, type=int),
+                por_pagina=request.args.get("por_pagina", type=int),
             )
         )
 
     except ValueError as erro:
         flash(str(erro), "warning")
-        solicitacoes = []
 
     usuarios = (
         User.query
@@ -1138,7 +1514,9 @@ def relatorio_solicitacoes():
 
     return render_template(
         "estoque/relatorio_solicitacoes.html",
-        solicitacoes=solicitacoes,
+        solicitacoes=pagina.items if pagina else [],
+        pagina=pagina,
+        totais_status=totais_status,
         filtros=filtros,
         usuarios=usuarios,
         materiais=materiais,
@@ -1156,18 +1534,31 @@ def relatorio_solicitacoes_excel():
     filtros = request.args.to_dict()
 
     try:
-        solicitacoes = (
+        total, totais_status = (
             relatorio_solicitacoes_service
-            .listar_solicitacoes(
+            .contar_solicitacoes(
                 filtros,
                 current_user,
             )
         )
 
+        linhas = (
+            relatorio_solicitacoes_service
+            .iterar_linhas_relatorio(
+                relatorio_solicitacoes_service
+                .iterar_solicitacoes(
+                    filtros,
+                    current_user,
+                )
+            )
+        )
+
         arquivo = (
             relatorio_solicitacoes_service
             .gerar_excel_solicitacoes(
-                solicitacoes
+                linhas,
+                total,
+                totais_status,
             )
         )
 
@@ -1203,18 +1594,30 @@ def relatorio_solicitacoes_pdf():
     filtros = request.args.to_dict()
 
     try:
-        solicitacoes = (
+        total, _ = (
             relatorio_solicitacoes_service
-            .listar_solicitacoes(
+            .contar_solicitacoes(
                 filtros,
                 current_user,
             )
         )
 
+        linhas = (
+            relatorio_solicitacoes_service
+            .iterar_linhas_relatorio(
+                relatorio_solicitacoes_service
+                .iterar_solicitacoes(
+                    filtros,
+                    current_user,
+                )
+            )
+        )
+
         arquivo = (
             relatorio_solicitacoes_service
             .gerar_pdf_solicitacoes(
-                solicitacoes,
+                linhas,
+                total,
                 filtros,
             )
         )
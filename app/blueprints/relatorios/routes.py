@@ -1,11 +1,13 @@
+from collections.abc import Iterable
 from datetime import datetime
 from decimal import Decimal
 from io import BytesIO
+from types import SimpleNamespace
 
-from flask import render_template, request, send_file, flash, redirect, url_for
+from flask import render_template, request, send_file, flash, redirect, url_for, stream_template
 from flask_login import login_required, current_user
 from sqlalchemy.orm import joinedload
-from sqlalchemy import and_, or_
+from sqlalchemy import or_, select
 
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
@@ -16,9 +18,15 @@ from openpyxl import Workbook
 from app.extensions import db
 from app.models.material import Material
 from app.models.solicitacao import Solicitacao
-from app.models.solicitacao_item import SolicitacaoItem
+from app.models.solicitacao_item_entrega import SolicitacaoItemEntrega
 from app.models.entrada import Entrada
 from app.models.categoria import Categoria
+import app.services.kardex_service as kardex_service
+import app.services.arquivo_solicitacoes_service as arquivo_solicitacoes_service
+import app.services.codigo_material_service as codigo_material_service
+import app.services.material_consulta_service as material_consulta_service
+import app.services.estoque_service as estoque_service
+import app.services.local_estoque_service as local_estoque_service
 
 # Se você tiver Fornecedor no projeto, descomente:
 # from app.models.fornecedor import Fornecedor
@@ -65,6 +73,121 @@ def _d(v) -> Decimal:
     return Decimal(str(v))
 
 
+def _saidas(de, ate, torre="", pav="", apto="", limite=None):
+    """
+    O que saiu do estoque no período: uma linha por entrega
+    (solicitacao_item_entrega), com a data e a quantidade da própria
+    entrega. Entregas parciais entram; o solicitado e o rejeitado não.
+
+    O arquivo só é lido quando o período chega até ele.
+    `limite` conta solicitações do banco, não linhas.
+    """
+    filtros = []
+    if de:
+        filtros.append(SolicitacaoItemEntrega.data_entrega >= de)
+    if ate:
+        filtros.append(SolicitacaoItemEntrega.data_entrega <= ate)
+    if torre:
+        filtros.append(Solicitacao.local_torre == torre)
+    if pav:
+        filtros.append(Solicitacao.local_pav == pav)
+    if apto:
+        filtros.append(Solicitacao.local_apto == apto)
+
+    consulta = (
+        select(SolicitacaoItemEntrega, Solicitacao)
+        .join(Solicitacao, Solicitacao.id == SolicitacaoItemEntrega.solicitacao_id)
+        .options(joinedload(SolicitacaoItemEntrega.material))
+        .where(*filtros)
+    )
+
+    if limite:
+        ids = db.session.execute(
+            select(SolicitacaoItemEntrega.solicitacao_id)
+            .join(Solicitacao, Solicitacao.id == SolicitacaoItemEntrega.solicitacao_id)
+            .where(*filtros)
+            .group_by(SolicitacaoItemEntrega.solicitacao_id)
+            .order_by(SolicitacaoItemEntrega.solicitacao_id.desc())
+            .limit(limite)
+        ).scalars().all()
+        consulta = consulta.where(SolicitacaoItemEntrega.solicitacao_id.in_(ids))
+
+    linhas = [
+        SimpleNamespace(
+            solicitacao=s,
+            material=e.material,
+            qtd=e.qtd,
+            data_entrega=e.data_entrega,
+        )
+        for e, s in db.session.execute(
+            consulta.order_by(
+                Solicitacao.id.desc(),
+                SolicitacaoItemEntrega.data_entrega,
+                SolicitacaoItemEntrega.id,
+            )
+        ).all()
+    ]
+
+    # a última entrega da solicitação é a data do arquivo; as do
+    # período podem ser de solicitações que terminaram depois dele
+    arquivadas = [
+        SimpleNamespace(
+            solicitacao=s,
+            material=it.material,
+            qtd=e.qtd,
+            data_entrega=e.data_entrega,
+        )
+        for s in arquivo_solicitacoes_service.solicitacoes_arquivadas(
+            de, campo=arquivo_solicitacoes_service.CAMPO_ENTREGA
+        )
+        if (not torre or s.local_torre == torre)
+        and (not pav or s.local_pav == pav)
+        and (not apto or s.local_apto == apto)
+        for it in s.itens
+        for e in it.entregas
+        if (not de or e.data_entrega >= de)
+        and (not ate or e.data_entrega <= ate)
+    ]
+    arquivadas.sort(key=lambda linha: (-linha.solicitacao.id, linha.data_entrega))
+
+    return linhas + arquivadas
+
+
+def _saidas_por_solicitacao(linhas):
+    """
+    Agrupa as linhas de _saidas por solicitação, somando a quantidade
+    por material; a data é a da última entrega do período.
+    """
+    solicitacoes = {}
+
+    for linha in linhas:
+        s = linha.solicitacao
+        grupo = solicitacoes.get(s.id)
+
+        if grupo is None:
+            grupo = solicitacoes[s.id] = SimpleNamespace(
+                id=s.id,
+                local_torre=s.local_torre,
+                local_pav=s.local_pav,
+                local_apto=s.local_apto,
+                data_entrega=linha.data_entrega,
+                itens={},
+            )
+
+        grupo.data_entrega = max(grupo.data_entrega, linha.data_entrega)
+
+        chave = linha.material.nome if linha.material else None
+        if chave in grupo.itens:
+            grupo.itens[chave].qtd += _d(linha.qtd)
+        else:
+            grupo.itens[chave] = SimpleNamespace(material=linha.material, qtd=_d(linha.qtd))
+
+    for grupo in solicitacoes.values():
+        grupo.itens = list(grupo.itens.values())
+
+    return list(solicitacoes.values())
+
+
 def _wb_to_bytes(wb: Workbook) -> BytesIO:
     bio = BytesIO()
     wb.save(bio)
@@ -72,7 +195,7 @@ def _wb_to_bytes(wb: Workbook) -> BytesIO:
     return bio
 
 
-def _pdf_table(title: str, headers: list[str], rows: list[list[str]], filename: str):
+def _pdf_table(title: str, headers: list[str], rows: Iterable[list[str]], filename: str):
     bio = BytesIO()
     c = canvas.Canvas(bio, pagesize=A4)
     w, h = A4
@@ -216,7 +339,7 @@ def relatorio_estoque_pdf():
 
 
 # =========================
-# 2) CONSUMO (ENTREGUE) POR TORRE/APTO
+# 2) CONSUMO (ENTREGAS) POR TORRE/APTO
 # =========================
 @relatorios_bp.get("/consumo")
 @login_required
@@ -227,30 +350,11 @@ def relatorio_consumo():
     pav = (request.args.get("pav") or "").strip()
     apto = (request.args.get("apto") or "").strip()
 
-    filtros = [Solicitacao.status == "ENTREGUE"]
-    if data_de:
-        filtros.append(Solicitacao.data_entrega >= data_de)
-    if data_ate:
-        filtros.append(Solicitacao.data_entrega <= data_ate)
-    if torre:
-        filtros.append(Solicitacao.local_torre == torre)
-    if pav:
-        filtros.append(Solicitacao.local_pav == pav)
-    if apto:
-        filtros.append(Solicitacao.local_apto == apto)
-
-    itens = (
-        SolicitacaoItem.query
-        .join(Solicitacao, Solicitacao.id == SolicitacaoItem.solicitacao_id)
-        .options(joinedload(SolicitacaoItem.material))
-        .filter(and_(*filtros))
-        .order_by(Solicitacao.id.desc())
-        .all()
-    )
+    saidas = _saidas(data_de, data_ate, torre, pav, apto)
 
     return render_template(
         "relatorios/consumo.html",
-        itens=itens,
+        saidas=saidas,
         de=request.args.get("de", ""),
         ate=request.args.get("ate", ""),
         torre=torre,
@@ -268,38 +372,19 @@ def relatorio_consumo_xlsx():
     pav = (request.args.get("pav") or "").strip()
     apto = (request.args.get("apto") or "").strip()
 
-    filtros = [Solicitacao.status == "ENTREGUE"]
-    if data_de:
-        filtros.append(Solicitacao.data_entrega >= data_de)
-    if data_ate:
-        filtros.append(Solicitacao.data_entrega <= data_ate)
-    if torre:
-        filtros.append(Solicitacao.local_torre == torre)
-    if pav:
-        filtros.append(Solicitacao.local_pav == pav)
-    if apto:
-        filtros.append(Solicitacao.local_apto == apto)
-
-    itens = (
-        SolicitacaoItem.query
-        .join(Solicitacao, Solicitacao.id == SolicitacaoItem.solicitacao_id)
-        .options(joinedload(SolicitacaoItem.material))
-        .filter(and_(*filtros))
-        .order_by(Solicitacao.id.desc())
-        .all()
-    )
+    saidas = _saidas(data_de, data_ate, torre, pav, apto)
 
     wb = Workbook()
     ws = wb.active
     ws.title = "Consumo"
     ws.append(["Solic#", "Entrega", "Torre", "Pav", "Apto", "Material", "Qtd", "Un"])
 
-    for it in itens:
-        s = it.solicitacao  # relationship (se você não tiver, me diga)
+    for it in saidas:
+        s = it.solicitacao
         m = it.material
         ws.append([
             s.id,
-            s.data_entrega.strftime("%d/%m/%Y") if s.data_entrega else "",
+            it.data_entrega.strftime("%d/%m/%Y") if it.data_entrega else "",
             s.local_torre or "",
             s.local_pav or "",
             s.local_apto or "",
@@ -326,43 +411,24 @@ def relatorio_consumo_pdf():
     pav = (request.args.get("pav") or "").strip()
     apto = (request.args.get("apto") or "").strip()
 
-    filtros = [Solicitacao.status == "ENTREGUE"]
-    if data_de:
-        filtros.append(Solicitacao.data_entrega >= data_de)
-    if data_ate:
-        filtros.append(Solicitacao.data_entrega <= data_ate)
-    if torre:
-        filtros.append(Solicitacao.local_torre == torre)
-    if pav:
-        filtros.append(Solicitacao.local_pav == pav)
-    if apto:
-        filtros.append(Solicitacao.local_apto == apto)
-
-    itens = (
-        SolicitacaoItem.query
-        .join(Solicitacao, Solicitacao.id == SolicitacaoItem.solicitacao_id)
-        .options(joinedload(SolicitacaoItem.material))
-        .filter(and_(*filtros))
-        .order_by(Solicitacao.id.desc())
-        .all()
-    )
+    saidas = _saidas(data_de, data_ate, torre, pav, apto)
 
     headers = ["Solic#", "Entrega", "Local", "Material", "Qtd", "Un"]
     rows = []
-    for it in itens:
+    for it in saidas:
         s = it.solicitacao
         m = it.material
         local = f"{s.local_torre or ''}-{s.local_pav or ''}-{s.local_apto or ''}"
         rows.append([
             str(s.id),
-            s.data_entrega.strftime("%d/%m/%Y") if s.data_entrega else "",
+            it.data_entrega.strftime("%d/%m/%Y") if it.data_entrega else "",
             local,
             m.nome if m else "",
             str(_d(it.qtd)),
             m.unidade if m else "",
         ])
 
-    return _pdf_table("Relatório de Consumo (ENTREGUE)", headers, rows, "relatorio_consumo.pdf")
+    return _pdf_table("Relatório de Consumo (entregas)", headers, rows, "relatorio_consumo.pdf")
 
 
 # =========================
@@ -469,7 +535,7 @@ def relatorio_entradas_fornecedor_pdf():
 
 
 # =========================
-# 4) SAÍDAS POR PERÍODO (ENTREGUE)
+# 4) SAÍDAS POR PERÍODO (ENTREGAS)
 # =========================
 @relatorios_bp.get("/saidas")
 @login_required
@@ -477,20 +543,7 @@ def relatorio_saidas_periodo():
     de = _parse_date(request.args.get("de"))
     ate = _parse_date(request.args.get("ate"))
 
-    filtros = [Solicitacao.status == "ENTREGUE"]
-    if de:
-        filtros.append(Solicitacao.data_entrega >= de)
-    if ate:
-        filtros.append(Solicitacao.data_entrega <= ate)
-
-    solicitacoes = (
-        Solicitacao.query
-        .options(joinedload(Solicitacao.itens).joinedload(SolicitacaoItem.material))
-        .filter(and_(*filtros))
-        .order_by(Solicitacao.id.desc())
-        .limit(300)
-        .all()
-    )
+    solicitacoes = _saidas_por_solicitacao(_saidas(de, ate, limite=300))[:300]
 
     return render_template(
         "relatorios/saidas.html",
@@ -506,38 +559,26 @@ def relatorio_saidas_periodo_xlsx():
     de = _parse_date(request.args.get("de"))
     ate = _parse_date(request.args.get("ate"))
 
-    filtros = [Solicitacao.status == "ENTREGUE"]
-    if de:
-        filtros.append(Solicitacao.data_entrega >= de)
-    if ate:
-        filtros.append(Solicitacao.data_entrega <= ate)
-
-    solicitacoes = (
-        Solicitacao.query
-        .options(joinedload(Solicitacao.itens).joinedload(SolicitacaoItem.material))
-        .filter(and_(*filtros))
-        .order_by(Solicitacao.id.desc())
-        .all()
-    )
+    saidas = _saidas(de, ate)
 
     wb = Workbook()
     ws = wb.active
     ws.title = "Saídas"
     ws.append(["Solic#", "Entrega", "Torre", "Pav", "Apto", "Material", "Qtd", "Un"])
 
-    for s in solicitacoes:
-        for it in s.itens:
-            m = it.material
-            ws.append([
-                s.id,
-                s.data_entrega.strftime("%d/%m/%Y") if s.data_entrega else "",
-                s.local_torre or "",
-                s.local_pav or "",
-                s.local_apto or "",
-                m.nome if m else "",
-                float(_d(it.qtd)),
-                m.unidade if m else "",
-            ])
+    for it in saidas:
+        s = it.solicitacao
+        m = it.material
+        ws.append([
+            s.id,
+            it.data_entrega.strftime("%d/%m/%Y") if it.data_entrega else "",
+            s.local_torre or "",
+            s.local_pav or "",
+            s.local_apto or "",
+            m.nome if m else "",
+            float(_d(it.qtd)),
+            m.unidade if m else "",
+        ])
 
     bio = _wb_to_bytes(wb)
     return send_file(
@@ -554,36 +595,135 @@ def relatorio_saidas_periodo_pdf():
     de = _parse_date(request.args.get("de"))
     ate = _parse_date(request.args.get("ate"))
 
-    filtros = [Solicitacao.status == "ENTREGUE"]
-    if de:
-        filtros.append(Solicitacao.data_entrega >= de)
-    if ate:
-        filtros.append(Solicitacao.data_entrega <= ate)
-
-    solicitacoes = (
-        Solicitacao.query
-        .options(joinedload(Solicitacao.itens).joinedload(SolicitacaoItem.material))
-        .filter(and_(*filtros))
-        .order_by(Solicitacao.id.desc())
-        .all()
-    )
+    saidas = _saidas(de, ate)
 
     headers = ["Solic#", "Entrega", "Local", "Material", "Qtd", "Un"]
     rows = []
-    for s in solicitacoes:
+    for it in saidas:
+        s = it.solicitacao
+        m = it.material
         local = f"{s.local_torre or ''}-{s.local_pav or ''}-{s.local_apto or ''}"
-        for it in s.itens:
-            m = it.material
-            rows.append([
-                str(s.id),
-                s.data_entrega.strftime("%d/%m/%Y") if s.data_entrega else "",
-                local,
-                m.nome if m else "",
-                str(_d(it.qtd)),
-                m.unidade if m else "",
-            ])
-
-    return _pdf_table("Relatório de Saídas (ENTREGUE) por Período", headers, rows, "relatorio_saidas.pdf")
+        rows.append([
+            str(s.id),
+            it.data_entrega.strftime("%d/%m/%Y") if it.data_entrega else "",
+            local,
+            m.nome if m else "",
+            str(_d(it.qtd)),
+            m.unidade if m else "",
+        ])
+
+    return _pdf_table("Relatório de Saídas (entregas) por Período", headers, rows, "relatorio_saidas.pdf")
+
+# =========================
+# 5) KARDEX POR MATERIAL
+# =========================
+def _kardex_params():
+    material = kardex_service.obter_material(request.args.get("material_id"))
+    data_de = _parse_date(request.args.get("de"))
+    data_ate = _parse_date(request.args.get("ate"))
+    return material, data_de, data_ate
+
+
+def _kardex_valor(v):
+    return "" if v is None else str(v)
+
+
+@relatorios_bp.get("/kardex")
+@login_required
+def relatorio_kardex():
+    try:
+        material, data_de, data_ate = _kardex_params()
+    except ValueError as erro:
+        flash(str(erro), "warning")
+        material, data_de, data_ate = None, None, None
+
+    movimentos = []
+    if material:
+        movimentos = kardex_service.iterar_kardex(material, data_de, data_ate)
+
+    # stream_template: as linhas vão para o navegador conforme saem do cursor
+    return stream_template(
+        "relatorios/kardex.html",
+        material=material,
+        movimentos=movimentos,
+        de=request.args.get("de", ""),
+        ate=request.args.get("ate", ""),
+    )
+
+
+@relatorios_bp.get("/kardex.xlsx")
+@login_required
+def relatorio_kardex_xlsx():
+    try:
+        material, data_de, data_ate = _kardex_params()
+    except ValueError as erro:
+        flash(str(erro), "warning")
+        return redirect(url_for("relatorios.relatorio_kardex"))
+
+    if not material:
+        flash("Selecione um material.", "warning")
+        return redirect(url_for("relatorios.relatorio_kardex"))
+
+    # write_only: o openpyxl grava cada linha sem manter as células em memória
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Kardex")
+    ws.append([f"{material.codigo or ''} - {material.nome}", "", "", "", "", "", material.unidade])
+    ws.append(["Data", "Tipo", "Documento", "NF", "Origem/Local", "Entrada", "Saída", "Saldo"])
+
+    for mov in kardex_service.iterar_kardex(material, data_de, data_ate):
+        ws.append([
+            mov["data"].strftime("%d/%m/%Y %H:%M") if mov["data"] else "",
+            mov["tipo"],
+            mov["documento_id"],
+            mov["referencia"] or "",
+            mov["origem"],
+            float(mov["entrada"]) if mov["entrada"] is not None else None,
+            float(mov["saida"]) if mov["saida"] is not None else None,
+            float(mov["saldo"]),
+        ])
+
+    bio = _wb_to_bytes(wb)
+    return send_file(
+        bio,
+        as_attachment=True,
+        download_name=f"kardex_{material.codigo or material.id}.xlsx",
+        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
+
+@relatorios_bp.get("/kardex.pdf")
+@login_required
+def relatorio_kardex_pdf():
+    try:
+        material, data_de, data_ate = _kardex_params()
+    except ValueError as erro:
+        flash(str(erro), "warning")
+        return redirect(url_for("relatorios.relatorio_kardex"))
+
+    if not material:
+        flash("Selecione um material.", "warning")
+        return redirect(url_for("relatorios.relatorio_kardex"))
+
+    headers = ["Data", "Tipo", "Doc", "Origem/Local", "Entrada", "Saída", "Saldo"]
+    rows = (
+        [
+            mov["data"].strftime("%d/%m/%Y") if mov["data"] else "",
+            mov["tipo"],
+            f"NF {mov['referencia']}" if mov["referencia"] else f"#{mov['documento_id']}",
+            mov["origem"],
+            _kardex_valor(mov["entrada"]),
+            _kardex_valor(mov["saida"]),
+            str(mov["saldo"]),
+        ]
+        for mov in kardex_service.iterar_kardex(material, data_de, data_ate)
+    )
+
+    return _pdf_table(
+        f"Kardex – {material.codigo or ''} {material.nome} ({material.unidade})",
+        headers,
+        rows,
+        f"kardex_{material.codigo or material.id}.pdf",
+    )
 
 # =========================
 # LISTAR MATERIAIS
@@ -592,31 +732,31 @@ def relatorio_saidas_periodo_pdf():
 @login_required
 def materiais():
 
-    busca = request.args.get("busca", "")
-    categoria_id = int(request.form.get("categoria_id") or 0)
-
-    query = Material.query.filter_by(ativo=True)
+    busca = (request.args.get("busca") or "").strip()
+    categoria_id = request.args.get("categoria_id", 0, type=int)
+    ordem = request.args.get("ordem", "nome")
+    direcao = "desc" if request.args.get("direcao") == "desc" else "asc"
 
-    if busca:
-        query = query.filter(
-            or_(
-                Material.nome.ilike(f"%{busca}%"),
-                Material.codigo.ilike(f"%{busca}%")
-            )
-        )
+    pagina = material_consulta_service.listar_materiais(
+        busca=busca,
+        categoria_id=categoria_id,
+        ordem=ordem,
+        direcao=direcao,
+        pagina=request.args.get("page", 1, type=int),
+        por_pagina=request.args.get("por_pagina", type=int),
+    )
 
-    if categoria_id:
-        query = query.filter(Material.categoria_id == categoria_id)
-
-    materiais = query.order_by(Material.nome).all()
-    categorias = Categoria.query.order_by(Categoria.nome).all()
+    facetas = material_consulta_service.contar_por_categoria(busca)
 
     return render_template(
         "estoque/materiais.html",
-        materiais=materiais,
-        categorias=categorias,
+        materiais=pagina.items,
+        pagina=pagina,
+        facetas=facetas,
         busca=busca,
-        categoria_id=categoria_id
+        categoria_id=categoria_id,
+        ordem=ordem,
+        direcao=direcao
     )
 
 
@@ -644,24 +784,24 @@ def material_novo():
             flash("Informe a descrição do material", "danger")
             return redirect(url_for("estoque.material_novo"))
 
-        # 🔥 GERAR CÓDIGO AUTOMÁTICO (100% seguro)
-        if not codigo or codigo.strip() == "":
+        codigo = (codigo or "").strip()
 
-            ultimo = Material.query.order_by(Material.id.desc()).first()
+        # 🔥 GERAR CÓDIGO AUTOMÁTICO (alocador único entre workers)
+        if not codigo:
+            codigo = codigo_material_service.alocar_codigo()
 
-            if ultimo and ultimo.codigo and ultimo.codigo.isdigit():
-                codigo = str(int(ultimo.codigo) + 1)
-            else:
-                codigo = "1"
+        else:
+            # 🔥 GARANTIR FORMATO
+            if codigo.isdigit():
+                codigo = codigo_material_service.formatar_codigo(codigo)
 
-        # 🔥 GARANTIR FORMATO
-        codigo = f"{int(codigo):04d}"
+            # 🚨 EVITAR DUPLICADO (só para código digitado)
+            existe = Material.query.filter_by(codigo=codigo).first()
+            if existe:
+                flash(f"Código {codigo} já existe!", "danger")
+                return redirect(url_for("estoque.material_novo"))
 
-        # 🚨 EVITAR DUPLICADO
-        existe = Material.query.filter_by(codigo=codigo).first()
-        if existe:
-            flash(f"Código {codigo} já existe!", "danger")
-            return redirect(url_for("estoque.material_novo"))
+            codigo_material_service.registrar_codigo_manual(codigo)
 
         material = Material(
             codigo=codigo,
@@ -674,6 +814,10 @@ def material_novo():
         )
 
         db.session.add(material)
+        db.session.flush()
+
+        # o saldo inicial fica no almoxarifado central
+        estoque_service.conciliar_locais([material.id])
         db.session.commit()
 
         flash(f"Material {nome} cadastrado!", "success")
@@ -705,6 +849,16 @@ def material_editar(id):
         material.categoria_id = request.form.get("categoria_id")
         material.estoque_minimo = request.form.get("estoque_minimo") or 0
         material.saldo_atual = request.form.get("saldo_atual") or 0
+        db.session.flush()
+
+        # a diferença do saldo digitado vai para o almoxarifado central
+        try:
+            estoque_service.conciliar_locais([material.id])
+
+        except ValueError as erro:
+            db.session.rollback()
+            flash(str(erro), "danger")
+            return redirect(url_for("estoque.material_editar", id=id))
 
         db.session.commit()
 
@@ -714,7 +868,8 @@ def material_editar(id):
     return render_template(
         "estoque/material_form.html",
         material=material,
-        categorias=categorias
+        categorias=categorias,
+        saldos_locais=local_estoque_service.saldos_por_local(material.id),
     )
 
 
@@ -0,0 +1,56 @@
+"""
+Criação de índices sem bloquear escritas, para usar em
+executar_sem_transacao() das atualizações.
+"""
+from sqlalchemy import text
+
+
+def _indice_invalido(conexao, nome):
+    return conexao.execute(
+        text(
+            """
+            SELECT 1
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :nome
+              AND NOT i.indisvalid
+            """
+        ),
+        {"nome": nome},
+    ).scalar() is not None
+
+
+def criar_indice(conexao, nome, definicao, unico=False):
+    """
+    Cria o índice se ainda não existir. No PostgreSQL usa CREATE INDEX
+    CONCURRENTLY, que não trava inserções e atualizações na tabela; a
+    conexão precisa estar em autocommit.
+
+    Um CONCURRENTLY interrompido deixa para trás um índice inválido,
+    que o IF NOT EXISTS consideraria pronto: ele é removido antes.
+    """
+    tipo = "UNIQUE INDEX" if unico else "INDEX"
+
+    if conexao.dialect.name != "postgresql":
+        conexao.execute(
+            text(f"CREATE {tipo} IF NOT EXISTS {nome} ON {definicao}")
+        )
+        return
+
+    if _indice_invalido(conexao, nome):
+        conexao.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {nome}"))
+
+    conexao.execute(
+        text(
+            f"CREATE {tipo} CONCURRENTLY IF NOT EXISTS {nome} "
+            f"ON {definicao}"
+        )
+    )
+
+
+def remover_indice(conexao, nome):
+    if conexao.dialect.name != "postgresql":
+        conexao.execute(text(f"DROP INDEX IF EXISTS {nome}"))
+        return
+
+    conexao.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {nome}"))
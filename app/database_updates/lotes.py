@@ -0,0 +1,221 @@
+"""
+Correções de dados em tabelas grandes, em lotes pela chave primária.
+
+Um UPDATE único em solicitacao_item trava as linhas da tabela inteira
+até o fim. preencher_em_lotes() percorre a tabela em faixas de id, com
+um commit por lote e uma pausa entre eles, e grava até onde chegou em
+database_update_lote: se for interrompido, a próxima execução continua
+do último lote confirmado.
+
+Uso, numa atualização:
+
+    def executar_sem_transacao(conexao, inspector):
+        preencher_em_lotes(
+            conexao,
+            CODIGO,
+            "solicitacao_item",
+            '''
+            UPDATE solicitacao_item
+            SET ...
+            WHERE id > :inicio AND id <= :fim
+            ''',
+        )
+
+O SQL recebe :inicio (exclusivo) e :fim (inclusivo) e precisa poder
+rodar de novo sobre o mesmo lote sem estragar nada.
+"""
+import time
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import text
+
+
+TABELA_PROGRESSO = "database_update_lote"
+
+# intervalo mínimo entre duas linhas de progresso no terminal
+INTERVALO_RELATORIO_SEGUNDOS = 5
+
+
+def criar_tabela_progresso(conexao):
+    conexao.execute(
+        text(
+            f"""
+            CREATE TABLE IF NOT EXISTS {TABELA_PROGRESSO} (
+                nome VARCHAR(100) PRIMARY KEY,
+                ultimo_id BIGINT NOT NULL,
+                linhas_afetadas BIGINT NOT NULL DEFAULT 0,
+                concluido BOOLEAN NOT NULL DEFAULT FALSE,
+                atualizado_em TIMESTAMP NOT NULL
+            )
+            """
+        )
+    )
+
+
+def _ler_progresso(conexao, nome):
+    return conexao.execute(
+        text(
+            f"""
+            SELECT ultimo_id, linhas_afetadas, concluido
+            FROM {TABELA_PROGRESSO}
+            WHERE nome = :nome
+            """
+        ),
+        {"nome": nome},
+    ).first()
+
+
+def _gravar_progresso(conexao, nome, ultimo_id, linhas_afetadas, concluido):
+    conexao.execute(
+        text(
+            f"""
+            INSERT INTO {TABELA_PROGRESSO}
+                (nome, ultimo_id, linhas_afetadas, concluido, atualizado_em)
+            VALUES
+                (:nome, :ultimo_id, :linhas_afetadas, :concluido,
+                 :atualizado_em)
+            ON CONFLICT (nome)
+            DO UPDATE SET
+                ultimo_id = EXCLUDED.ultimo_id,
+                linhas_afetadas = EXCLUDED.linhas_afetadas,
+                concluido = EXCLUDED.concluido,
+                atualizado_em = EXCLUDED.atualizado_em
+            """
+        ),
+        {
+            "nome": nome,
+            "ultimo_id": ultimo_id,
+            "linhas_afetadas": linhas_afetadas,
+            "concluido": concluido,
+            "atualizado_em": datetime.now(timezone.utc),
+        },
+    )
+
+
+def _fim_do_lote(conexao, tabela, coluna_id, inicio, tamanho_lote):
+    # o id da última linha do lote, e não inicio + tamanho: com buracos
+    # na sequência os lotes continuam com o tamanho pedido
+    return conexao.execute(
+        text(
+            f"""
+            SELECT {coluna_id}
+            FROM {tabela}
+            WHERE {coluna_id} > :inicio
+            ORDER BY {coluna_id}
+            LIMIT 1 OFFSET :deslocamento
+            """
+        ),
+        {"inicio": inicio, "deslocamento": tamanho_lote - 1},
+    ).scalar()
+
+
+def preencher_em_lotes(
+    conexao,
+    nome,
+    tabela,
+    sql_lote,
+    tamanho_lote=None,
+    pausa_segundos=None,
+    coluna_id="id",
+    parametros=None,
+):
+    """
+    Executa sql_lote para cada faixa de ids de tabela, do ponto em que
+    parou até o maior id existente no início da execução (linhas novas
+    já são gravadas certas pela aplicação).
+
+    conexao é a de executar_sem_transacao(); cada lote abre a própria
+    transação, junto com o registro do progresso. Devolve o total de
+    linhas afetadas, somando execuções anteriores interrompidas.
+    """
+    if tamanho_lote is None:
+        tamanho_lote = current_app.config["ATUALIZACAO_LOTE_TAMANHO"]
+
+    if pausa_segundos is None:
+        pausa_segundos = current_app.config["ATUALIZACAO_LOTE_PAUSA_SEGUNDOS"]
+
+    engine = conexao.engine
+
+    criar_tabela_progresso(conexao)
+
+    progresso = _ler_progresso(conexao, nome)
+
+    if progresso and progresso.concluido:
+        print(f"    {nome}: preenchimento já concluído.")
+        return progresso.linhas_afetadas
+
+    maior_id = conexao.execute(
+        text(f"SELECT MAX({coluna_id}) FROM {tabela}")
+    ).scalar()
+
+    if progresso:
+        inicio, total_linhas = progresso.ultimo_id, progresso.linhas_afetadas
+
+        print(f"    {nome}: retomando após o id {inicio}.")
+    else:
+        inicio, total_linhas = 0, 0
+
+    lotes = 0
+    linhas_execucao = 0
+    comeco = time.perf_counter()
+    ultimo_relatorio = comeco
+
+    while maior_id is not None and inicio < maior_id:
+        fim = _fim_do_lote(conexao, tabela, coluna_id, inicio, tamanho_lote)
+
+        if fim is None or fim > maior_id:
+            fim = maior_id
+
+        with engine.begin() as transacao:
+            resultado = transacao.execute(
+                text(sql_lote),
+                {**(parametros or {}), "inicio": inicio, "fim": fim},
+            )
+
+            linhas = max(resultado.rowcount or 0, 0)
+
+            _gravar_progresso(
+                transacao,
+                nome,
+                fim,
+                total_linhas + linhas,
+                concluido=False,
+            )
+
+        inicio = fim
+        lotes += 1
+        linhas_execucao += linhas
+        total_linhas += linhas
+
+        agora = time.perf_counter()
+
+        if agora - ultimo_relatorio >= INTERVALO_RELATORIO_SEGUNDOS:
+            ultimo_relatorio = agora
+
+            print(
+                f"    {nome}: id {fim}/{maior_id}, "
+                f"{linhas_execucao / (agora - comeco):.0f} linhas/s"
+            )
+
+        if pausa_segundos:
+            time.sleep(pausa_segundos)
+
+    with engine.begin() as transacao:
+        _gravar_progresso(
+            transacao,
+            nome,
+            inicio,
+            total_linhas,
+            concluido=True,
+        )
+
+    duracao = time.perf_counter() - comeco
+
+    print(
+        f"    {nome}: {linhas_execucao} linha(s) em {lotes} lote(s), "
+        f"{duracao:.1f} s"
+        + (f", {linhas_execucao / duracao:.0f} linhas/s" if duracao else "")
+    )
+
+    return total_linhas
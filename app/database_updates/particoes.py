@@ -0,0 +1,214 @@
+"""
+Partições mensais de solicitacao_historico (PostgreSQL).
+
+A tabela é particionada por data_evento (atualização 013). Cada mês tem
+a sua partição, com os próprios índices: o custo de índice e de vacuum
+fica limitado ao tamanho de um mês, e descartar um mês antigo é um
+DETACH/DROP, sem DELETE.
+
+- solicitacao_historico_pAAAAMM: um mês.
+- solicitacao_historico_legado: a tabela antiga, com tudo o que havia
+  antes da conversão.
+- solicitacao_historico_padrao: recebe o que cair fora das partições
+  existentes, para um insert nunca falhar. Deve ficar vazia; se tiver
+  linhas, criar_particao() as move para a partição do mês.
+
+As partições futuras e a remoção das antigas ficam por conta de
+scripts.manter_particoes_historico, agendado.
+"""
+import re
+from datetime import datetime
+
+from sqlalchemy import text
+
+
+TABELA = "solicitacao_historico"
+
+PARTICAO_PADRAO = f"{TABELA}_padrao"
+PARTICAO_LEGADO = f"{TABELA}_legado"
+
+_LIMITE_SUPERIOR = re.compile(r"TO \('([^']+)'\)")
+
+
+def inicio_do_mes(data):
+    return datetime(data.year, data.month, 1)
+
+
+def mes_seguinte(data, meses=1):
+    indice = data.year * 12 + data.month - 1 + meses
+
+    return datetime(indice // 12, indice % 12 + 1, 1)
+
+
+def nome_particao(mes):
+    return f"{TABELA}_p{mes:%Y%m}"
+
+
+def tabela_particionada(conexao):
+    return conexao.execute(
+        text(
+            """
+            SELECT 1
+            FROM pg_partitioned_table p
+            JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = :tabela
+              AND c.relnamespace = current_schema()::regnamespace
+            """
+        ),
+        {"tabela": TABELA},
+    ).scalar() is not None
+
+
+def listar_particoes(conexao):
+    """
+    [(nome, limite superior)] em ordem de data. O limite é exclusivo;
+    None para a partição padrão.
+    """
+    linhas = conexao.execute(
+        text(
+            """
+            SELECT filha.relname, pg_get_expr(filha.relpartbound, filha.oid)
+            FROM pg_inherits h
+            JOIN pg_class pai ON pai.oid = h.inhparent
+            JOIN pg_class filha ON filha.oid = h.inhrelid
+            WHERE pai.relname = :tabela
+              AND pai.relnamespace = current_schema()::regnamespace
+            """
+        ),
+        {"tabela": TABELA},
+    ).all()
+
+    particoes = []
+
+    for nome, limites in linhas:
+        encontrado = _LIMITE_SUPERIOR.search(limites)
+
+        particoes.append((
+            nome,
+            datetime.fromisoformat(encontrado.group(1)) if encontrado else None,
+        ))
+
+    return sorted(particoes, key=lambda p: (p[1] is None, p[1] or datetime.min))
+
+
+def _existe(conexao, nome):
+    return conexao.execute(
+        text("SELECT to_regclass(:nome)"),
+        {"nome": nome},
+    ).scalar() is not None
+
+
+def criar_particao(conexao, mes):
+    """
+    Cria a partição do mês, se ainda não existir. Roda numa transação:
+    ao criar a partição, o PostgreSQL confere a partição padrão com
+    ACCESS EXCLUSIVE, o que é imediato enquanto ela estiver vazia.
+    """
+    inicio = inicio_do_mes(mes)
+    fim = mes_seguinte(inicio)
+    nome = nome_particao(inicio)
+
+    if _existe(conexao, nome):
+        return False
+
+    limites = {"inicio": inicio, "fim": fim}
+
+    perdidas = conexao.execute(
+        text(
+            f"""
+            SELECT COUNT(*)
+            FROM {PARTICAO_PADRAO}
+            WHERE data_evento >= :inicio AND data_evento < :fim
+            """
+        ),
+        limites,
+    ).scalar()
+
+    if not perdidas:
+        conexao.execute(
+            text(
+                f"""
+                CREATE TABLE {nome}
+                PARTITION OF {TABELA} (PRIMARY KEY (id))
+                FOR VALUES FROM ('{inicio:%Y-%m-%d}') TO ('{fim:%Y-%m-%d}')
+                """
+            )
+        )
+        return True
+
+    # o mês recebeu eventos antes de ter partição: tira da padrão e
+    # anexa como partição nova
+    conexao.execute(
+        text(
+            f"""
+            CREATE TABLE {nome}
+            (LIKE {TABELA} INCLUDING DEFAULTS, PRIMARY KEY (id))
+            """
+        )
+    )
+
+    conexao.execute(
+        text(
+            f"""
+            WITH movidas AS (
+                DELETE FROM {PARTICAO_PADRAO}
+                WHERE data_evento >= :inicio AND data_evento < :fim
+                RETURNING *
+            )
+            INSERT INTO {nome} SELECT * FROM movidas
+            """
+        ),
+        limites,
+    )
+
+    conexao.execute(
+        text(
+            f"""
+            ALTER TABLE {TABELA} ATTACH PARTITION {nome}
+            FOR VALUES FROM ('{inicio:%Y-%m-%d}') TO ('{fim:%Y-%m-%d}')
+            """
+        )
+    )
+
+    print(f"    {perdidas} evento(s) movido(s) da partição padrão para {nome}.")
+
+    return True
+
+
+def criar_particoes(conexao, de, ate):
+    """Cria as partições dos meses de `de` até `ate`, inclusive."""
+    criadas = []
+    mes = inicio_do_mes(de)
+
+    while mes <= ate:
+        if criar_particao(conexao, mes):
+            criadas.append(nome_particao(mes))
+
+        mes = mes_seguinte(mes)
+
+    return criadas
+
+
+def remover_particoes_antigas(conexao, antes_de, arquivar=False):
+    """
+    Desanexa as partições cujos eventos são todos anteriores a
+    `antes_de`. Com arquivar=True a tabela desanexada fica no banco
+    (para um pg_dump -t e DROP depois); sem, é apagada. Só mexe em
+    metadados: nenhuma linha é lida nem apagada uma a uma.
+    """
+    removidas = []
+
+    for nome, fim in listar_particoes(conexao):
+        if fim is None or fim > antes_de:
+            continue
+
+        conexao.execute(
+            text(f"ALTER TABLE {TABELA} DETACH PARTITION {nome}")
+        )
+
+        if not arquivar:
+            conexao.execute(text(f"DROP TABLE {nome}"))
+
+        removidas.append(nome)
+
+    return removidas
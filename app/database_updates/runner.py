@@ -1,8 +1,11 @@
 import importlib
 import pkgutil
+import time
+from contextlib import contextmanager
 from datetime import datetime, timezone
 
-from sqlalchemy import inspect, text
+from flask import current_app
+from sqlalchemy import event, inspect, text
 
 from app.extensions import db
 from app.database_updates import updates
@@ -10,6 +13,15 @@ from app.database_updates import updates
 
 TABELA_CONTROLE = "database_update_history"
 
+# Chave do pg_advisory_lock que impede duas execuções ao mesmo tempo
+# (dois workers subindo, deploy repetido). Qualquer número fixo serve,
+# desde que nenhum outro código use o mesmo.
+CHAVE_TRAVA = 7_310_042
+
+TAMANHO_SQL_RESUMO = 90
+
+DML = ("INSERT", "UPDATE", "DELETE", "MERGE")
+
 
 def criar_tabela_controle():
     """
@@ -24,12 +36,36 @@ def criar_tabela_controle():
                 codigo VARCHAR(100) NOT NULL UNIQUE,
                 descricao VARCHAR(255),
                 executado_em TIMESTAMP NOT NULL,
-                sucesso BOOLEAN NOT NULL DEFAULT TRUE
+                sucesso BOOLEAN NOT NULL DEFAULT TRUE,
+                duracao_ms NUMERIC(12, 1),
+                linhas_afetadas BIGINT,
+                transacao_concluida BOOLEAN NOT NULL DEFAULT FALSE
             )
             """
         )
     )
 
+    # bancos criados antes das colunas de duração, linhas e etapa
+    colunas = {
+        coluna["name"]
+        for coluna in inspect(db.session.connection()).get_columns(
+            TABELA_CONTROLE
+        )
+    }
+
+    for nome, tipo in [
+        ("duracao_ms", "NUMERIC(12, 1)"),
+        ("linhas_afetadas", "BIGINT"),
+        ("transacao_concluida", "BOOLEAN NOT NULL DEFAULT FALSE"),
+    ]:
+        if nome not in colunas:
+            db.session.execute(
+                text(
+                    f"ALTER TABLE {TABELA_CONTROLE} "
+                    f"ADD COLUMN {nome} {tipo}"
+                )
+            )
+
     db.session.commit()
 
 
@@ -50,25 +86,67 @@ def atualizacao_ja_executada(codigo):
     return resultado is not None
 
 
-def registrar_atualizacao(codigo, descricao):
+def transacao_ja_concluida(codigo):
+    """
+    executar() já foi gravado, mas executar_sem_transacao() ainda não
+    terminou: na próxima vez só a segunda etapa roda.
+    """
+    resultado = db.session.execute(
+        text(
+            f"""
+            SELECT 1
+            FROM {TABELA_CONTROLE}
+            WHERE codigo = :codigo
+              AND transacao_concluida = TRUE
+            LIMIT 1
+            """
+        ),
+        {"codigo": codigo},
+    ).scalar()
+
+    return resultado is not None
+
+
+def registrar_atualizacao(
+    codigo,
+    descricao,
+    sucesso=True,
+    duracao_ms=None,
+    linhas_afetadas=None,
+    transacao_concluida=False,
+):
     db.session.execute(
         text(
             f"""
             INSERT INTO {TABELA_CONTROLE}
-                (codigo, descricao, executado_em, sucesso)
+                (codigo, descricao, executado_em, sucesso,
+                 duracao_ms, linhas_afetadas, transacao_concluida)
             VALUES
-                (:codigo, :descricao, :executado_em, TRUE)
+                (:codigo, :descricao, :executado_em, :sucesso,
+                 :duracao_ms, :linhas_afetadas, :transacao_concluida)
             ON CONFLICT (codigo)
             DO UPDATE SET
                 descricao = EXCLUDED.descricao,
                 executado_em = EXCLUDED.executado_em,
-                sucesso = TRUE
+                sucesso = EXCLUDED.sucesso,
+                duracao_ms = EXCLUDED.duracao_ms,
+                linhas_afetadas = EXCLUDED.linhas_afetadas,
+                transacao_concluida = (
+                    {TABELA_CONTROLE}.transacao_concluida
+                    OR EXCLUDED.transacao_concluida
+                )
             """
         ),
         {
             "codigo": codigo,
             "descricao": descricao,
             "executado_em": datetime.now(timezone.utc),
+            "sucesso": sucesso,
+            "duracao_ms": (
+                round(duracao_ms, 1) if duracao_ms is not None else None
+            ),
+            "linhas_afetadas": linhas_afetadas,
+            "transacao_concluida": transacao_concluida,
         },
     )
 
@@ -77,6 +155,18 @@ def carregar_atualizacoes():
     """
     Carrega automaticamente os arquivos existentes em:
     app/database_updates/updates/
+
+    Cada arquivo define CODIGO, DESCRICAO e ao menos uma destas:
+
+    executar(session, inspector)
+        Roda dentro de uma transação, desfeita por inteiro se falhar.
+        O registro na tabela de controle vai na mesma transação.
+
+    executar_sem_transacao(conexao, inspector)
+        Roda depois de executar(), numa conexão em autocommit. Para
+        comandos que não podem rodar em transação, como CREATE INDEX
+        CONCURRENTLY (ver database_updates.indices). Precisa ser
+        idempotente: se falhar no meio, roda de novo na próxima vez.
     """
     modulos = []
 
@@ -100,9 +190,13 @@ def carregar_atualizacoes():
                 f"A atualização {nome} não possui DESCRICAO."
             )
 
-        if not hasattr(modulo, "executar"):
+        if not (
+            hasattr(modulo, "executar")
+            or hasattr(modulo, "executar_sem_transacao")
+        ):
             raise RuntimeError(
-                f"A atualização {nome} não possui executar()."
+                f"A atualização {nome} não possui executar() "
+                f"nem executar_sem_transacao()."
             )
 
         modulos.append(modulo)
@@ -113,7 +207,201 @@ def carregar_atualizacoes():
     )
 
 
+@contextmanager
+def trava_atualizacoes():
+    """
+    Trava de sessão do PostgreSQL, numa conexão própria em autocommit:
+    não deixa transação aberta, o que faria o CREATE INDEX CONCURRENTLY
+    esperar por ela. Quem chega depois espera a trava e, ao entrar,
+    encontra as atualizações já registradas.
+    """
+    if db.engine.dialect.name != "postgresql":
+        yield
+        return
+
+    with db.engine.connect().execution_options(
+        isolation_level="AUTOCOMMIT"
+    ) as conexao:
+        obtida = conexao.execute(
+            text("SELECT pg_try_advisory_lock(:chave)"),
+            {"chave": CHAVE_TRAVA},
+        ).scalar()
+
+        if not obtida:
+            print(
+                "Outra execução das atualizações está em andamento; "
+                "aguardando..."
+            )
+
+            conexao.execute(
+                text("SELECT pg_advisory_lock(:chave)"),
+                {"chave": CHAVE_TRAVA},
+            )
+
+        try:
+            yield
+        finally:
+            conexao.execute(
+                text("SELECT pg_advisory_unlock(:chave)"),
+                {"chave": CHAVE_TRAVA},
+            )
+
+
+class Medicao:
+    """
+    Tempo e linhas afetadas de cada comando enviado ao banco enquanto
+    uma atualização roda. Comandos iguais (um backfill em lotes, por
+    exemplo) são somados numa linha só. Só INSERT, UPDATE e DELETE
+    contam linhas; os comandos na tabela de controle ficam de fora.
+    """
+
+    def __init__(self):
+        self.passos = {}
+        self.linhas_afetadas = 0
+
+    def _antes(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("atualizacao_inicio", []).append(
+            time.perf_counter()
+        )
+
+    def _depois(self, conn, cursor, statement, parameters, context, executemany):
+        inicio = conn.info["atualizacao_inicio"].pop()
+        duracao_ms = (time.perf_counter() - inicio) * 1000
+
+        if TABELA_CONTROLE in statement:
+            return
+
+        # no SELECT o rowcount é o número de linhas lidas (ou -1)
+        if self._altera_linhas(statement, context):
+            linhas = max(cursor.rowcount or 0, 0)
+        else:
+            linhas = 0
+
+        resumo = " ".join(statement.split())[:TAMANHO_SQL_RESUMO]
+
+        vezes, total_ms, total_linhas = self.passos.get(resumo, (0, 0.0, 0))
+
+        self.passos[resumo] = (
+            vezes + 1,
+            total_ms + duracao_ms,
+            total_linhas + linhas,
+        )
+
+        self.linhas_afetadas += linhas
+
+    @staticmethod
+    def _altera_linhas(statement, context):
+        if context is not None and (
+            context.isinsert or context.isupdate or context.isdelete
+        ):
+            return True
+
+        # text(): o contexto não sabe o tipo do comando
+        palavras = statement.split(None, 1)
+
+        return bool(palavras) and palavras[0].upper() in DML
+
+    @contextmanager
+    def ativa(self, engine):
+        event.listen(engine, "before_cursor_execute", self._antes)
+        event.listen(engine, "after_cursor_execute", self._depois)
+
+        try:
+            yield self
+        finally:
+            event.remove(engine, "before_cursor_execute", self._antes)
+            event.remove(engine, "after_cursor_execute", self._depois)
+
+    def imprimir(self):
+        for resumo, (vezes, total_ms, linhas) in self.passos.items():
+            repeticoes = f" x{vezes}" if vezes > 1 else ""
+
+            print(
+                f"    {total_ms:10.1f} ms {linhas:>10} linhas"
+                f"{repeticoes:>6}  {resumo}"
+            )
+
+
+def _limitar_espera_por_travas(conexao):
+    # Um ALTER TABLE que fica na fila atrás de uma transação longa
+    # bloqueia todas as consultas que chegam depois dele. Melhor
+    # desistir e tentar de novo fora do horário de pico. Vale só para
+    # a transação da atualização (SET LOCAL).
+    limite = current_app.config["ATUALIZACAO_LOCK_TIMEOUT"]
+
+    if limite and conexao.dialect.name == "postgresql":
+        conexao.execute(
+            text("SELECT set_config('lock_timeout', :limite, true)"),
+            {"limite": limite},
+        )
+
+
+def _executar_atualizacao(atualizacao, medicao, inicio):
+    codigo = atualizacao.CODIGO
+    descricao = atualizacao.DESCRICAO
+    sem_transacao = hasattr(atualizacao, "executar_sem_transacao")
+
+    def duracao_ms():
+        return (time.perf_counter() - inicio) * 1000
+
+    if hasattr(atualizacao, "executar") and not transacao_ja_concluida(
+        codigo
+    ):
+        _limitar_espera_por_travas(db.session.connection())
+
+        # o inspector usa a conexão da transação: outra conexão veria o
+        # esquema de antes e, no SQLite, esperaria a trava de escrita
+        # que esta transação já tem
+        atualizacao.executar(
+            db.session,
+            inspect(db.session.connection()),
+        )
+
+        # no mesmo commit: se o processo cair depois dele, executar()
+        # não roda de novo
+        registrar_atualizacao(
+            codigo,
+            descricao,
+            sucesso=not sem_transacao,
+            duracao_ms=duracao_ms(),
+            linhas_afetadas=medicao.linhas_afetadas,
+            transacao_concluida=True,
+        )
+
+        db.session.commit()
+
+    if sem_transacao:
+        # as consultas de controle abriram transação na sessão; aberta,
+        # seguraria a trava de escrita do SQLite e faria o CONCURRENTLY
+        # esperar por ela
+        db.session.commit()
+
+        with db.engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as conexao:
+            # sem lock_timeout: o CONCURRENTLY espera as transações em
+            # andamento terminarem, mas sem bloquear ninguém
+            atualizacao.executar_sem_transacao(
+                conexao,
+                inspect(db.engine),
+            )
+
+        registrar_atualizacao(
+            codigo,
+            descricao,
+            duracao_ms=duracao_ms(),
+            linhas_afetadas=medicao.linhas_afetadas,
+        )
+
+        db.session.commit()
+
+
 def executar_atualizacoes():
+    with trava_atualizacoes():
+        _executar_pendentes()
+
+
+def _executar_pendentes():
     criar_tabela_controle()
 
     atualizacoes = carregar_atualizacoes()
@@ -132,23 +420,37 @@ def executar_atualizacoes():
 
         print(f"[EXECUTANDO] {codigo} - {descricao}")
 
+        medicao = Medicao()
+        inicio = time.perf_counter()
+
         try:
-            atualizacao.executar(
-                db.session,
-                inspect(db.engine),
-            )
+            with medicao.ativa(db.engine):
+                _executar_atualizacao(atualizacao, medicao, inicio)
+
+        except Exception:
+            db.session.rollback()
+
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+
+            medicao.imprimir()
+            print(f"[FALHOU] {codigo} após {duracao_ms:.1f} ms")
 
             registrar_atualizacao(
                 codigo,
                 descricao,
+                sucesso=False,
+                duracao_ms=duracao_ms,
+                linhas_afetadas=medicao.linhas_afetadas,
             )
 
             db.session.commit()
+            raise
 
-            print(f"[CONCLUÍDA] {codigo}")
+        duracao_ms = (time.perf_counter() - inicio) * 1000
 
-        except Exception:
-            db.session.rollback()
+        medicao.imprimir()
 
-            print(f"[FALHOU] {codigo}")
-            raise
+        print(
+            f"[CONCLUÍDA] {codigo} em {duracao_ms:.1f} ms, "
+            f"{medicao.linhas_afetadas} linha(s) afetada(s)"
+        )
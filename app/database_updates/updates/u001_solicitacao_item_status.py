@@ -1,5 +1,7 @@
 from sqlalchemy import text
 
+from app.database_updates.lotes import preencher_em_lotes
+
 
 CODIGO = "001_solicitacao_item_status"
 
@@ -73,46 +75,52 @@ def executar(session, inspector):
             )
         )
 
-    session.execute(
-        text(
-            """
-            UPDATE solicitacao_item AS item
-            SET
-                status = CASE
-                    WHEN solicitacao.status = 'APROVADA'
-                        THEN 'APROVADO'
-
-                    WHEN solicitacao.status = 'ENTREGUE'
-                        THEN 'ENTREGUE'
-
-                    WHEN solicitacao.status = 'REJEITADA'
-                        THEN 'REJEITADO'
 
-                    ELSE COALESCE(
-                        NULLIF(item.status, ''),
-                        'PENDENTE'
+def executar_sem_transacao(conexao, inspector):
+    # itens antigos ajustados pelo status da solicitação, em lotes
+    preencher_em_lotes(
+        conexao,
+        CODIGO,
+        "solicitacao_item",
+        """
+        UPDATE solicitacao_item AS item
+        SET
+            status = CASE
+                WHEN solicitacao.status = 'APROVADA'
+                    THEN 'APROVADO'
+
+                WHEN solicitacao.status = 'ENTREGUE'
+                    THEN 'ENTREGUE'
+
+                WHEN solicitacao.status = 'REJEITADA'
+                    THEN 'REJEITADO'
+
+                ELSE COALESCE(
+                    NULLIF(item.status, ''),
+                    'PENDENTE'
+                )
+            END,
+
+            qtd_aprovada = CASE
+                WHEN solicitacao.status IN (
+                    'APROVADA',
+                    'ENTREGUE'
+                )
+                    THEN COALESCE(
+                        item.qtd_aprovada,
+                        item.qtd
                     )
-                END,
 
-                qtd_aprovada = CASE
-                    WHEN solicitacao.status IN (
-                        'APROVADA',
-                        'ENTREGUE'
-                    )
-                        THEN COALESCE(
-                            item.qtd_aprovada,
-                            item.qtd
-                        )
-
-                    WHEN solicitacao.status = 'REJEITADA'
-                        THEN 0
+                WHEN solicitacao.status = 'REJEITADA'
+                    THEN 0
 
-                    ELSE item.qtd_aprovada
-                END
+                ELSE item.qtd_aprovada
+            END
 
-            FROM solicitacao
+        FROM solicitacao
 
-            WHERE solicitacao.id = item.solicitacao_id
-            """
-        )
+        WHERE solicitacao.id = item.solicitacao_id
+          AND item.id > :inicio
+          AND item.id <= :fim
+        """,
     )
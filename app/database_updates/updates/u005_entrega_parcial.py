@@ -0,0 +1,100 @@
+from sqlalchemy import text
+
+
+CODIGO = "005_entrega_parcial"
+
+DESCRICAO = (
+    "Registrar a quantidade entregue por item e "
+    "os eventos de entrega parcial."
+)
+
+
+def executar(session, inspector):
+    if not inspector.has_table("solicitacao_item"):
+        raise RuntimeError(
+            "A tabela solicitacao_item não existe."
+        )
+
+    colunas = {
+        coluna["name"]
+        for coluna in inspector.get_columns("solicitacao_item")
+    }
+
+    if "qtd_entregue" not in colunas:
+        session.execute(
+            text(
+                """
+                ALTER TABLE solicitacao_item
+                ADD COLUMN qtd_entregue NUMERIC(12, 2)
+                NOT NULL DEFAULT 0
+                """
+            )
+        )
+
+        # Itens entregues antes desta versão eram sempre integrais.
+        session.execute(
+            text(
+                """
+                UPDATE solicitacao_item
+                SET qtd_entregue = COALESCE(qtd_aprovada, qtd)
+                WHERE status = 'ENTREGUE'
+                """
+            )
+        )
+
+    session.execute(
+        text(
+            """
+            CREATE TABLE IF NOT EXISTS solicitacao_item_entrega (
+                id SERIAL PRIMARY KEY,
+
+                solicitacao_id INTEGER NOT NULL,
+
+                item_id INTEGER NOT NULL,
+
+                material_id INTEGER NOT NULL,
+
+                qtd NUMERIC(12, 2) NOT NULL,
+
+                usuario_id INTEGER NULL,
+
+                data_entrega TIMESTAMP NOT NULL
+                    DEFAULT CURRENT_TIMESTAMP,
+
+                CONSTRAINT fk_item_entrega_solicitacao
+                    FOREIGN KEY (solicitacao_id)
+                    REFERENCES solicitacao (id)
+                    ON DELETE CASCADE,
+
+                CONSTRAINT fk_item_entrega_item
+                    FOREIGN KEY (item_id)
+                    REFERENCES solicitacao_item (id)
+                    ON DELETE CASCADE,
+
+                CONSTRAINT fk_item_entrega_material
+                    FOREIGN KEY (material_id)
+                    REFERENCES material (id),
+
+                CONSTRAINT fk_item_entrega_usuario
+                    FOREIGN KEY (usuario_id)
+                    REFERENCES "user" (id)
+                    ON DELETE SET NULL
+            )
+            """
+        )
+    )
+
+    for nome, coluna in [
+        ("ix_solicitacao_item_entrega_solicitacao_id", "solicitacao_id"),
+        ("ix_solicitacao_item_entrega_item_id", "item_id"),
+        ("ix_solicitacao_item_entrega_material_id", "material_id"),
+        ("ix_solicitacao_item_entrega_data_entrega", "data_entrega"),
+    ]:
+        session.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS {nome}
+                ON solicitacao_item_entrega ({coluna})
+                """
+            )
+        )
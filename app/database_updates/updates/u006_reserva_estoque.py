@@ -0,0 +1,55 @@
+from sqlalchemy import text
+
+
+CODIGO = "006_reserva_estoque"
+
+DESCRICAO = (
+    "Reservar no material a quantidade aprovada "
+    "e ainda não entregue das solicitações."
+)
+
+
+def executar(session, inspector):
+    if not inspector.has_table("material"):
+        raise RuntimeError(
+            "A tabela material não existe."
+        )
+
+    colunas = {
+        coluna["name"]
+        for coluna in inspector.get_columns("material")
+    }
+
+    if "reservado_atual" not in colunas:
+        session.execute(
+            text(
+                """
+                ALTER TABLE material
+                ADD COLUMN reservado_atual NUMERIC(10, 2)
+                NOT NULL DEFAULT 0
+                """
+            )
+        )
+
+    # Recalcula a reserva a partir dos itens aprovados em aberto,
+    # para que aprovações anteriores a esta versão também contem.
+    session.execute(
+        text(
+            """
+            UPDATE material
+            SET reservado_atual = COALESCE(reserva.total, 0)
+            FROM (
+                SELECT
+                    material_id,
+                    SUM(
+                        COALESCE(qtd_aprovada, qtd)
+                        - COALESCE(qtd_entregue, 0)
+                    ) AS total
+                FROM solicitacao_item
+                WHERE status IN ('APROVADO', 'ENTREGUE_PARCIAL')
+                GROUP BY material_id
+            ) AS reserva
+            WHERE reserva.material_id = material.id
+            """
+        )
+    )
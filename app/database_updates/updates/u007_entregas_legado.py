@@ -0,0 +1,51 @@
+from sqlalchemy import text
+
+
+CODIGO = "007_entregas_legado"
+
+DESCRICAO = (
+    "Criar os eventos de entrega dos itens entregues antes "
+    "do controle de entrega parcial, para o kardex."
+)
+
+
+def executar(session, inspector):
+    if not inspector.has_table("solicitacao_item_entrega"):
+        raise RuntimeError(
+            "A tabela solicitacao_item_entrega não existe. "
+            "Execute a atualização 005 antes."
+        )
+
+    session.execute(
+        text(
+            """
+            INSERT INTO solicitacao_item_entrega (
+                solicitacao_id,
+                item_id,
+                material_id,
+                qtd,
+                usuario_id,
+                data_entrega
+            )
+            SELECT
+                item.solicitacao_id,
+                item.id,
+                item.material_id,
+                COALESCE(item.qtd_aprovada, item.qtd),
+                solicitacao.entregue_por_id,
+                COALESCE(
+                    solicitacao.data_entrega,
+                    solicitacao.data_solicitacao
+                )
+            FROM solicitacao_item AS item
+            JOIN solicitacao
+                ON solicitacao.id = item.solicitacao_id
+            WHERE item.status = 'ENTREGUE'
+              AND NOT EXISTS (
+                  SELECT 1
+                  FROM solicitacao_item_entrega AS entrega
+                  WHERE entrega.item_id = item.id
+              )
+            """
+        )
+    )
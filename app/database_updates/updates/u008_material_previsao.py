@@ -0,0 +1,39 @@
+from sqlalchemy import text
+
+
+CODIGO = "008_material_previsao"
+
+DESCRICAO = (
+    "Criar tabela com a previsão de consumo e o ponto "
+    "de reposição calculados por material."
+)
+
+
+def executar(session, inspector):
+    session.execute(
+        text(
+            """
+            CREATE TABLE IF NOT EXISTS material_previsao (
+                material_id INTEGER PRIMARY KEY,
+
+                consumo_medio_diario NUMERIC(12, 4) NOT NULL DEFAULT 0,
+
+                consumo_suavizado_diario NUMERIC(12, 4) NOT NULL DEFAULT 0,
+
+                desvio_diario NUMERIC(12, 4) NOT NULL DEFAULT 0,
+
+                ponto_reposicao NUMERIC(12, 2) NOT NULL DEFAULT 0,
+
+                dias_cobertura NUMERIC(10, 1) NULL,
+
+                calculado_em TIMESTAMP NOT NULL
+                    DEFAULT CURRENT_TIMESTAMP,
+
+                CONSTRAINT fk_previsao_material
+                    FOREIGN KEY (material_id)
+                    REFERENCES material (id)
+                    ON DELETE CASCADE
+            )
+            """
+        )
+    )
@@ -0,0 +1,54 @@
+from sqlalchemy import text
+
+
+CODIGO = "009_material_codigo_seq"
+
+DESCRICAO = (
+    "Criar a sequence dos códigos de material a partir "
+    "do maior código numérico já cadastrado."
+)
+
+
+def executar(session, inspector):
+    if session.get_bind().dialect.name != "postgresql":
+        # SQLite: os códigos saem da tabela sequencia_codigo
+        return
+
+    if not inspector.has_table("material"):
+        raise RuntimeError(
+            "A tabela material não existe."
+        )
+
+    session.execute(
+        text(
+            """
+            CREATE SEQUENCE IF NOT EXISTS material_codigo_seq
+            """
+        )
+    )
+
+    maior = session.execute(
+        text(
+            r"""
+            SELECT COALESCE(MAX(CAST(codigo AS BIGINT)), 0)
+            FROM material
+            WHERE codigo ~ '^\d+$'
+            """
+        )
+    ).scalar()
+
+    if maior:
+        session.execute(
+            text(
+                """
+                SELECT setval(
+                    'material_codigo_seq',
+                    GREATEST(
+                        :maior,
+                        (SELECT last_value FROM material_codigo_seq)
+                    )
+                )
+                """
+            ),
+            {"maior": maior},
+        )
@@ -0,0 +1,60 @@
+from sqlalchemy import text
+
+
+CODIGO = "010_indices_busca_material"
+
+DESCRICAO = (
+    "Índices de trigramas e de prefixo para a busca de materiais "
+    "por descrição e código."
+)
+
+
+def executar(session, inspector):
+    if not inspector.has_table("material"):
+        raise RuntimeError(
+            "A tabela material não existe."
+        )
+
+    # pg_trgm é extensão confiável desde o PostgreSQL 13: o dono do
+    # banco consegue criá-la sem superusuário.
+    session.execute(
+        text(
+            """
+            CREATE EXTENSION IF NOT EXISTS pg_trgm
+            """
+        )
+    )
+
+    for nome, definicao in [
+        # ILIKE '%termo%' (termos com 3 letras ou mais)
+        (
+            "ix_material_nome_trgm",
+            "USING gin (nome gin_trgm_ops)",
+        ),
+        (
+            "ix_material_codigo_trgm",
+            "USING gin (codigo gin_trgm_ops)",
+        ),
+        # LIKE 'termo%' (termos curtos)
+        (
+            "ix_material_nome_prefixo",
+            "(lower(nome) text_pattern_ops)",
+        ),
+        (
+            "ix_material_codigo_prefixo",
+            "(codigo text_pattern_ops)",
+        ),
+        # listagem padrão: só ativos, ordenados por nome
+        (
+            "ix_material_ativo_nome",
+            "(nome, id) WHERE ativo",
+        ),
+    ]:
+        session.execute(
+            text(
+                f"""
+                CREATE INDEX IF NOT EXISTS {nome}
+                ON material {definicao}
+                """
+            )
+        )
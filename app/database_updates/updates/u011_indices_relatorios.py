@@ -0,0 +1,74 @@
+from sqlalchemy import text
+
+from app.database_updates.indices import criar_indice
+
+
+CODIGO = "011_indices_relatorios"
+
+DESCRICAO = (
+    "Índices das chaves estrangeiras dos itens e índices compostos e "
+    "parciais dos filtros de relatórios."
+)
+
+
+INDICES = [
+    # chaves estrangeiras sem índice
+    (
+        "ix_solicitacao_item_solicitacao_id",
+        "solicitacao_item (solicitacao_id)",
+    ),
+    (
+        "ix_solicitacao_item_material_solicitacao",
+        "solicitacao_item (material_id, solicitacao_id)",
+    ),
+    (
+        "ix_entrada_item_entrada_id",
+        "entrada_item (entrada_id)",
+    ),
+    (
+        "ix_entrada_item_material_entrada",
+        "entrada_item (material_id, entrada_id)",
+    ),
+    # relatório de solicitações: filtro + ordenação por data
+    (
+        "ix_solicitacao_usuario_data",
+        "solicitacao (usuario_id, data_solicitacao, id)",
+    ),
+    (
+        "ix_solicitacao_status_data",
+        "solicitacao (status, data_solicitacao, id)",
+    ),
+    (
+        "ix_solicitacao_local_data",
+        "solicitacao (local_torre, local_pav, local_apto, data_solicitacao)",
+    ),
+    # consumo e saídas: só solicitações entregues, por data de entrega
+    (
+        "ix_solicitacao_entregue_data_entrega",
+        "solicitacao (data_entrega, id) WHERE status = 'ENTREGUE'",
+    ),
+    # kardex: entradas concluídas por data
+    (
+        "ix_entrada_concluida_data",
+        "entrada (data_entrada) WHERE status = 'CONCLUIDA'",
+    ),
+]
+
+
+TABELAS = ["solicitacao", "solicitacao_item", "entrada", "entrada_item"]
+
+
+def executar_sem_transacao(conexao, inspector):
+    for tabela in TABELAS:
+        if not inspector.has_table(tabela):
+            raise RuntimeError(
+                f"A tabela {tabela} não existe."
+            )
+
+    # CONCURRENTLY: as tabelas são grandes e seguem recebendo escritas
+    for nome, definicao in INDICES:
+        criar_indice(conexao, nome, definicao)
+
+    # estatísticas atualizadas para o planejador considerar os novos índices
+    for tabela in TABELAS:
+        conexao.execute(text(f"ANALYZE {tabela}"))
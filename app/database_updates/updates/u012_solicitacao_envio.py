@@ -0,0 +1,46 @@
+from sqlalchemy import text
+
+
+CODIGO = "012_solicitacao_envio"
+
+DESCRICAO = (
+    "Criar tabela com o resultado de cada envio do lote de "
+    "solicitações, única por usuário e chave de idempotência."
+)
+
+
+def executar(session, inspector):
+    session.execute(
+        text(
+            """
+            CREATE TABLE IF NOT EXISTS solicitacao_envio (
+                id SERIAL PRIMARY KEY,
+
+                usuario_id INTEGER NOT NULL,
+
+                chave VARCHAR(64) NOT NULL,
+
+                resultado VARCHAR(20) NOT NULL,
+
+                solicitacao_id INTEGER NULL,
+
+                erro TEXT NULL,
+
+                recebido_em TIMESTAMP NOT NULL
+                    DEFAULT CURRENT_TIMESTAMP,
+
+                CONSTRAINT uq_solicitacao_envio_usuario_chave
+                    UNIQUE (usuario_id, chave),
+
+                CONSTRAINT fk_solicitacao_envio_usuario
+                    FOREIGN KEY (usuario_id)
+                    REFERENCES "user" (id),
+
+                CONSTRAINT fk_solicitacao_envio_solicitacao
+                    FOREIGN KEY (solicitacao_id)
+                    REFERENCES solicitacao (id)
+                    ON DELETE SET NULL
+            )
+            """
+        )
+    )
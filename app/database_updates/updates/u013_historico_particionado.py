@@ -0,0 +1,327 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import text
+
+from app.database_updates.indices import criar_indice
+from app.database_updates.particoes import (
+    PARTICAO_LEGADO,
+    PARTICAO_PADRAO,
+    TABELA,
+    criar_particoes,
+    inicio_do_mes,
+    mes_seguinte,
+    tabela_particionada,
+)
+
+
+CODIGO = "013_historico_particionado"
+
+DESCRICAO = (
+    "Particionar solicitacao_historico por mês de data_evento "
+    "(PostgreSQL)."
+)
+
+
+# colunas com índice em cada partição; acao e data_evento não precisam
+# (a data já escolhe a partição)
+COLUNAS_INDICE = ["solicitacao_id", "item_id", "usuario_id"]
+
+MESES_FUTUROS = 3
+
+# folga mínima entre a conversão e o fim da tabela antiga
+FOLGA_CORTE = timedelta(days=7)
+
+RESTRICAO_CORTE = "ck_historico_legado_corte"
+
+# chaves estrangeiras como no modelo (sem ON DELETE); a tabela nova as
+# declara iguais às da antiga, para o ATTACH PARTITION aproveitar as que
+# já existem em vez de conferir as linhas sob o bloqueio
+CHAVES_ESTRANGEIRAS = [
+    ("solicitacao_id", "solicitacao"),
+    ("item_id", "solicitacao_item"),
+    ("usuario_id", '"user"'),
+]
+
+
+def _corte():
+    """
+    Data a partir da qual os eventos vão para as partições mensais. Até
+    lá continuam caindo na tabela antiga, que vira a partição legado.
+    """
+    agora = datetime.utcnow()
+    corte = mes_seguinte(inicio_do_mes(agora))
+
+    if corte - agora < FOLGA_CORTE:
+        corte = mes_seguinte(corte)
+
+    return corte
+
+
+def _tem_indice(conexao, tabela, coluna):
+    return conexao.execute(
+        text(
+            """
+            SELECT 1
+            FROM pg_index i
+            JOIN pg_attribute a
+              ON a.attrelid = i.indrelid
+             AND a.attnum = i.indkey[0]
+            WHERE i.indrelid = CAST(:tabela AS regclass)
+              AND i.indnkeyatts = 1
+              AND i.indpred IS NULL
+              AND i.indisvalid
+              AND a.attname = :coluna
+            """
+        ),
+        {"tabela": tabela, "coluna": coluna},
+    ).scalar() is not None
+
+
+def _chave_estrangeira(conexao, tabela, coluna, referencia):
+    """
+    Nome e validação da chave estrangeira de uma coluna equivalente à do
+    modelo (NO ACTION, não adiável), ou None se não houver.
+    """
+    return conexao.execute(
+        text(
+            """
+            SELECT c.conname, c.convalidated
+            FROM pg_constraint c
+            JOIN pg_attribute a
+              ON a.attrelid = c.conrelid
+             AND a.attnum = c.conkey[1]
+            WHERE c.conrelid = CAST(:tabela AS regclass)
+              AND c.contype = 'f'
+              AND array_length(c.conkey, 1) = 1
+              AND a.attname = :coluna
+              AND c.confrelid = CAST(:referencia AS regclass)
+              AND c.confupdtype = 'a'
+              AND c.confdeltype = 'a'
+              AND c.confmatchtype = 's'
+              AND NOT c.condeferrable
+            ORDER BY c.convalidated DESC
+            LIMIT 1
+            """
+        ),
+        {"tabela": tabela, "coluna": coluna, "referencia": referencia},
+    ).first()
+
+
+def _preparar(conexao, corte):
+    """
+    Passos longos, sem travar escritas: a restrição de data e as chaves
+    estrangeiras validadas deixam o ATTACH PARTITION dispensar a leitura
+    da tabela, e os índices que faltarem são criados CONCURRENTLY, para
+    o índice particionado aproveitar os existentes.
+    """
+    conexao.execute(
+        text(f"ALTER TABLE {TABELA} DROP CONSTRAINT IF EXISTS {RESTRICAO_CORTE}")
+    )
+
+    conexao.execute(
+        text(
+            f"""
+            ALTER TABLE {TABELA}
+            ADD CONSTRAINT {RESTRICAO_CORTE}
+            CHECK (data_evento < '{corte:%Y-%m-%d}') NOT VALID
+            """
+        )
+    )
+
+    conexao.execute(
+        text(f"ALTER TABLE {TABELA} VALIDATE CONSTRAINT {RESTRICAO_CORTE}")
+    )
+
+    for coluna, referencia in CHAVES_ESTRANGEIRAS:
+        chave = _chave_estrangeira(conexao, TABELA, coluna, referencia)
+
+        if chave is None:
+            nome = f"{TABELA}_{coluna}_fkey"
+
+            conexao.execute(
+                text(
+                    f"""
+                    ALTER TABLE {TABELA}
+                    ADD CONSTRAINT {nome}
+                    FOREIGN KEY ({coluna})
+                    REFERENCES {referencia} (id)
+                    NOT VALID
+                    """
+                )
+            )
+
+        elif chave.convalidated:
+            continue
+
+        else:
+            nome = chave.conname
+
+        conexao.execute(
+            text(f'ALTER TABLE {TABELA} VALIDATE CONSTRAINT "{nome}"')
+        )
+
+    for coluna in COLUNAS_INDICE:
+        if not _tem_indice(conexao, TABELA, coluna):
+            criar_indice(
+                conexao,
+                f"ix_historico_legado_{coluna}",
+                f"{TABELA} ({coluna})",
+            )
+
+
+def _converter(transacao, corte):
+    limite = current_app.config["ATUALIZACAO_LOCK_TIMEOUT"]
+
+    if limite:
+        transacao.execute(
+            text("SELECT set_config('lock_timeout', :limite, true)"),
+            {"limite": limite},
+        )
+
+    transacao.execute(
+        text(f"LOCK TABLE {TABELA} IN ACCESS EXCLUSIVE MODE")
+    )
+
+    sequencia = transacao.execute(
+        text(f"SELECT pg_get_serial_sequence('{TABELA}', 'id')")
+    ).scalar()
+
+    transacao.execute(text(f"ALTER TABLE {TABELA} RENAME TO {PARTICAO_LEGADO}"))
+
+    # nomes de índice são únicos no schema: libera os do create_all
+    # (ix_solicitacao_historico_*) para os índices particionados
+    for (indice,) in transacao.execute(
+        text(
+            """
+            SELECT indexname
+            FROM pg_indexes
+            WHERE tablename = :tabela
+              AND schemaname = current_schema()
+              AND indexname LIKE :prefixo
+            """
+        ),
+        {"tabela": PARTICAO_LEGADO, "prefixo": f"%{TABELA}%"},
+    ).all():
+        transacao.execute(
+            text(
+                f"ALTER INDEX {indice} RENAME TO "
+                f"{indice.replace(TABELA, PARTICAO_LEGADO, 1)}"
+            )
+        )
+
+    chaves = ",\n\n                ".join(
+        f"CONSTRAINT {TABELA}_{coluna}_fkey "
+        f"FOREIGN KEY ({coluna}) REFERENCES {referencia} (id)"
+        for coluna, referencia in CHAVES_ESTRANGEIRAS
+    )
+
+    transacao.execute(
+        text(
+            f"""
+            CREATE TABLE {TABELA} (
+                id INTEGER NOT NULL
+                    DEFAULT nextval('{sequencia}'::regclass),
+
+                solicitacao_id INTEGER NOT NULL,
+
+                item_id INTEGER NULL,
+
+                usuario_id INTEGER NULL,
+
+                acao VARCHAR(40) NOT NULL,
+
+                descricao TEXT NOT NULL,
+
+                data_evento TIMESTAMP NOT NULL
+                    DEFAULT CURRENT_TIMESTAMP,
+
+                {chaves}
+            )
+            PARTITION BY RANGE (data_evento)
+            """
+        )
+    )
+
+    # a restrição de data e as chaves estrangeiras validadas dispensam
+    # a conferência das linhas
+    transacao.execute(
+        text(
+            f"""
+            ALTER TABLE {TABELA} ATTACH PARTITION {PARTICAO_LEGADO}
+            FOR VALUES FROM (MINVALUE) TO ('{corte:%Y-%m-%d}')
+            """
+        )
+    )
+
+    transacao.execute(
+        text(
+            f"ALTER TABLE {PARTICAO_LEGADO} "
+            f"DROP CONSTRAINT {RESTRICAO_CORTE}"
+        )
+    )
+
+    # a sequência passa a pertencer à tabela nova, senão some junto
+    # com a legado quando ela for removida
+    transacao.execute(
+        text(f"ALTER SEQUENCE {sequencia} OWNED BY {TABELA}.id")
+    )
+
+    transacao.execute(
+        text(
+            f"""
+            CREATE TABLE {PARTICAO_PADRAO}
+            PARTITION OF {TABELA} (PRIMARY KEY (id))
+            DEFAULT
+            """
+        )
+    )
+
+    criar_particoes(transacao, corte, mes_seguinte(corte, MESES_FUTUROS))
+
+    # na legado, anexa o índice que já existe; nas novas, vazias, cria
+    for coluna in COLUNAS_INDICE:
+        transacao.execute(
+            text(
+                f"CREATE INDEX ix_{TABELA}_{coluna} "
+                f"ON {TABELA} ({coluna})"
+            )
+        )
+
+
+def executar_sem_transacao(conexao, inspector):
+    if conexao.dialect.name != "postgresql":
+        # SQLite: tabela comum, criada pelo create_all
+        return
+
+    if not inspector.has_table(TABELA):
+        raise RuntimeError(
+            f"A tabela {TABELA} não existe."
+        )
+
+    if tabela_particionada(conexao):
+        return
+
+    corte = _corte()
+
+    _preparar(conexao, corte)
+
+    try:
+        with conexao.engine.begin() as transacao:
+            _converter(transacao, corte)
+
+    except Exception:
+        # sem a conversão, a restrição recusaria os eventos depois
+        # do corte
+        conexao.execute(
+            text(
+                f"ALTER TABLE {TABELA} "
+                f"DROP CONSTRAINT IF EXISTS {RESTRICAO_CORTE}"
+            )
+        )
+        raise
+
+    print(
+        f"    {TABELA} particionada; eventos a partir de "
+        f"{corte:%Y-%m-%d} vão para partições mensais."
+    )
@@ -0,0 +1,38 @@
+from sqlalchemy import text
+
+
+CODIGO = "014_solicitacao_arquivo"
+
+DESCRICAO = (
+    "Criar o índice dos arquivos de solicitações finalizadas "
+    "retiradas do banco."
+)
+
+
+def executar(session, inspector):
+    session.execute(
+        text(
+            """
+            CREATE TABLE IF NOT EXISTS solicitacao_arquivo (
+                id SERIAL PRIMARY KEY,
+
+                arquivo VARCHAR(255) NOT NULL UNIQUE,
+
+                quantidade INTEGER NOT NULL,
+
+                data_solicitacao_inicial TIMESTAMP NOT NULL,
+
+                data_solicitacao_final TIMESTAMP NOT NULL,
+
+                data_entrega_inicial TIMESTAMP NULL,
+
+                data_entrega_final TIMESTAMP NULL,
+
+                tamanho_bytes BIGINT NOT NULL,
+
+                criado_em TIMESTAMP NOT NULL
+                    DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+    )
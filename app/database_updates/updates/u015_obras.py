@@ -0,0 +1,178 @@
+from sqlalchemy import text
+
+from app.database_updates.indices import criar_indice, remover_indice
+from app.models.obra import (
+    Obra,
+    ObraPavimento,
+    ObraTorre,
+    ObraUnidade,
+    usuario_obra,
+)
+
+
+CODIGO = "015_obras"
+
+DESCRICAO = (
+    "Obras: obra_id em material, solicitacao e entrada, com os índices "
+    "começando pela obra."
+)
+
+
+TABELAS = ["material", "solicitacao", "entrada"]
+
+TABELAS_OBRA = [
+    Obra.__table__,
+    ObraTorre.__table__,
+    ObraPavimento.__table__,
+    ObraUnidade.__table__,
+    usuario_obra,
+]
+
+INDICES = [
+    ("ix_material_obra_codigo", "material (obra_id, codigo)", True),
+    ("ix_material_obra_nome", "material (obra_id, nome)", False),
+    ("ix_solicitacao_obra", "solicitacao (obra_id, id)", False),
+    (
+        "ix_solicitacao_obra_data",
+        "solicitacao (obra_id, data_solicitacao, id)",
+        False,
+    ),
+    (
+        "ix_solicitacao_obra_usuario_data",
+        "solicitacao (obra_id, usuario_id, data_solicitacao, id)",
+        False,
+    ),
+    (
+        "ix_solicitacao_obra_status_data",
+        "solicitacao (obra_id, status, data_solicitacao, id)",
+        False,
+    ),
+    (
+        "ix_solicitacao_obra_local_data",
+        "solicitacao (obra_id, local_torre, local_pav, local_apto, "
+        "data_solicitacao)",
+        False,
+    ),
+    (
+        "ix_solicitacao_obra_entregue_data_entrega",
+        "solicitacao (obra_id, data_entrega, id) WHERE status = 'ENTREGUE'",
+        False,
+    ),
+    ("ix_entrada_obra", "entrada (obra_id, id)", False),
+    (
+        "ix_entrada_obra_concluida_data",
+        "entrada (obra_id, data_entrada) WHERE status = 'CONCLUIDA'",
+        False,
+    ),
+]
+
+# substituídos pelos de cima; o código do material passa a ser único
+# dentro da obra
+INDICES_ANTIGOS = [
+    "ix_material_codigo",
+    "ix_material_nome",
+    "ix_solicitacao_usuario_data",
+    "ix_solicitacao_status_data",
+    "ix_solicitacao_local_data",
+    "ix_solicitacao_entregue_data_entrega",
+    "ix_entrada_concluida_data",
+]
+
+
+def _chave_estrangeira(tabela):
+    # mesmo nome que o PostgreSQL dá à criada pelo create_all
+    return f"{tabela}_obra_id_fkey"
+
+
+def executar(session, inspector):
+    conexao = session.connection()
+
+    for tabela in TABELAS_OBRA:
+        tabela.create(bind=conexao, checkfirst=True)
+
+    obra_padrao = conexao.execute(text("SELECT MIN(id) FROM obra")).scalar()
+
+    if obra_padrao is None:
+        raise RuntimeError(
+            "Nenhuma obra cadastrada. Suba o app uma vez para criar a "
+            "obra padrão."
+        )
+
+    postgres = conexao.dialect.name == "postgresql"
+
+    for tabela in TABELAS:
+        colunas = {coluna["name"] for coluna in inspector.get_columns(tabela)}
+
+        if "obra_id" in colunas:
+            continue
+
+        # PostgreSQL 11+: coluna com DEFAULT constante não reescreve a
+        # tabela; as linhas existentes ficam com a obra padrão
+        conexao.execute(
+            text(
+                f"ALTER TABLE {tabela} ADD COLUMN obra_id INTEGER "
+                f"NOT NULL DEFAULT {int(obra_padrao)}"
+            )
+        )
+
+        if not postgres:
+            # SQLite: sem DROP DEFAULT nem FK por ALTER TABLE
+            continue
+
+        conexao.execute(
+            text(f"ALTER TABLE {tabela} ALTER COLUMN obra_id DROP DEFAULT")
+        )
+
+        # NOT VALID: sem ler a tabela agora; validada fora da transação
+        conexao.execute(
+            text(
+                f"""
+                ALTER TABLE {tabela}
+                ADD CONSTRAINT {_chave_estrangeira(tabela)}
+                FOREIGN KEY (obra_id) REFERENCES obra (id) NOT VALID
+                """
+            )
+        )
+
+
+def _validar_chaves(conexao):
+    pendentes = conexao.execute(
+        text(
+            """
+            SELECT conrelid::regclass::text, conname
+            FROM pg_constraint
+            WHERE conname = ANY(:nomes)
+              AND NOT convalidated
+            """
+        ),
+        {"nomes": [_chave_estrangeira(tabela) for tabela in TABELAS]},
+    ).all()
+
+    # VALIDATE lê a tabela sem bloquear inserções e atualizações
+    for tabela, nome in pendentes:
+        conexao.execute(
+            text(f"ALTER TABLE {tabela} VALIDATE CONSTRAINT {nome}")
+        )
+
+
+def executar_sem_transacao(conexao, inspector):
+    if conexao.dialect.name == "postgresql":
+        _validar_chaves(conexao)
+
+    for nome, definicao, unico in INDICES:
+        criar_indice(conexao, nome, definicao, unico=unico)
+
+    for nome in INDICES_ANTIGOS:
+        remover_indice(conexao, nome)
+
+    if conexao.dialect.name == "postgresql":
+        # bancos em que o código virou restrição UNIQUE, e não índice
+        conexao.execute(
+            text(
+                "ALTER TABLE material "
+                "DROP CONSTRAINT IF EXISTS material_codigo_key"
+            )
+        )
+
+    for tabela in TABELAS:
+        conexao.execute(text(f"ANALYZE {tabela}"))
@@ -0,0 +1,124 @@
+from sqlalchemy import text
+
+from app.models.local_estoque import (
+    NOME_LOCAL_CENTRAL,
+    EstoqueLocal,
+    LocalEstoque,
+)
+from app.models.transferencia_estoque import TransferenciaEstoque
+
+
+CODIGO = "016_locais_estoque"
+
+DESCRICAO = (
+    "Locais de estoque: saldo por local, transferências e local nas "
+    "entradas e entregas. O saldo atual vai para o almoxarifado central."
+)
+
+
+TABELAS_NOVAS = [
+    LocalEstoque.__table__,
+    EstoqueLocal.__table__,
+    TransferenciaEstoque.__table__,
+]
+
+# entregas e entradas antigas ficam com o local vazio
+TABELAS_COM_LOCAL = ["entrada", "solicitacao_item_entrega"]
+
+
+def _chave_estrangeira(tabela):
+    return f"{tabela}_local_id_fkey"
+
+
+def executar(session, inspector):
+    conexao = session.connection()
+
+    for tabela in TABELAS_NOVAS:
+        tabela.create(bind=conexao, checkfirst=True)
+
+    postgres = conexao.dialect.name == "postgresql"
+
+    for tabela in TABELAS_COM_LOCAL:
+        colunas = {coluna["name"] for coluna in inspector.get_columns(tabela)}
+
+        if "local_id" in colunas:
+            continue
+
+        conexao.execute(
+            text(f"ALTER TABLE {tabela} ADD COLUMN local_id INTEGER")
+        )
+
+        if not postgres:
+            continue
+
+        conexao.execute(
+            text(
+                f"""
+                ALTER TABLE {tabela}
+                ADD CONSTRAINT {_chave_estrangeira(tabela)}
+                FOREIGN KEY (local_id) REFERENCES local_estoque (id)
+                NOT VALID
+                """
+            )
+        )
+
+    conexao.execute(
+        text(
+            """
+            INSERT INTO local_estoque (obra_id, nome, central, ativo)
+            SELECT o.id, :nome, :verdadeiro, :verdadeiro
+            FROM obra o
+            WHERE NOT EXISTS (
+                SELECT 1 FROM local_estoque l
+                WHERE l.obra_id = o.id AND l.central = :verdadeiro
+            )
+            """
+        ),
+        {"nome": NOME_LOCAL_CENTRAL, "verdadeiro": True},
+    )
+
+    # todo o saldo de hoje está no almoxarifado central
+    conexao.execute(
+        text(
+            """
+            INSERT INTO estoque_local (material_id, local_id, saldo)
+            SELECT m.id, l.id, m.saldo_atual
+            FROM material m
+            JOIN local_estoque l
+              ON l.obra_id = m.obra_id AND l.central = :verdadeiro
+            WHERE m.saldo_atual <> 0
+              AND NOT EXISTS (
+                  SELECT 1 FROM estoque_local e
+                  WHERE e.material_id = m.id
+              )
+            """
+        ),
+        {"verdadeiro": True},
+    )
+
+
+def _validar_chaves(conexao):
+    pendentes = conexao.execute(
+        text(
+            """
+            SELECT conrelid::regclass::text, conname
+            FROM pg_constraint
+            WHERE conname = ANY(:nomes)
+              AND NOT convalidated
+            """
+        ),
+        {"nomes": [_chave_estrangeira(tabela) for tabela in TABELAS_COM_LOCAL]},
+    ).all()
+
+    for tabela, nome in pendentes:
+        conexao.execute(
+            text(f"ALTER TABLE {tabela} VALIDATE CONSTRAINT {nome}")
+        )
+
+
+def executar_sem_transacao(conexao, inspector):
+    if conexao.dialect.name == "postgresql":
+        _validar_chaves(conexao)
+
+    for tabela in ["local_estoque", "estoque_local"]:
+        conexao.execute(text(f"ANALYZE {tabela}"))
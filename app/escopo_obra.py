@@ -0,0 +1,137 @@
+"""
+Separação dos dados por obra.
+
+Material, Solicitacao, Entrada e LocalEstoque têm obra_id. Toda
+consulta ORM feita com uma obra selecionada recebe, pelo evento
+do_orm_execute, o filtro obra_id = obra atual nessas entidades
+(with_loader_criteria), inclusive em joins, relacionamentos e
+UPDATE/DELETE em lote. Serviços e rotas não
+precisam repetir o filtro, e os índices compostos começando por obra_id
+deixam cada obra tão rápida quanto uma instalação com uma obra só.
+
+A obra atual é a escolhida pelo usuário (guardada na sessão do Flask),
+se ele puder usá-la, ou a primeira a que tem acesso. Fora de
+requisições (scripts) não há obra atual e as consultas veem todas; use
+usar_obra() para restringir um bloco. Itens, entregas e histórico não
+têm obra_id: chegam filtrados pela solicitação ou pelo material, como
+o saldo por local e as transferências.
+
+SQL textual (text()) não é filtrado.
+"""
+from contextlib import contextmanager
+
+from flask import g, has_app_context, request, session
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session, with_loader_criteria
+
+from app.models import Entrada, LocalEstoque, Material, Solicitacao
+from app.services import obra_service
+
+
+MODELOS_POR_OBRA = (Material, Solicitacao, Entrada, LocalEstoque)
+
+CHAVE_SESSAO = "obra_id"
+
+# Execution option que dispensa o filtro numa consulta específica.
+TODAS_AS_OBRAS = "todas_as_obras"
+
+
+def obra_atual_id():
+    if not has_app_context():
+        return None
+
+    return g.get("obra_id")
+
+
+def obra_atual():
+    if not has_app_context():
+        return None
+
+    return g.get("obra")
+
+
+def criterios_obra(obra_id):
+    """Opções que restringem as entidades de MODELOS_POR_OBRA à obra."""
+    return [
+        with_loader_criteria(
+            modelo,
+            lambda cls: cls.obra_id == obra_id,
+            include_aliases=True,
+        )
+        for modelo in MODELOS_POR_OBRA
+    ]
+
+
+@contextmanager
+def usar_obra(obra):
+    """Restringe as consultas do bloco à obra (ex.: num script)."""
+    anteriores = (g.get("obra"), g.get("obra_id"))
+
+    g.obra, g.obra_id = obra, obra.id
+
+    try:
+        yield obra
+    finally:
+        g.obra, g.obra_id = anteriores
+
+
+def _filtrar_por_obra(estado):
+    if not (estado.is_select or estado.is_update or estado.is_delete):
+        return
+
+    if estado.execution_options.get(TODAS_AS_OBRAS):
+        return
+
+    obra_id = obra_atual_id()
+
+    if obra_id is None:
+        return
+
+    estado.statement = estado.statement.options(*criterios_obra(obra_id))
+
+
+def selecionar_obra(obra_id):
+    """
+    Troca a obra da sessão do usuário. Devolve a obra escolhida, ou
+    None se ele não puder usá-la.
+    """
+    obra = obra_service.obra_para_usuario(current_user, obra_id)
+
+    if obra is None or obra.id != obra_id:
+        return None
+
+    session[CHAVE_SESSAO] = obra.id
+
+    return obra
+
+
+def _antes_da_requisicao():
+    if request.endpoint == "static" or not current_user.is_authenticated:
+        return
+
+    obra = obra_service.obra_para_usuario(
+        current_user,
+        session.get(CHAVE_SESSAO),
+    )
+
+    if obra is None:
+        return
+
+    g.obra, g.obra_id = obra, obra.id
+
+    if session.get(CHAVE_SESSAO) != obra.id:
+        session[CHAVE_SESSAO] = obra.id
+
+
+def _contexto_templates():
+    return {"obra_atual": obra_atual()}
+
+
+def init_app(app):
+    # na classe Session: vale para o db.session e para sessões avulsas
+    if not event.contains(Session, "do_orm_execute", _filtrar_por_obra):
+        event.listen(Session, "do_orm_execute", _filtrar_por_obra)
+
+    app.before_request(_antes_da_requisicao)
+    app.context_processor(_contexto_templates)
@@ -0,0 +1,167 @@
+"""
+Contagem de consultas SQL por requisição.
+
+Registra, para cada requisição, quantos comandos foram enviados ao
+banco, o tempo total gasto neles e os mais lentos. O resumo vai no
+cabeçalho Server-Timing (só para administradores, salvo com
+INSTRUMENTACAO_SERVER_TIMING), requisições acima do limite vão para o
+log e as últimas ficam em memória para o painel de desempenho do admin.
+"""
+import heapq
+import threading
+import time
+from collections import deque
+
+from flask import current_app, g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Quantas consultas mais lentas guardar por requisição.
+CONSULTAS_POR_REQUISICAO = 5
+
+TAMANHO_SQL = 500
+
+_recentes = deque(maxlen=100)
+_lock_recentes = threading.Lock()
+
+
+def _inicio_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("instrumentacao_inicio", []).append(
+        time.perf_counter()
+    )
+
+
+def _fim_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicios = conn.info.get("instrumentacao_inicio")
+
+    if not inicios:
+        return
+
+    duracao_ms = (time.perf_counter() - inicios.pop()) * 1000
+
+    if not has_request_context():
+        return
+
+    dados = g.get("instrumentacao")
+
+    if dados is None:
+        return
+
+    dados["consultas"] += 1
+    dados["tempo_db_ms"] += duracao_ms
+
+    consulta = (round(duracao_ms, 2), dados["consultas"], statement[:TAMANHO_SQL])
+
+    if len(dados["lentas"]) < CONSULTAS_POR_REQUISICAO:
+        heapq.heappush(dados["lentas"], consulta)
+    else:
+        heapq.heappushpop(dados["lentas"], consulta)
+
+    limite = current_app.config["INSTRUMENTACAO_CONSULTA_LENTA_MS"]
+
+    if duracao_ms >= limite:
+        current_app.logger.warning(
+            "Consulta lenta (%.1f ms) em %s: %s",
+            duracao_ms,
+            request.path,
+            statement[:TAMANHO_SQL],
+        )
+
+
+def _erro_consulta(contexto):
+    # o after_cursor_execute não roda quando o comando falha
+    if contexto.connection is not None:
+        inicios = contexto.connection.info.get("instrumentacao_inicio")
+
+        if inicios:
+            inicios.pop()
+
+
+def _antes_da_requisicao():
+    g.instrumentacao = {
+        "inicio": time.perf_counter(),
+        "consultas": 0,
+        "tempo_db_ms": 0.0,
+        "lentas": [],
+    }
+
+
+def _mostrar_server_timing():
+    # os tempos e a contagem de consultas revelam detalhes internos
+    if current_app.config["INSTRUMENTACAO_SERVER_TIMING"]:
+        return True
+
+    return current_user.is_authenticated and current_user.role == "ADMIN"
+
+
+def _depois_da_requisicao(response):
+    dados = g.pop("instrumentacao", None)
+
+    if dados is None:
+        return response
+
+    total_ms = (time.perf_counter() - dados["inicio"]) * 1000
+
+    resumo = {
+        "quando": time.time(),
+        "metodo": request.method,
+        "caminho": request.full_path.rstrip("?"),
+        "endpoint": request.endpoint,
+        "status": response.status_code,
+        "total_ms": round(total_ms, 1),
+        "tempo_db_ms": round(dados["tempo_db_ms"], 1),
+        "consultas": dados["consultas"],
+        "lentas": sorted(dados["lentas"], reverse=True),
+    }
+
+    with _lock_recentes:
+        _recentes.append(resumo)
+
+    config = current_app.config
+
+    if (
+        total_ms >= config["INSTRUMENTACAO_REQUISICAO_LENTA_MS"]
+        or dados["consultas"] >= config["INSTRUMENTACAO_LIMITE_CONSULTAS"]
+    ):
+        current_app.logger.warning(
+            "Requisição lenta: %s %s - %.1f ms, %d consultas "
+            "(%.1f ms no banco)",
+            request.method,
+            resumo["caminho"],
+            total_ms,
+            dados["consultas"],
+            dados["tempo_db_ms"],
+        )
+
+    if _mostrar_server_timing():
+        # respostas em streaming ainda não terminaram aqui; o tempo
+        # medido é só o de montar o início da resposta
+        response.headers["Server-Timing"] = (
+            f'db;dur={dados["tempo_db_ms"]:.1f};'
+            f'desc="{dados["consultas"]} consultas", '
+            f"app;dur={total_ms:.1f}"
+        )
+
+    return response
+
+
+def requisicoes_recentes():
+    with _lock_recentes:
+        return list(reversed(_recentes))
+
+
+def init_app(app):
+    if not app.config["INSTRUMENTACAO_ATIVA"]:
+        return
+
+    # Escuta a classe Engine, e não um engine específico, para valer
+    # também para binds adicionais. Só registra uma vez por processo.
+    if not event.contains(Engine, "before_cursor_execute", _inicio_consulta):
+        event.listen(Engine, "before_cursor_execute", _inicio_consulta)
+        event.listen(Engine, "after_cursor_execute", _fim_consulta)
+        event.listen(Engine, "handle_error", _erro_consulta)
+
+    app.before_request(_antes_da_requisicao)
+    app.after_request(_depois_da_requisicao)
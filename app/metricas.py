@@ -0,0 +1,152 @@
+"""
+Métricas no formato do Prometheus, expostas em /metrics.
+
+Com vários workers do gunicorn, defina PROMETHEUS_MULTIPROC_DIR
+(um diretório vazio e gravável) antes de subir o servidor: cada worker
+grava seus valores em arquivos ali e o /metrics soma todos. O
+gunicorn.conf.py da raiz limpa o diretório na subida e descarta os
+arquivos de workers que morreram.
+
+O /metrics mostra endpoints, latências e volumes de acesso, então só é
+servido com METRICAS_TOKEN definido (o Prometheus manda o token no
+cabeçalho Authorization: Bearer). Sem token, as métricas ficam
+desligadas, exceto em modo debug ou de testes.
+"""
+import hmac
+import os
+import time
+
+from flask import Response, abort, current_app, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+ENDPOINT_DESCONHECIDO = "desconhecido"
+
+# Endpoints que geram relatórios/exportações, além do blueprint relatorios.
+PREFIXOS_RELATORIO = ("relatorio", "materiais_exportar")
+
+FORMATOS = {
+    "text/html": "html",
+    "text/csv": "csv",
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+}
+
+REQUISICOES = Counter(
+    "aruana_http_requisicoes_total",
+    "Requisições atendidas, por endpoint, método e status.",
+    ["endpoint", "metodo", "status"],
+)
+
+LATENCIA = Histogram(
+    "aruana_http_latencia_segundos",
+    "Tempo até o fim do envio da resposta, por endpoint.",
+    ["endpoint", "metodo"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+EM_ANDAMENTO = Gauge(
+    "aruana_http_requisicoes_em_andamento",
+    "Requisições sendo atendidas agora.",
+    multiprocess_mode="livesum",
+)
+
+RELATORIOS = Histogram(
+    "aruana_relatorio_geracao_segundos",
+    "Tempo de geração de relatórios e exportações.",
+    ["relatorio", "formato"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+
+
+def _eh_relatorio(endpoint):
+    blueprint, _, nome = endpoint.partition(".")
+
+    return blueprint == "relatorios" or nome.startswith(PREFIXOS_RELATORIO)
+
+
+def _antes_da_requisicao():
+    if request.endpoint == "metricas":
+        return
+
+    g.metricas_inicio = time.perf_counter()
+    EM_ANDAMENTO.inc()
+
+
+def _depois_da_requisicao(response):
+    inicio = g.pop("metricas_inicio", None)
+
+    if inicio is None:
+        return response
+
+    endpoint = request.endpoint or ENDPOINT_DESCONHECIDO
+    metodo = request.method
+    status = str(response.status_code)
+    formato = FORMATOS.get(response.mimetype, "outro")
+    sucesso = response.status_code == 200
+
+    def registrar():
+        # roda quando o servidor termina de enviar o corpo, então
+        # respostas em streaming (kardex, exportação CSV) entram inteiras
+        duracao = time.perf_counter() - inicio
+
+        EM_ANDAMENTO.dec()
+        REQUISICOES.labels(endpoint, metodo, status).inc()
+        LATENCIA.labels(endpoint, metodo).observe(duracao)
+
+        if sucesso and _eh_relatorio(endpoint):
+            RELATORIOS.labels(endpoint, formato).observe(duracao)
+
+    response.call_on_close(registrar)
+
+    return response
+
+
+def _registro():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        return registro
+
+    return REGISTRY
+
+
+def metricas():
+    token = current_app.config["METRICAS_TOKEN"]
+
+    # sem token só chega aqui em debug ou testes (ver init_app)
+    if token:
+        enviado = request.headers.get("Authorization", "")
+
+        if not hmac.compare_digest(enviado, f"Bearer {token}"):
+            abort(401)
+
+    return Response(
+        generate_latest(_registro()),
+        mimetype=CONTENT_TYPE_LATEST,
+    )
+
+
+def init_app(app):
+    if not app.config["METRICAS_ATIVAS"]:
+        return
+
+    if not app.config["METRICAS_TOKEN"] and not (app.debug or app.testing):
+        app.logger.warning(
+            "Métricas desligadas: defina METRICAS_TOKEN para expor /metrics."
+        )
+        return
+
+    app.before_request(_antes_da_requisicao)
+    app.after_request(_depois_da_requisicao)
+
+    app.add_url_rule("/metrics", "metricas", metricas)
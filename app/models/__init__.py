@@ -8,6 +8,14 @@ from .fornecedor import Fornecedor
 from .departamento import Departamento
 from .user import User
 from .solicitacao_historico import SolicitacaoHistorico
+from .solicitacao_item_entrega import SolicitacaoItemEntrega
+from .material_previsao import MaterialPrevisao
+from .sequencia_codigo import SequenciaCodigo
+from .solicitacao_envio import SolicitacaoEnvio
+from .solicitacao_arquivo import SolicitacaoArquivo
+from .obra import Obra, ObraTorre, ObraPavimento, ObraUnidade
+from .local_estoque import LocalEstoque, EstoqueLocal
+from .transferencia_estoque import TransferenciaEstoque
 __all__ = [
     "Material",
     "Categoria",
@@ -18,4 +26,17 @@ __all__ = [
     "Fornecedor",
     "Departamento",
     "User",
+    "SolicitacaoHistorico",
+    "SolicitacaoItemEntrega",
+    "MaterialPrevisao",
+    "SequenciaCodigo",
+    "SolicitacaoEnvio",
+    "SolicitacaoArquivo",
+    "Obra",
+    "ObraTorre",
+    "ObraPavimento",
+    "ObraUnidade",
+    "LocalEstoque",
+    "EstoqueLocal",
+    "TransferenciaEstoque",
 ]
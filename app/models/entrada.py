@@ -1,10 +1,23 @@
 from datetime import datetime
 from app.extensions import db
+from app.models.obra import obra_id_padrao
 
 class Entrada(db.Model):
     __tablename__ = "entrada"
 
+    __table_args__ = (
+        db.Index("ix_entrada_obra", "obra_id", "id"),
+        db.Index(
+            "ix_entrada_obra_concluida_data",
+            "obra_id",
+            "data_entrada",
+            postgresql_where=db.text("status = 'CONCLUIDA'"),
+            sqlite_where=db.text("status = 'CONCLUIDA'"),
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
+    obra_id = db.Column(db.Integer, db.ForeignKey("obra.id"), nullable=False, default=obra_id_padrao)
     data_entrada = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default="RASCUNHO")  # RASCUNHO | CONCLUIDA
 
@@ -12,6 +25,10 @@ class Entrada(db.Model):
     documento_fornecedor = db.Column(db.String(20))
     nome_fornecedor = db.Column(db.String(200))
 
+    # onde o material foi recebido; vazio = almoxarifado central
+    local_id = db.Column(db.Integer, db.ForeignKey("local_estoque.id"), nullable=True)
+    local = db.relationship("LocalEstoque")
+
     registrado_por_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
     registrado_por = db.relationship("User")
 
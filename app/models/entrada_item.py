@@ -3,12 +3,22 @@ from app.extensions import db
 class EntradaItem(db.Model):
     __tablename__ = "entrada_item"
 
+    __table_args__ = (
+        # entradas de um material (kardex, previsão)
+        db.Index(
+            "ix_entrada_item_material_entrada",
+            "material_id",
+            "entrada_id",
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
     entrada_id = db.Column(
         db.Integer,
         db.ForeignKey("entrada.id"),
-        nullable=False
+        nullable=False,
+        index=True
     )
 
     material_id = db.Column(
@@ -0,0 +1,106 @@
+from decimal import Decimal
+
+from app.extensions import db
+from app.models.obra import obra_id_padrao
+
+
+NOME_LOCAL_CENTRAL = "Almoxarifado central"
+
+class LocalEstoque(db.Model):
+    """
+    Almoxarifado central ou depósito satélite da obra. Depósitos nos
+    pavimentos das torres informam torre (e pavimento) para a entrega
+    sair do mais próximo de quem pediu.
+    """
+
+    __tablename__ = "local_estoque"
+
+    __table_args__ = (
+        db.UniqueConstraint("obra_id", "nome", name="uq_local_estoque_nome"),
+    )
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+
+    obra_id = db.Column(
+        db.Integer,
+        db.ForeignKey("obra.id"),
+        nullable=False,
+        default=obra_id_padrao
+    )
+
+    nome = db.Column(
+        db.String(80),
+        nullable=False
+    )
+
+    # Recebe as entradas e os ajustes de saldo feitos no cadastro do
+    # material; um por obra.
+    central = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=False,
+        server_default="false"
+    )
+
+    torre = db.Column(
+        db.String(20),
+        nullable=True
+    )
+
+    pavimento = db.Column(
+        db.String(20),
+        nullable=True
+    )
+
+    ativo = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=True,
+        server_default="true"
+    )
+
+    def __repr__(self):
+        return f"<LocalEstoque id={self.id} nome={self.nome}>"
+
+
+class EstoqueLocal(db.Model):
+    """
+    Saldo de um material num local. A soma dos locais de um material é
+    o seu saldo_atual, mantido junto a cada movimentação
+    (estoque_service) para a leitura do total não precisar somar.
+    """
+
+    __tablename__ = "estoque_local"
+
+    __table_args__ = (
+        db.Index("ix_estoque_local_local_id", "local_id", "material_id"),
+    )
+
+    material_id = db.Column(
+        db.Integer,
+        db.ForeignKey("material.id"),
+        primary_key=True
+    )
+
+    local_id = db.Column(
+        db.Integer,
+        db.ForeignKey("local_estoque.id"),
+        primary_key=True
+    )
+
+    saldo = db.Column(
+        db.Numeric(12, 2),
+        nullable=False,
+        default=0
+    )
+
+    material = db.relationship("Material")
+
+    local = db.relationship("LocalEstoque")
+
+    @property
+    def saldo_decimal(self):
+        return Decimal(self.saldo or 0)
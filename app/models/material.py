@@ -1,27 +1,48 @@
 from decimal import Decimal
 
 from app.extensions import db
+from app.models.obra import obra_id_padrao
 
 
 class Material(db.Model):
     __tablename__ = "material"
 
+    # Cada obra tem o próprio catálogo e estoque; os índices começam
+    # pela obra (ver u015).
+    __table_args__ = (
+        db.Index(
+            "ix_material_obra_codigo",
+            "obra_id",
+            "codigo",
+            unique=True,
+        ),
+        db.Index(
+            "ix_material_obra_nome",
+            "obra_id",
+            "nome",
+        ),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True
     )
 
+    obra_id = db.Column(
+        db.Integer,
+        db.ForeignKey("obra.id"),
+        nullable=False,
+        default=obra_id_padrao
+    )
+
     codigo = db.Column(
         db.String(20),
-        unique=True,
-        nullable=False,
-        index=True
+        nullable=False
     )
 
     nome = db.Column(
         db.String(120),
-        nullable=False,
-        index=True
+        nullable=False
     )
 
     unidade = db.Column(
@@ -43,6 +64,14 @@ class Material(db.Model):
         server_default="0"
     )
 
+    # Quantidade aprovada em solicitações e ainda não entregue
+    reservado_atual = db.Column(
+        db.Numeric(10, 2),
+        nullable=False,
+        default=0,
+        server_default="0"
+    )
+
     ativo = db.Column(
         db.Boolean,
         nullable=False,
@@ -66,6 +95,14 @@ class Material(db.Model):
     def saldo_decimal(self):
         return Decimal(self.saldo_atual or 0)
 
+    @property
+    def reservado_decimal(self):
+        return Decimal(self.reservado_atual or 0)
+
+    @property
+    def disponivel_decimal(self):
+        return self.saldo_decimal - self.reservado_decimal
+
     @property
     def estoque_minimo_decimal(self):
         return Decimal(self.estoque_minimo or 0)
@@ -0,0 +1,65 @@
+from datetime import datetime
+
+from app.extensions import db
+
+
+class MaterialPrevisao(db.Model):
+    """
+    Resultado do cálculo noturno de consumo por material
+    (ver calcular_previsao_consumo.py). O dashboard só lê esta
+    tabela; nada aqui é recalculado durante a requisição.
+    """
+
+    __tablename__ = "material_previsao"
+
+    material_id = db.Column(
+        db.Integer,
+        db.ForeignKey("material.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+
+    # Média simples do consumo diário na janela curta
+    consumo_medio_diario = db.Column(
+        db.Numeric(12, 4),
+        nullable=False,
+        default=0,
+    )
+
+    # Suavização exponencial do consumo diário
+    consumo_suavizado_diario = db.Column(
+        db.Numeric(12, 4),
+        nullable=False,
+        default=0,
+    )
+
+    desvio_diario = db.Column(
+        db.Numeric(12, 4),
+        nullable=False,
+        default=0,
+    )
+
+    ponto_reposicao = db.Column(
+        db.Numeric(12, 2),
+        nullable=False,
+        default=0,
+    )
+
+    # Nulo quando não houve consumo no período
+    dias_cobertura = db.Column(
+        db.Numeric(10, 1),
+        nullable=True,
+    )
+
+    calculado_em = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    material = db.relationship("Material")
+
+    def __repr__(self):
+        return (
+            f"<MaterialPrevisao material_id={self.material_id} "
+            f"ponto_reposicao={self.ponto_reposicao}>"
+        )
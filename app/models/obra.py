@@ -0,0 +1,209 @@
+from datetime import datetime
+
+from flask import g, has_app_context
+
+from app.extensions import db
+
+
+# Usuários restritos a algumas obras. Quem não tem nenhuma linha aqui
+# pode trabalhar em todas (e escolher a obra no menu).
+usuario_obra = db.Table(
+    "usuario_obra",
+    db.Column(
+        "usuario_id",
+        db.Integer,
+        db.ForeignKey("user.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    db.Column(
+        "obra_id",
+        db.Integer,
+        db.ForeignKey("obra.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    ),
+)
+
+
+class Obra(db.Model):
+    __tablename__ = "obra"
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+
+    nome = db.Column(
+        db.String(120),
+        nullable=False,
+        unique=True
+    )
+
+    ativo = db.Column(
+        db.Boolean,
+        nullable=False,
+        default=True,
+        server_default="true"
+    )
+
+    # Incrementada a cada alteração de torres/pavimentos/unidades;
+    # invalida o layout guardado em memória (obra_service.obter_layout).
+    layout_versao = db.Column(
+        db.Integer,
+        nullable=False,
+        default=1,
+        server_default="1"
+    )
+
+    criado_em = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+    torres = db.relationship(
+        "ObraTorre",
+        back_populates="obra",
+        cascade="all, delete-orphan",
+        order_by="ObraTorre.ordem",
+    )
+
+    pavimentos = db.relationship(
+        "ObraPavimento",
+        back_populates="obra",
+        cascade="all, delete-orphan",
+        order_by="ObraPavimento.ordem",
+    )
+
+    def __repr__(self):
+        return f"<Obra id={self.id} nome={self.nome}>"
+
+
+class ObraTorre(db.Model):
+    __tablename__ = "obra_torre"
+
+    __table_args__ = (
+        db.UniqueConstraint("obra_id", "nome", name="uq_obra_torre_nome"),
+    )
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+
+    obra_id = db.Column(
+        db.Integer,
+        db.ForeignKey("obra.id", ondelete="CASCADE"),
+        nullable=False
+    )
+
+    nome = db.Column(
+        db.String(20),
+        nullable=False
+    )
+
+    ordem = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+
+    obra = db.relationship(
+        "Obra",
+        back_populates="torres"
+    )
+
+
+class ObraPavimento(db.Model):
+    """Pavimento-tipo da obra, igual em todas as torres."""
+
+    __tablename__ = "obra_pavimento"
+
+    __table_args__ = (
+        db.UniqueConstraint("obra_id", "nome", name="uq_obra_pavimento_nome"),
+    )
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+
+    obra_id = db.Column(
+        db.Integer,
+        db.ForeignKey("obra.id", ondelete="CASCADE"),
+        nullable=False
+    )
+
+    nome = db.Column(
+        db.String(20),
+        nullable=False
+    )
+
+    ordem = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+
+    obra = db.relationship(
+        "Obra",
+        back_populates="pavimentos"
+    )
+
+    unidades = db.relationship(
+        "ObraUnidade",
+        back_populates="pavimento",
+        cascade="all, delete-orphan",
+        order_by="ObraUnidade.ordem",
+    )
+
+
+class ObraUnidade(db.Model):
+    __tablename__ = "obra_unidade"
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "pavimento_id", "nome", name="uq_obra_unidade_nome"
+        ),
+    )
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+
+    pavimento_id = db.Column(
+        db.Integer,
+        db.ForeignKey("obra_pavimento.id", ondelete="CASCADE"),
+        nullable=False
+    )
+
+    nome = db.Column(
+        db.String(20),
+        nullable=False
+    )
+
+    ordem = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+
+    pavimento = db.relationship(
+        "ObraPavimento",
+        back_populates="unidades"
+    )
+
+
+def obra_id_padrao(context):
+    """
+    Valor padrão de obra_id nos inserts: a obra da requisição (ou do
+    bloco escopo_obra.usar_obra) e, fora delas (scripts, importações),
+    a primeira obra ativa.
+    """
+    if has_app_context() and g.get("obra_id") is not None:
+        return g.obra_id
+
+    return context.connection.execute(
+        db.select(db.func.min(Obra.id)).where(Obra.ativo.is_(True))
+    ).scalar()
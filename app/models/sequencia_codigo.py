@@ -0,0 +1,32 @@
+from app.extensions import db
+
+
+# No PostgreSQL os códigos de material saem da sequence
+# material_codigo_seq, criada só pela atualização 009 já a partir do
+# maior código cadastrado. Fica fora do metadata: o create_all a
+# criaria começando em 1 num banco existente, antes da 009 rodar.
+
+
+class SequenciaCodigo(db.Model):
+    """
+    Contador com trava de linha, usado como alternativa à sequence
+    nos bancos que não têm sequences (SQLite).
+    """
+
+    __tablename__ = "sequencia_codigo"
+
+    nome = db.Column(
+        db.String(40),
+        primary_key=True,
+    )
+
+    ultimo_valor = db.Column(
+        db.BigInteger,
+        nullable=False,
+        default=0,
+    )
+
+    def __repr__(self):
+        return (
+            f"<SequenciaCodigo {self.nome}={self.ultimo_valor}>"
+        )
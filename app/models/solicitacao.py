@@ -1,16 +1,71 @@
 from datetime import datetime
 
 from app.extensions import db
+from app.models.obra import obra_id_padrao
 
 
 class Solicitacao(db.Model):
     __tablename__ = "solicitacao"
 
+    # Índices dos filtros do relatório de solicitações e dos relatórios
+    # de consumo/saídas, todos começando pela obra (ver u011, u015 e
+    # scripts/verificar_indices.py).
+    __table_args__ = (
+        db.Index(
+            "ix_solicitacao_obra",
+            "obra_id",
+            "id",
+        ),
+        db.Index(
+            "ix_solicitacao_obra_data",
+            "obra_id",
+            "data_solicitacao",
+            "id",
+        ),
+        db.Index(
+            "ix_solicitacao_obra_usuario_data",
+            "obra_id",
+            "usuario_id",
+            "data_solicitacao",
+            "id",
+        ),
+        db.Index(
+            "ix_solicitacao_obra_status_data",
+            "obra_id",
+            "status",
+            "data_solicitacao",
+            "id",
+        ),
+        db.Index(
+            "ix_solicitacao_obra_local_data",
+            "obra_id",
+            "local_torre",
+            "local_pav",
+            "local_apto",
+            "data_solicitacao",
+        ),
+        db.Index(
+            "ix_solicitacao_obra_entregue_data_entrega",
+            "obra_id",
+            "data_entrega",
+            "id",
+            postgresql_where=db.text("status = 'ENTREGUE'"),
+            sqlite_where=db.text("status = 'ENTREGUE'"),
+        ),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True
     )
 
+    obra_id = db.Column(
+        db.Integer,
+        db.ForeignKey("obra.id"),
+        nullable=False,
+        default=obra_id_padrao
+    )
+
     # Usuário que criou a solicitação
     usuario_id = db.Column(
         db.Integer,
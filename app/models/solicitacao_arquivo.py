@@ -0,0 +1,69 @@
+from datetime import datetime
+
+from app.extensions import db
+
+
+class SolicitacaoArquivo(db.Model):
+    """
+    Índice dos arquivos de solicitações finalizadas tiradas do banco
+    (arquivo_solicitacoes_service). Uma linha por arquivo .jsonl.gz,
+    com o intervalo de datas que ele cobre: os relatórios só abrem os
+    arquivos cujo intervalo cruza o período pedido.
+    """
+
+    __tablename__ = "solicitacao_arquivo"
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    # Caminho relativo à pasta ARQUIVO_PASTA
+    arquivo = db.Column(
+        db.String(255),
+        nullable=False,
+        unique=True,
+    )
+
+    quantidade = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+    data_solicitacao_inicial = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    data_solicitacao_final = db.Column(
+        db.DateTime,
+        nullable=False,
+    )
+
+    # Vazias quando nenhuma solicitação do arquivo foi entregue
+    data_entrega_inicial = db.Column(
+        db.DateTime,
+        nullable=True,
+    )
+
+    data_entrega_final = db.Column(
+        db.DateTime,
+        nullable=True,
+    )
+
+    tamanho_bytes = db.Column(
+        db.BigInteger,
+        nullable=False,
+    )
+
+    criado_em = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    def __repr__(self):
+        return (
+            f"<SolicitacaoArquivo {self.arquivo} "
+            f"quantidade={self.quantidade}>"
+        )
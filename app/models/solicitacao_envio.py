@@ -0,0 +1,70 @@
+from datetime import datetime
+
+from app.extensions import db
+
+
+class SolicitacaoEnvio(db.Model):
+    """
+    Resultado de cada envio feito pelo lote de solicitações
+    (solicitacao_lote_service), pela chave que o aparelho gerou.
+    Um reenvio com a mesma chave devolve este resultado em vez de
+    criar a solicitação de novo.
+    """
+
+    __tablename__ = "solicitacao_envio"
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "usuario_id",
+            "chave",
+            name="uq_solicitacao_envio_usuario_chave",
+        ),
+    )
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    usuario_id = db.Column(
+        db.Integer,
+        db.ForeignKey("user.id"),
+        nullable=False,
+    )
+
+    chave = db.Column(
+        db.String(64),
+        nullable=False,
+    )
+
+    # CRIADA ou RECUSADA
+    resultado = db.Column(
+        db.String(20),
+        nullable=False,
+    )
+
+    solicitacao_id = db.Column(
+        db.Integer,
+        db.ForeignKey("solicitacao.id", ondelete="SET NULL"),
+        nullable=True,
+    )
+
+    # Motivo da recusa
+    erro = db.Column(
+        db.Text,
+        nullable=True,
+    )
+
+    recebido_em = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    solicitacao = db.relationship("Solicitacao")
+
+    def __repr__(self):
+        return (
+            f"<SolicitacaoEnvio {self.chave} "
+            f"{self.resultado} solicitacao_id={self.solicitacao_id}>"
+        )
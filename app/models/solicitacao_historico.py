@@ -4,6 +4,8 @@ from app.extensions import db
 
 
 class SolicitacaoHistorico(db.Model):
+    # No PostgreSQL a tabela é particionada por mês de data_evento
+    # (atualização 013, app/database_updates/particoes.py).
     __tablename__ = "solicitacao_historico"
 
     id = db.Column(
@@ -35,7 +37,6 @@ class SolicitacaoHistorico(db.Model):
     acao = db.Column(
         db.String(40),
         nullable=False,
-        index=True,
     )
 
     descricao = db.Column(
@@ -47,7 +48,6 @@ class SolicitacaoHistorico(db.Model):
         db.DateTime,
         nullable=False,
         default=datetime.utcnow,
-        index=True,
     )
 
     solicitacao = db.relationship(
@@ -1,14 +1,26 @@
+from decimal import Decimal
+
 from app.extensions import db
 
 class SolicitacaoItem(db.Model):
     __tablename__ = "solicitacao_item"
 
+    __table_args__ = (
+        # filtro por material no relatório de solicitações
+        db.Index(
+            "ix_solicitacao_item_material_solicitacao",
+            "material_id",
+            "solicitacao_id",
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
     solicitacao_id = db.Column(
         db.Integer,
         db.ForeignKey("solicitacao.id"),
-        nullable=False
+        nullable=False,
+        index=True
     )
 
     material_id = db.Column(
@@ -51,9 +63,34 @@ class SolicitacaoItem(db.Model):
         nullable=True
     )
 
+    # Soma das entregas já realizadas (permite entrega parcial)
+    qtd_entregue = db.Column(
+        db.Numeric(12, 2),
+        nullable=False,
+        default=0,
+        server_default="0"
+    )
+
     solicitacao = db.relationship(
         "Solicitacao",
         back_populates="itens"
     )
 
     material = db.relationship("Material")
+
+    entregas = db.relationship(
+        "SolicitacaoItemEntrega",
+        back_populates="item",
+        cascade="all, delete-orphan",
+        order_by="SolicitacaoItemEntrega.data_entrega.asc()"
+    )
+
+    @property
+    def qtd_a_entregar(self):
+        aprovada = Decimal(
+            self.qtd_aprovada
+            if self.qtd_aprovada is not None
+            else self.qtd or 0
+        )
+
+        return aprovada - Decimal(self.qtd_entregue or 0)
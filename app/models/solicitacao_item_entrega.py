@@ -0,0 +1,79 @@
+from datetime import datetime
+
+from app.extensions import db
+
+
+class SolicitacaoItemEntrega(db.Model):
+    __tablename__ = "solicitacao_item_entrega"
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    solicitacao_id = db.Column(
+        db.Integer,
+        db.ForeignKey("solicitacao.id"),
+        nullable=False,
+        index=True,
+    )
+
+    item_id = db.Column(
+        db.Integer,
+        db.ForeignKey("solicitacao_item.id"),
+        nullable=False,
+        index=True,
+    )
+
+    material_id = db.Column(
+        db.Integer,
+        db.ForeignKey("material.id"),
+        nullable=False,
+        index=True,
+    )
+
+    # de onde saiu; vazio nas entregas de antes dos locais de estoque
+    local_id = db.Column(
+        db.Integer,
+        db.ForeignKey("local_estoque.id"),
+        nullable=True,
+    )
+
+    qtd = db.Column(
+        db.Numeric(12, 2),
+        nullable=False,
+    )
+
+    usuario_id = db.Column(
+        db.Integer,
+        db.ForeignKey("user.id"),
+        nullable=True,
+    )
+
+    data_entrega = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+        index=True,
+    )
+
+    item = db.relationship(
+        "SolicitacaoItem",
+        back_populates="entregas",
+    )
+
+    material = db.relationship("Material")
+
+    local = db.relationship("LocalEstoque")
+
+    usuario = db.relationship(
+        "User",
+        foreign_keys=[usuario_id],
+    )
+
+    def __repr__(self):
+        return (
+            f"<SolicitacaoItemEntrega id={self.id} "
+            f"item_id={self.item_id} "
+            f"qtd={self.qtd}>"
+        )
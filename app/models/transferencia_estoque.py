@@ -0,0 +1,74 @@
+from datetime import datetime
+
+from app.extensions import db
+
+
+class TransferenciaEstoque(db.Model):
+    __tablename__ = "transferencia_estoque"
+
+    __table_args__ = (
+        db.Index(
+            "ix_transferencia_estoque_material_data",
+            "material_id",
+            "data_transferencia",
+        ),
+    )
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+
+    material_id = db.Column(
+        db.Integer,
+        db.ForeignKey("material.id"),
+        nullable=False
+    )
+
+    origem_id = db.Column(
+        db.Integer,
+        db.ForeignKey("local_estoque.id"),
+        nullable=False
+    )
+
+    destino_id = db.Column(
+        db.Integer,
+        db.ForeignKey("local_estoque.id"),
+        nullable=False
+    )
+
+    qtd = db.Column(
+        db.Numeric(12, 2),
+        nullable=False
+    )
+
+    observacao = db.Column(
+        db.String(255),
+        nullable=True
+    )
+
+    usuario_id = db.Column(
+        db.Integer,
+        db.ForeignKey("user.id"),
+        nullable=True
+    )
+
+    data_transferencia = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+    material = db.relationship("Material")
+
+    origem = db.relationship("LocalEstoque", foreign_keys=[origem_id])
+
+    destino = db.relationship("LocalEstoque", foreign_keys=[destino_id])
+
+    usuario = db.relationship("User")
+
+    def __repr__(self):
+        return (
+            f"<TransferenciaEstoque id={self.id} "
+            f"material_id={self.material_id} qtd={self.qtd}>"
+        )
@@ -15,6 +15,9 @@ class User(UserMixin, db.Model):
 
     #departamento = db.relationship("Departamento")
 
+    # Obras a que o usuário está restrito; vazio = todas
+    obras = db.relationship("Obra", secondary="usuario_obra", order_by="Obra.nome")
+
     def set_password(self, senha: str):
         self.senha_hash = generate_password_hash(senha)
 
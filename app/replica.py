@@ -0,0 +1,186 @@
+"""
+Leituras pesadas numa réplica do banco, opcional.
+
+Com DATABASE_URL_REPLICA definida, o engine da réplica entra como o
+bind "replica" e as requisições GET de relatórios e do dashboard leem
+dela, tirando essa carga do banco principal, que fica com aprovações e
+entregas. Sem a variável, tudo continua indo para o principal.
+
+A escolha é feita pela sessão (SessaoRoteada.get_bind), então serviços
+e rotas não mudam: basta a requisição estar marcada. Voltam para o
+principal:
+
+- escritas (flush, INSERT/UPDATE/DELETE) e, depois da primeira, todas
+  as leituras da mesma sessão, para a requisição ler o que gravou;
+- a requisição inteira, se a réplica estiver fora do ar ou atrasada
+  mais que REPLICA_ATRASO_MAXIMO_SEGUNDOS.
+
+O estado da réplica é conferido no máximo a cada
+REPLICA_VERIFICACAO_SEGUNDOS por processo. Uma falha da réplica no meio
+de uma consulta não é repetida no principal: a requisição falha e a
+próxima verificação a tira de uso.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+
+
+BIND = "replica"
+
+# Endpoints lidos da réplica, além do blueprint relatorios e dos
+# endpoints "relatorio*".
+ENDPOINTS_REPLICA = ("estoque.dashboard",)
+
+PREFIXOS_RELATORIO = ("relatorio",)
+
+# Atraso da réplica em segundos. Sem nada pendente de aplicar, o atraso
+# é zero mesmo que a última transação replicada seja antiga (banco
+# principal parado).
+SQL_ATRASO = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+_estados = {}
+_lock_estados = threading.Lock()
+
+
+def _medir_atraso(engine):
+    if engine.dialect.name != "postgresql":
+        # SQLite (desenvolvimento): uma cópia local, sem replicação
+        return 0.0
+
+    with engine.connect() as conexao:
+        atraso = conexao.execute(text(SQL_ATRASO)).scalar()
+
+    # NULL: a réplica ainda não aplicou nenhuma transação
+    return None if atraso is None else float(atraso)
+
+
+def replica_disponivel(engine):
+    """
+    Se a réplica pode ser usada agora: respondendo e com atraso dentro
+    do tolerado. O resultado vale por REPLICA_VERIFICACAO_SEGUNDOS.
+    """
+    config = current_app.config
+    agora = time.monotonic()
+    chave = id(engine)
+
+    with _lock_estados:
+        estado = _estados.get(chave)
+
+        if estado and agora - estado[0] < config["REPLICA_VERIFICACAO_SEGUNDOS"]:
+            return estado[1]
+
+        # as outras threads seguem com o valor antigo enquanto esta mede
+        _estados[chave] = (agora, estado[1] if estado else False)
+
+    try:
+        atraso = _medir_atraso(engine)
+
+    except Exception as erro:
+        current_app.logger.warning(
+            "Réplica indisponível, lendo do banco principal: %s", erro
+        )
+        disponivel = False
+
+    else:
+        disponivel = (
+            atraso is not None
+            and atraso <= config["REPLICA_ATRASO_MAXIMO_SEGUNDOS"]
+        )
+
+        if not disponivel:
+            current_app.logger.warning(
+                "Réplica atrasada (%s s), lendo do banco principal.",
+                "?" if atraso is None else f"{atraso:.0f}",
+            )
+
+    with _lock_estados:
+        _estados[chave] = (time.monotonic(), disponivel)
+
+    return disponivel
+
+
+class SessaoRoteada(Session):
+    """Sessão que manda as leituras marcadas para a réplica."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and _ler_da_replica():
+            escrita = self._flushing or getattr(clause, "is_dml", False)
+
+            if escrita:
+                self.info["escreveu"] = True
+
+            elif not self.info.get("escreveu"):
+                engine = self._db.engines.get(BIND)
+
+                if engine is not None and replica_disponivel(engine):
+                    return engine
+
+        return super().get_bind(
+            mapper=mapper, clause=clause, bind=bind, **kwargs
+        )
+
+
+def _ler_da_replica():
+    return has_app_context() and g.get("ler_da_replica", False)
+
+
+@contextmanager
+def leitura_na_replica():
+    """
+    Marca as consultas do bloco para a réplica, fora das requisições já
+    roteadas (ex.: um script de relatório).
+    """
+    anterior = g.get("ler_da_replica", False)
+    g.ler_da_replica = True
+
+    try:
+        yield
+    finally:
+        g.ler_da_replica = anterior
+
+
+def _eh_leitura(endpoint):
+    blueprint, _, nome = endpoint.partition(".")
+
+    return (
+        blueprint == "relatorios"
+        or nome.startswith(PREFIXOS_RELATORIO)
+        or endpoint in ENDPOINTS_REPLICA
+    )
+
+
+def _antes_da_requisicao():
+    if request.method == "GET" and request.endpoint:
+        g.ler_da_replica = _eh_leitura(request.endpoint)
+
+
+def configurar(app, url):
+    """Registra o bind da réplica. Chamar antes de db.init_app()."""
+    if not url:
+        return
+
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+
+    app.config.setdefault("SQLALCHEMY_BINDS", {})[BIND] = {
+        "url": url,
+        # descarta conexões que caíram numa troca de réplica
+        "pool_pre_ping": True,
+    }
+
+
+def init_app(app):
+    if BIND not in app.config.get("SQLALCHEMY_BINDS", {}):
+        return
+
+    app.before_request(_antes_da_requisicao)
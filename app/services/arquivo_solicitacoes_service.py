@@ -0,0 +1,480 @@
+"""
+Arquivo de solicitações finalizadas.
+
+Solicitações ENTREGUE, REJEITADA ou CANCELADA mais antigas que
+ARQUIVO_MESES saem do banco, com itens, entregas e histórico, para
+arquivos JSON Lines comprimidos (gzip) em ARQUIVO_PASTA: uma linha por
+solicitação. A tabela solicitacao_arquivo guarda, para cada arquivo, o
+intervalo de datas que ele cobre.
+
+Os relatórios continuam consultando só o banco, a não ser que o período
+pedido comece antes do fim do arquivo; aí leem também os arquivos cujo
+intervalo cruza o período (solicitacoes_arquivadas).
+"""
+import gzip
+import json
+import os
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from flask import current_app
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.orm import selectinload
+
+from app import escopo_obra
+from app.extensions import db
+from app.models.obra import Obra
+from app.models.solicitacao import Solicitacao
+from app.models.solicitacao_arquivo import SolicitacaoArquivo
+from app.models.solicitacao_envio import SolicitacaoEnvio
+from app.models.solicitacao_historico import SolicitacaoHistorico
+from app.models.solicitacao_item import SolicitacaoItem
+from app.models.solicitacao_item_entrega import SolicitacaoItemEntrega
+from app.models.user import User
+
+
+STATUS_FINALIZADOS = ("ENTREGUE", "REJEITADA", "CANCELADA")
+
+EXTENSAO = ".jsonl.gz"
+
+# Solicitações carregadas (e apagadas) por consulta.
+TAMANHO_LOTE = 500
+
+CAMPO_SOLICITACAO = "solicitacao"
+CAMPO_ENTREGA = "entrega"
+
+_PERIODOS = {
+    CAMPO_SOLICITACAO: (
+        "data_solicitacao",
+        SolicitacaoArquivo.data_solicitacao_inicial,
+        SolicitacaoArquivo.data_solicitacao_final,
+    ),
+    CAMPO_ENTREGA: (
+        "data_entrega",
+        SolicitacaoArquivo.data_entrega_inicial,
+        SolicitacaoArquivo.data_entrega_final,
+    ),
+}
+
+
+def pasta_arquivo():
+    pasta = current_app.config["ARQUIVO_PASTA"]
+
+    if not os.path.isabs(pasta):
+        pasta = os.path.join(current_app.instance_path, pasta)
+
+    return pasta
+
+
+# ------------------------------------------------------------------
+# Gravação
+# ------------------------------------------------------------------
+def _valor_json(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+
+    if isinstance(valor, Decimal):
+        return str(valor)
+
+    raise TypeError(f"Tipo sem conversão para o arquivo: {type(valor)}")
+
+
+def _colunas(objeto):
+    return {
+        coluna.name: getattr(objeto, coluna.key)
+        for coluna in objeto.__table__.columns
+    }
+
+
+def _documento(solicitacao, entregas, historico, nomes):
+    itens = []
+
+    for item in solicitacao.itens:
+        dados = _colunas(item)
+        material = item.material
+
+        # o cadastro do material pode mudar; o relatório mostra o de então
+        dados["material"] = {
+            "codigo": material.codigo if material else None,
+            "nome": material.nome if material else None,
+            "unidade": material.unidade if material else None,
+        }
+
+        itens.append(dados)
+
+    return {
+        "solicitacao": _colunas(solicitacao),
+        "usuarios": nomes,
+        "itens": itens,
+        "entregas": [_colunas(entrega) for entrega in entregas],
+        "historico": [_colunas(evento) for evento in historico],
+    }
+
+
+def _ids_arquivaveis(corte, limite):
+    query = (
+        db.session.query(Solicitacao.id)
+        .filter(
+            Solicitacao.status.in_(STATUS_FINALIZADOS),
+            Solicitacao.data_solicitacao < corte,
+            or_(
+                Solicitacao.data_entrega.is_(None),
+                Solicitacao.data_entrega < corte,
+            ),
+        )
+        .order_by(Solicitacao.id)
+    )
+
+    if limite:
+        query = query.limit(limite)
+
+    return [solicitacao_id for (solicitacao_id,) in query]
+
+
+def _agrupar(registros):
+    grupos = {}
+
+    for registro in registros:
+        grupos.setdefault(registro.solicitacao_id, []).append(registro)
+
+    return grupos
+
+
+def _documentos(ids):
+    """Documentos das solicitações de ids, na ordem de ids."""
+    for inicio in range(0, len(ids), TAMANHO_LOTE):
+        lote = ids[inicio:inicio + TAMANHO_LOTE]
+
+        solicitacoes = (
+            Solicitacao.query
+            .options(
+                selectinload(Solicitacao.itens)
+                .joinedload(SolicitacaoItem.material),
+            )
+            .filter(Solicitacao.id.in_(lote))
+            .order_by(Solicitacao.id)
+            .all()
+        )
+
+        entregas = _agrupar(
+            SolicitacaoItemEntrega.query
+            .filter(SolicitacaoItemEntrega.solicitacao_id.in_(lote))
+            .order_by(SolicitacaoItemEntrega.id)
+        )
+
+        historico = _agrupar(
+            SolicitacaoHistorico.query
+            .filter(SolicitacaoHistorico.solicitacao_id.in_(lote))
+            .order_by(SolicitacaoHistorico.id)
+        )
+
+        envolvidos = {}
+
+        for solicitacao in solicitacoes:
+            envolvidos[solicitacao.id] = {
+                solicitacao.usuario_id,
+                solicitacao.aprovado_por_id,
+                solicitacao.entregue_por_id,
+                *(item.analisado_por_id for item in solicitacao.itens),
+                *(r.usuario_id for r in entregas.get(solicitacao.id, [])),
+                *(r.usuario_id for r in historico.get(solicitacao.id, [])),
+            } - {None}
+
+        nomes = dict(
+            db.session.query(User.id, User.nome)
+            .filter(User.id.in_(set().union(*envolvidos.values())))
+            .all()
+        )
+
+        for solicitacao in solicitacoes:
+            yield _documento(
+                solicitacao,
+                entregas.get(solicitacao.id, []),
+                historico.get(solicitacao.id, []),
+                {
+                    str(usuario_id): nomes[usuario_id]
+                    for usuario_id in envolvidos[solicitacao.id]
+                    if usuario_id in nomes
+                },
+            )
+
+        # cada lote sai da sessão antes do próximo
+        db.session.expunge_all()
+
+
+def _gravar(caminho, documentos):
+    """
+    Grava os documentos e devolve o intervalo de datas coberto. O
+    arquivo é escrito com outro nome e renomeado só depois do fsync.
+    """
+    datas_solicitacao = []
+    datas_entrega = []
+    quantidade = 0
+
+    parcial = f"{caminho}.parcial"
+
+    with open(parcial, "wb") as bruto:
+        with gzip.GzipFile(fileobj=bruto, mode="wb") as saida:
+            for documento in documentos:
+                dados = documento["solicitacao"]
+
+                datas_solicitacao.append(dados["data_solicitacao"])
+
+                if dados["data_entrega"]:
+                    datas_entrega.append(dados["data_entrega"])
+
+                saida.write(
+                    json.dumps(
+                        documento,
+                        default=_valor_json,
+                        ensure_ascii=False,
+                        separators=(",", ":"),
+                    ).encode("utf-8")
+                )
+                saida.write(b"\n")
+
+                quantidade += 1
+
+        bruto.flush()
+        os.fsync(bruto.fileno())
+
+    os.replace(parcial, caminho)
+
+    return SimpleNamespace(
+        quantidade=quantidade,
+        data_solicitacao_inicial=min(datas_solicitacao),
+        data_solicitacao_final=max(datas_solicitacao),
+        data_entrega_inicial=min(datas_entrega, default=None),
+        data_entrega_final=max(datas_entrega, default=None),
+        tamanho_bytes=os.path.getsize(caminho),
+    )
+
+
+def _remover_do_banco(ids):
+    for inicio in range(0, len(ids), TAMANHO_LOTE):
+        lote = ids[inicio:inicio + TAMANHO_LOTE]
+
+        # o envio do lote offline continua registrado, sem a solicitação
+        db.session.execute(
+            update(SolicitacaoEnvio)
+            .where(SolicitacaoEnvio.solicitacao_id.in_(lote))
+            .values(solicitacao_id=None)
+        )
+
+        for modelo in (
+            SolicitacaoHistorico,
+            SolicitacaoItemEntrega,
+            SolicitacaoItem,
+        ):
+            db.session.execute(
+                delete(modelo).where(modelo.solicitacao_id.in_(lote))
+            )
+
+        db.session.execute(
+            delete(Solicitacao).where(Solicitacao.id.in_(lote))
+        )
+
+
+def calcular_corte(meses, hoje=None):
+    hoje = hoje or datetime.utcnow()
+    indice = hoje.year * 12 + hoje.month - 1 - meses
+
+    return datetime(indice // 12, indice % 12 + 1, 1)
+
+
+def arquivar_solicitacoes(meses=None, limite=None, hoje=None):
+    """
+    Move para o arquivo as solicitações finalizadas antes do primeiro
+    dia do mês de `meses` atrás. Cada arquivo recebe até
+    ARQUIVO_SOLICITACOES_POR_ARQUIVO solicitações e é confirmado numa
+    transação própria (índice + remoção): se o processo cair, o que já
+    foi confirmado fica arquivado e o resto continua no banco.
+
+    Devolve o resumo (arquivo, quantidade, tamanho_bytes, datas) de
+    cada arquivo criado.
+    """
+    if meses is None:
+        meses = current_app.config["ARQUIVO_MESES"]
+
+    # a previsão de consumo lê as entregas desse período
+    dias_previsao = current_app.config["PREVISAO_HISTORICO_DIAS"]
+
+    if meses * 30 < dias_previsao:
+        raise ValueError(
+            f"Mantenha no banco pelo menos {dias_previsao} dias "
+            "de histórico (usado pela previsão de consumo)."
+        )
+
+    corte = calcular_corte(meses, hoje)
+    ids = _ids_arquivaveis(corte, limite)
+
+    por_arquivo = current_app.config["ARQUIVO_SOLICITACOES_POR_ARQUIVO"]
+    pasta = pasta_arquivo()
+
+    criados = []
+
+    for inicio in range(0, len(ids), por_arquivo):
+        lote = ids[inicio:inicio + por_arquivo]
+
+        relativo = os.path.join(
+            f"{corte:%Y}",
+            f"solicitacoes_{datetime.utcnow():%Y%m%d_%H%M%S}_{lote[0]}"
+            f"{EXTENSAO}",
+        )
+        caminho = os.path.join(pasta, relativo)
+
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+
+        resumo = _gravar(caminho, _documentos(lote))
+
+        try:
+            registro = SolicitacaoArquivo(arquivo=relativo, **vars(resumo))
+
+            db.session.add(registro)
+
+            _remover_do_banco(lote)
+
+            db.session.commit()
+
+        except Exception:
+            db.session.rollback()
+            os.remove(caminho)
+            raise
+
+        # o registro sai da sessão no próximo lote (expunge_all)
+        criados.append(SimpleNamespace(arquivo=relativo, **vars(resumo)))
+
+    return criados
+
+
+# ------------------------------------------------------------------
+# Leitura
+# ------------------------------------------------------------------
+def _tipos(modelo):
+    return {
+        coluna.name: coluna.type.python_type
+        for coluna in modelo.__table__.columns
+    }
+
+
+_TIPOS = {}
+
+
+def _converter(modelo, dados):
+    if modelo not in _TIPOS:
+        _TIPOS[modelo] = _tipos(modelo)
+
+    tipos = _TIPOS[modelo]
+    convertidos = {}
+
+    for nome, valor in dados.items():
+        tipo = tipos.get(nome)
+
+        if valor is not None and tipo is datetime:
+            valor = datetime.fromisoformat(valor)
+        elif valor is not None and tipo is Decimal:
+            valor = Decimal(valor)
+
+        convertidos[nome] = valor
+
+    return convertidos
+
+
+def _usuario(nomes, usuario_id):
+    if usuario_id is None:
+        return None
+
+    return SimpleNamespace(
+        id=usuario_id,
+        nome=nomes.get(str(usuario_id), "-"),
+    )
+
+
+def _objeto(documento):
+    """
+    Solicitação arquivada com os mesmos atributos que os relatórios
+    usam da Solicitacao (itens, entregas, material, usuários), só para
+    leitura.
+    """
+    nomes = documento["usuarios"]
+
+    solicitacao = SimpleNamespace(
+        **_converter(Solicitacao, documento["solicitacao"]),
+        arquivada=True,
+    )
+
+    solicitacao.usuario = _usuario(nomes, solicitacao.usuario_id)
+    solicitacao.aprovado_por = _usuario(nomes, solicitacao.aprovado_por_id)
+    solicitacao.entregue_por = _usuario(nomes, solicitacao.entregue_por_id)
+
+    entregas = {}
+
+    for dados in documento.get("entregas", []):
+        entrega = SimpleNamespace(
+            **_converter(SolicitacaoItemEntrega, dados)
+        )
+        entregas.setdefault(entrega.item_id, []).append(entrega)
+
+    solicitacao.itens = []
+
+    for dados in documento["itens"]:
+        material = dados.pop("material")
+
+        item = SimpleNamespace(**_converter(SolicitacaoItem, dados))
+        item.material = SimpleNamespace(**material)
+        item.solicitacao = solicitacao
+        item.entregas = entregas.get(item.id, [])
+
+        solicitacao.itens.append(item)
+
+    return solicitacao
+
+
+def ler_arquivo(registro):
+    caminho = os.path.join(pasta_arquivo(), registro.arquivo)
+
+    with gzip.open(caminho, "rt", encoding="utf-8") as entrada:
+        for linha in entrada:
+            yield json.loads(linha)
+
+
+def solicitacoes_arquivadas(inicio, fim=None, campo=CAMPO_SOLICITACAO):
+    """
+    Solicitações arquivadas com a data de `campo` (solicitação ou
+    entrega) entre inicio e fim, inclusive. Sem data inicial, desde
+    o primeiro arquivo: período em aberto inclui o que foi arquivado.
+    """
+    if inicio is None:
+        inicio = datetime.min
+
+    atributo, coluna_inicial, coluna_final = _PERIODOS[campo]
+
+    query = SolicitacaoArquivo.query.filter(coluna_final >= inicio)
+
+    if fim is not None:
+        query = query.filter(coluna_inicial <= fim)
+
+    # os arquivos misturam as obras; os gravados antes delas não têm
+    # obra_id e são todos da primeira
+    obra_id = escopo_obra.obra_atual_id()
+    primeira_obra = db.session.execute(select(func.min(Obra.id))).scalar()
+
+    for registro in query.order_by(SolicitacaoArquivo.id):
+        for documento in ler_arquivo(registro):
+            if obra_id is not None and documento["solicitacao"].get(
+                "obra_id", primeira_obra
+            ) != obra_id:
+                continue
+
+            data = documento["solicitacao"][atributo]
+
+            if data is None:
+                continue
+
+            data = datetime.fromisoformat(data)
+
+            if data < inicio or (fim is not None and data > fim):
+                continue
+
+            yield _objeto(documento)
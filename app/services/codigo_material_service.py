@@ -0,0 +1,173 @@
+from sqlalchemy import select, text, update
+from sqlalchemy.dialects import sqlite
+
+from app import escopo_obra
+from app.extensions import db
+from app.models.material import Material
+from app.models.sequencia_codigo import SequenciaCodigo
+
+
+NOME_SEQUENCIA = "material_codigo_seq"
+NOME_CONTADOR = "material"
+
+DIGITOS_CODIGO = 4
+
+
+def formatar_codigo(numero):
+    return f"{int(numero):0{DIGITOS_CODIGO}d}"
+
+
+def _usa_sequence():
+    return db.engine.dialect.name == "postgresql"
+
+
+def maior_codigo_numerico():
+    """
+    Maior código puramente numérico já cadastrado, em qualquer obra (o
+    contador é um só). Usado só para inicializar o contador; o caminho
+    normal nunca consulta material.
+    """
+    maior = 0
+
+    consulta = select(Material.codigo).execution_options(
+        **{escopo_obra.TODAS_AS_OBRAS: True}
+    )
+
+    for (codigo,) in db.session.execute(consulta):
+        codigo = (codigo or "").strip()
+
+        if codigo.isdigit():
+            maior = max(maior, int(codigo))
+
+    return maior
+
+
+def alocar_codigos(quantidade=1):
+    """
+    Reserva `quantidade` códigos, únicos mesmo entre processos
+    concorrentes, e devolve a lista já formatada.
+
+    - PostgreSQL: nextval() da sequence numa única consulta; sequences
+      não participam da transação, então não há disputa entre workers.
+      A sequence só existe depois da atualização 009; antes dela o
+      nextval() falha em vez de entregar códigos repetidos.
+    - SQLite: incrementa uma linha de contador com UPDATE ... RETURNING;
+      a trava dura até o commit de quem chamou.
+
+    Importações em lote devem pedir o bloco inteiro de uma vez.
+    """
+    quantidade = int(quantidade)
+
+    if quantidade <= 0:
+        return []
+
+    if _usa_sequence():
+        numeros = db.session.execute(
+            text(
+                f"""
+                SELECT nextval('{NOME_SEQUENCIA}')
+                FROM generate_series(1, :quantidade)
+                """
+            ),
+            {"quantidade": quantidade},
+        ).scalars().all()
+
+    else:
+        ultimo = _incrementar_contador(quantidade)
+        numeros = range(ultimo - quantidade + 1, ultimo + 1)
+
+    return [formatar_codigo(numero) for numero in numeros]
+
+
+def alocar_codigo():
+    return alocar_codigos(1)[0]
+
+
+def _somar_contador(quantidade):
+    return db.session.execute(
+        update(SequenciaCodigo)
+        .where(SequenciaCodigo.nome == NOME_CONTADOR)
+        .values(
+            ultimo_valor=SequenciaCodigo.ultimo_valor + quantidade
+        )
+        .returning(SequenciaCodigo.ultimo_valor)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+
+
+def _incrementar_contador(quantidade):
+    """
+    Soma e lê o contador num só UPDATE ... RETURNING. Na primeira vez
+    cria a linha com INSERT ... ON CONFLICT DO NOTHING, a partir do
+    maior código cadastrado: se outro processo criar antes, o insert
+    não faz nada e o UPDATE seguinte soma sobre o valor dele.
+    """
+    ultimo = _somar_contador(quantidade)
+
+    if ultimo is not None:
+        return ultimo
+
+    db.session.execute(
+        sqlite.insert(SequenciaCodigo)
+        .values(
+            nome=NOME_CONTADOR,
+            ultimo_valor=maior_codigo_numerico(),
+        )
+        .on_conflict_do_nothing(index_elements=[SequenciaCodigo.nome])
+    )
+
+    return _somar_contador(quantidade)
+
+
+def registrar_codigo_manual(codigo):
+    """
+    Quando alguém digita um código numérico à mão, avança o alocador
+    para além dele, para que não seja entregue de novo depois.
+    """
+    codigo = (codigo or "").strip()
+
+    if not codigo.isdigit():
+        return
+
+    numero = int(codigo)
+
+    if _usa_sequence():
+        db.session.execute(
+            text(
+                f"""
+                SELECT setval(
+                    '{NOME_SEQUENCIA}',
+                    GREATEST(
+                        :numero,
+                        (SELECT last_value FROM {NOME_SEQUENCIA})
+                    )
+                )
+                """
+            ),
+            {"numero": numero},
+        )
+        return
+
+    # Garante que o contador exista antes de comparar.
+    _incrementar_contador(0)
+
+    db.session.execute(
+        update(SequenciaCodigo)
+        .where(
+            SequenciaCodigo.nome == NOME_CONTADOR,
+            SequenciaCodigo.ultimo_valor < numero,
+        )
+        .values(ultimo_valor=numero)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def sincronizar_com_cadastro():
+    """
+    Ajusta o alocador ao maior código existente, por exemplo depois
+    de uma carga feita direto no banco.
+    """
+    maior = maior_codigo_numerico()
+
+    if maior > 0:
+        registrar_codigo_manual(str(maior))
@@ -0,0 +1,455 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.extensions import db
+from app.models.local_estoque import EstoqueLocal, LocalEstoque
+from app.models.material import Material
+from app.models.transferencia_estoque import TransferenciaEstoque
+
+
+def agrupar_por_material(movimentos):
+    """
+    Soma as quantidades de uma lista de (material_id, quantidade),
+    para que cada material seja atualizado uma única vez no lote.
+    """
+    totais = defaultdict(Decimal)
+
+    for material_id, quantidade in movimentos:
+        totais[material_id] += Decimal(quantidade or 0)
+
+    return dict(totais)
+
+
+def consultar_disponivel(material_id):
+    """
+    Saldo disponível para novas solicitações (saldo - reservado),
+    lido direto da linha do material pela chave primária.
+    """
+    return db.session.execute(
+        select(
+            Material.saldo_atual - Material.reservado_atual
+        ).where(Material.id == material_id)
+    ).scalar()
+
+
+def _sem_negativo(coluna, quantidade):
+    return case(
+        (coluna > quantidade, coluna - quantidade),
+        else_=0,
+    )
+
+
+def baixar_estoque_em_lote(totais, nomes=None, liberar_reserva=False):
+    """
+    Baixa o saldo de vários materiais de forma atômica.
+
+    Cada material recebe um único UPDATE condicional
+    (saldo_atual >= quantidade), então a verificação e a baixa
+    acontecem no mesmo comando e não há janela entre "consultar"
+    e "gravar" para outro worker consumir o mesmo saldo.
+
+    Com `liberar_reserva`, a mesma quantidade sai de reservado_atual,
+    pois a entrega consome o que foi reservado na aprovação.
+
+    Os materiais são atualizados em ordem de id para que dois lotes
+    concorrentes travem as linhas sempre na mesma sequência.
+
+    Se algum material não tiver saldo, levanta ValueError e cabe ao
+    chamador fazer o rollback da transação inteira.
+    """
+    nomes = nomes or {}
+
+    for material_id in sorted(totais):
+        quantidade = Decimal(totais[material_id])
+
+        if quantidade <= 0:
+            raise ValueError(
+                "A quantidade para baixa deve ser maior que zero."
+            )
+
+        valores = {
+            "saldo_atual": Material.saldo_atual - quantidade,
+        }
+
+        if liberar_reserva:
+            valores["reservado_atual"] = _sem_negativo(
+                Material.reservado_atual,
+                quantidade,
+            )
+
+        resultado = db.session.execute(
+            update(Material)
+            .where(
+                Material.id == material_id,
+                Material.saldo_atual >= quantidade,
+            )
+            .values(**valores)
+            .execution_options(synchronize_session=False)
+        )
+
+        if resultado.rowcount != 1:
+            nome = nomes.get(material_id) or f"#{material_id}"
+
+            raise ValueError(
+                f"Estoque insuficiente para {nome}."
+            )
+
+    _expirar_saldos(totais)
+
+
+def ajustar_reservas_em_lote(variacoes, nomes=None):
+    """
+    Aplica variações de reserva por material.
+
+    Variação positiva reserva e só é aceita se o disponível
+    (saldo_atual - reservado_atual) cobrir a quantidade, checado no
+    próprio UPDATE. Variação negativa libera a reserva sem deixar
+    reservado_atual abaixo de zero.
+
+    Mesma ordem de travamento de baixar_estoque_em_lote.
+    """
+    nomes = nomes or {}
+
+    for material_id in sorted(variacoes):
+        quantidade = Decimal(variacoes[material_id])
+
+        if quantidade == 0:
+            continue
+
+        if quantidade > 0:
+            resultado = db.session.execute(
+                update(Material)
+                .where(
+                    Material.id == material_id,
+                    Material.saldo_atual - Material.reservado_atual
+                    >= quantidade,
+                )
+                .values(
+                    reservado_atual=(
+                        Material.reservado_atual + quantidade
+                    )
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+            if resultado.rowcount != 1:
+                nome = nomes.get(material_id) or f"#{material_id}"
+
+                raise ValueError(
+                    f"Saldo disponível insuficiente para "
+                    f"reservar {nome}."
+                )
+
+        else:
+            db.session.execute(
+                update(Material)
+                .where(Material.id == material_id)
+                .values(
+                    reservado_atual=_sem_negativo(
+                        Material.reservado_atual,
+                        -quantidade,
+                    )
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+    _expirar_saldos(variacoes)
+
+
+def _expirar_saldos(material_ids):
+    """
+    Os UPDATEs em lote não passam pelos objetos da sessão;
+    expira saldo e reserva dos materiais já carregados para que a próxima
+    leitura busque o valor gravado.
+    """
+    for material in list(db.session.identity_map.values()):
+        if (
+            isinstance(material, Material)
+            and material.id in material_ids
+        ):
+            db.session.expire(
+                material,
+                ["saldo_atual", "reservado_atual"],
+            )
+
+
+# ------------------------------------------------------------------
+# Saldo por local
+#
+# material.saldo_atual é sempre a soma de estoque_local do material:
+# toda movimentação num local soma a mesma quantidade no material, na
+# mesma transação, e transferências não mudam o total. Ordem de
+# travamento: a linha do material antes das de estoque_local, e estas
+# por local_id.
+# ------------------------------------------------------------------
+def _insert_dialeto():
+    if db.engine.dialect.name == "postgresql":
+        return postgresql.insert
+
+    return sqlite.insert
+
+
+def _somar_saldo_local(material_id, local_id, quantidade):
+    insert = _insert_dialeto()
+    tabela = EstoqueLocal.__table__
+
+    comando = insert(tabela).values(
+        material_id=material_id,
+        local_id=local_id,
+        saldo=quantidade,
+    )
+
+    db.session.execute(
+        comando.on_conflict_do_update(
+            index_elements=[tabela.c.material_id, tabela.c.local_id],
+            set_={"saldo": tabela.c.saldo + comando.excluded.saldo},
+        )
+    )
+
+
+def _travar_saldos(material_id, local_ids=None):
+    """{local_id: saldo} do material, com as linhas travadas (FOR UPDATE)."""
+    consulta = (
+        select(EstoqueLocal.local_id, EstoqueLocal.saldo)
+        .where(EstoqueLocal.material_id == material_id)
+        .order_by(EstoqueLocal.local_id)
+        .with_for_update()
+    )
+
+    if local_ids is not None:
+        consulta = consulta.where(EstoqueLocal.local_id.in_(local_ids))
+
+    return {
+        local_id: Decimal(saldo or 0)
+        for local_id, saldo in db.session.execute(consulta)
+    }
+
+
+def local_central_id(obra_id):
+    local_id = db.session.execute(
+        select(LocalEstoque.id)
+        .where(
+            LocalEstoque.obra_id == obra_id,
+            LocalEstoque.central.is_(True),
+        )
+        .order_by(LocalEstoque.id)
+        .limit(1)
+    ).scalar()
+
+    if local_id is None:
+        raise ValueError("A obra não tem almoxarifado central cadastrado.")
+
+    return local_id
+
+
+def movimentar_local(material_id, local_id, quantidade):
+    """
+    Soma `quantidade` (negativa para retirar) ao saldo do material no
+    local e ao saldo_atual do material. Não confere saldo: é para
+    entradas e seus estornos, como o ajuste direto de antes.
+    """
+    quantidade = Decimal(quantidade or 0)
+
+    if quantidade == 0:
+        return
+
+    db.session.execute(
+        update(Material)
+        .where(Material.id == material_id)
+        .values(saldo_atual=Material.saldo_atual + quantidade)
+        .execution_options(synchronize_session=False)
+    )
+
+    _somar_saldo_local(material_id, local_id, quantidade)
+
+    _expirar_saldos([material_id])
+
+
+def baixar_por_proximidade(
+    totais,
+    ordem_locais,
+    nomes=None,
+    liberar_reserva=False,
+):
+    """
+    Baixa como baixar_estoque_em_lote e distribui cada quantidade
+    pelos locais em `ordem_locais` (ids, do mais próximo ao mais
+    distante): esgota o primeiro com saldo antes de passar ao próximo.
+
+    Devolve {material_id: [(local_id, quantidade), ...]}.
+    """
+    nomes = nomes or {}
+
+    baixar_estoque_em_lote(totais, nomes, liberar_reserva)
+
+    posicao = {local_id: i for i, local_id in enumerate(ordem_locais)}
+    retiradas = {}
+
+    for material_id in sorted(totais):
+        restante = Decimal(totais[material_id])
+        saldos = _travar_saldos(material_id)
+        partes = []
+
+        candidatos = sorted(
+            (
+                local_id
+                for local_id, saldo in saldos.items()
+                if saldo > 0 and local_id in posicao
+            ),
+            key=posicao.get,
+        )
+
+        for local_id in candidatos:
+            parte = min(restante, saldos[local_id])
+            partes.append((local_id, parte))
+            restante -= parte
+
+            if restante == 0:
+                break
+
+        if restante > 0:
+            nome = nomes.get(material_id) or f"#{material_id}"
+
+            raise ValueError(
+                f"Saldo insuficiente nos locais ativos para {nome}."
+            )
+
+        for local_id, parte in partes:
+            _somar_saldo_local(material_id, local_id, -parte)
+
+        retiradas[material_id] = partes
+
+    return retiradas
+
+
+def transferir(
+    material,
+    origem,
+    destino,
+    quantidade,
+    usuario_id=None,
+    observacao=None,
+):
+    """
+    Move `quantidade` do material de um local para outro. As duas
+    linhas mudam na mesma transação e o total do material não muda.
+    O commit fica com o chamador.
+    """
+    quantidade = Decimal(quantidade or 0)
+
+    if quantidade <= 0:
+        raise ValueError(
+            "A quantidade transferida deve ser maior que zero."
+        )
+
+    if origem.id == destino.id:
+        raise ValueError("Origem e destino devem ser diferentes.")
+
+    if not (material.obra_id == origem.obra_id == destino.obra_id):
+        raise ValueError(
+            "Material, origem e destino devem ser da mesma obra."
+        )
+
+    if not destino.ativo:
+        raise ValueError(f"O local {destino.nome} está inativo.")
+
+    saldos = _travar_saldos(material.id, [origem.id, destino.id])
+    disponivel = saldos.get(origem.id, Decimal("0"))
+
+    if disponivel < quantidade:
+        raise ValueError(
+            f"Saldo insuficiente de {material.nome} em {origem.nome} "
+            f"(disponível: {disponivel})."
+        )
+
+    _somar_saldo_local(material.id, origem.id, -quantidade)
+    _somar_saldo_local(material.id, destino.id, quantidade)
+
+    transferencia = TransferenciaEstoque(
+        material_id=material.id,
+        origem_id=origem.id,
+        destino_id=destino.id,
+        qtd=quantidade,
+        usuario_id=usuario_id,
+        observacao=(observacao or "").strip()[:255] or None,
+    )
+
+    db.session.add(transferencia)
+
+    return transferencia
+
+
+def conciliar_locais(material_ids=None):
+    """
+    Leva ao almoxarifado central da obra a diferença entre o
+    saldo_atual e a soma dos locais. Para saldos gravados direto no
+    material: cadastro, importação, cargas e scripts, que devem
+    chamá-la na mesma transação; baixas e transferências não chamam.
+    Trava os materiais ajustados antes das linhas de estoque_local, na
+    mesma ordem das baixas.
+
+    Uma redução maior que o saldo do central levanta ValueError: o que
+    está nos outros locais precisa ser transferido antes.
+
+    Devolve quantos materiais foram ajustados.
+    """
+    soma = select(
+        EstoqueLocal.material_id,
+        func.sum(EstoqueLocal.saldo).label("saldo"),
+    ).group_by(EstoqueLocal.material_id)
+
+    # o filtro vai também dentro da soma: o banco não o leva através do
+    # LEFT JOIN e somaria a tabela inteira
+    if material_ids is not None:
+        material_ids = list(material_ids)
+        soma = soma.where(EstoqueLocal.material_id.in_(material_ids))
+
+    soma = soma.subquery()
+
+    nos_locais = func.coalesce(soma.c.saldo, 0)
+
+    consulta = (
+        select(
+            Material.id,
+            Material.obra_id,
+            Material.nome,
+            Material.saldo_atual - nos_locais,
+        )
+        .outerjoin(soma, soma.c.material_id == Material.id)
+        .where(Material.saldo_atual != nos_locais)
+        .order_by(Material.id)
+        .with_for_update(of=Material)
+    )
+
+    if material_ids is not None:
+        consulta = consulta.where(Material.id.in_(material_ids))
+
+    centrais = {}
+    ajustados = 0
+
+    linhas = db.session.execute(consulta).all()
+
+    for material_id, obra_id, nome, diferenca in linhas:
+        if obra_id not in centrais:
+            centrais[obra_id] = local_central_id(obra_id)
+
+        central_id = centrais[obra_id]
+
+        if diferenca < 0:
+            saldos = _travar_saldos(material_id, [central_id])
+            no_central = saldos.get(central_id, Decimal("0"))
+
+            if no_central + diferenca < 0:
+                raise ValueError(
+                    f"O saldo de {nome} ficaria negativo no almoxarifado "
+                    f"central (disponível: {no_central}). Transfira o "
+                    f"saldo dos outros locais antes de reduzir."
+                )
+
+        _somar_saldo_local(material_id, central_id, diferenca)
+        ajustados += 1
+
+    return ajustados
@@ -0,0 +1,266 @@
+import heapq
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+from sqlalchemy import String, cast, func, literal, select, union_all
+
+from app.extensions import db
+from app.models.entrada import Entrada
+from app.models.entrada_item import EntradaItem
+from app.models.material import Material
+from app.models.solicitacao import Solicitacao
+from app.models.solicitacao_item_entrega import (
+    SolicitacaoItemEntrega,
+)
+from app.services import arquivo_solicitacoes_service
+
+
+TIPO_ENTRADA = "ENTRADA"
+TIPO_SAIDA = "SAIDA"
+
+# Quantas linhas o cursor traz do banco por vez ao exportar.
+TAMANHO_LOTE = 1000
+
+# Window functions chegaram ao SQLite na 3.25.
+SQLITE_VERSAO_WINDOW = (3, 25, 0)
+
+
+def _movimentos(material_id, inicio=None, fim=None):
+    """
+    União das entradas concluídas (positivas) com as entregas de
+    solicitações (negativas) de um material. `fim` é exclusivo.
+    """
+    entradas = (
+        select(
+            Entrada.data_entrada.label("data"),
+            literal(TIPO_ENTRADA).label("tipo"),
+            Entrada.id.label("documento_id"),
+            cast(Entrada.numero_nf, String).label("referencia"),
+            cast(Entrada.nome_fornecedor, String).label("origem"),
+            EntradaItem.qtd.label("quantidade"),
+            literal(0).label("ordem"),
+            EntradaItem.id.label("movimento_id"),
+        )
+        .join(Entrada, Entrada.id == EntradaItem.entrada_id)
+        .where(
+            EntradaItem.material_id == material_id,
+            Entrada.status == "CONCLUIDA",
+        )
+    )
+
+    local = (
+        func.coalesce(Solicitacao.local_torre, "")
+        + " "
+        + func.coalesce(Solicitacao.local_pav, "")
+        + " "
+        + func.coalesce(Solicitacao.local_apto, "")
+    )
+
+    saidas = (
+        select(
+            SolicitacaoItemEntrega.data_entrega.label("data"),
+            literal(TIPO_SAIDA).label("tipo"),
+            Solicitacao.id.label("documento_id"),
+            cast(literal(None), String).label("referencia"),
+            cast(local, String).label("origem"),
+            (-SolicitacaoItemEntrega.qtd).label("quantidade"),
+            literal(1).label("ordem"),
+            SolicitacaoItemEntrega.id.label("movimento_id"),
+        )
+        .join(
+            Solicitacao,
+            Solicitacao.id == SolicitacaoItemEntrega.solicitacao_id,
+        )
+        .where(SolicitacaoItemEntrega.material_id == material_id)
+    )
+
+    if inicio:
+        entradas = entradas.where(Entrada.data_entrada >= inicio)
+        saidas = saidas.where(
+            SolicitacaoItemEntrega.data_entrega >= inicio
+        )
+
+    if fim:
+        entradas = entradas.where(Entrada.data_entrada < fim)
+        saidas = saidas.where(
+            SolicitacaoItemEntrega.data_entrega < fim
+        )
+
+    return union_all(entradas, saidas).subquery("movimentos")
+
+
+def _ordem(linha):
+    return (linha.data, linha.ordem, linha.movimento_id)
+
+
+def _saidas_arquivadas(material_id, inicio=None):
+    """
+    Entregas do material em solicitações já arquivadas, desde `inicio`,
+    no formato das linhas de _movimentos e na mesma ordem. Só lê os
+    arquivos cujas entregas chegam até o período.
+    """
+    linhas = []
+
+    for solicitacao in arquivo_solicitacoes_service.solicitacoes_arquivadas(
+        inicio,
+        campo=arquivo_solicitacoes_service.CAMPO_ENTREGA,
+    ):
+        local = " ".join([
+            solicitacao.local_torre or "",
+            solicitacao.local_pav or "",
+            solicitacao.local_apto or "",
+        ])
+
+        for item in solicitacao.itens:
+            for entrega in item.entregas:
+                if entrega.material_id != material_id:
+                    continue
+
+                if inicio and entrega.data_entrega < inicio:
+                    continue
+
+                linhas.append(SimpleNamespace(
+                    data=entrega.data_entrega,
+                    tipo=TIPO_SAIDA,
+                    documento_id=solicitacao.id,
+                    referencia=None,
+                    origem=local,
+                    quantidade=-Decimal(entrega.qtd),
+                    ordem=1,
+                    movimento_id=entrega.id,
+                ))
+
+    linhas.sort(key=_ordem)
+
+    return linhas
+
+
+def calcular_saldo_inicial(material, inicio, arquivadas=None):
+    """
+    Saldo no começo do período, reconstruído a partir do saldo atual
+    menos tudo o que entrou e saiu desde `inicio`, inclusive as
+    entregas já arquivadas. Assim o kardex sempre fecha com o
+    saldo_atual, mesmo que o saldo tenha sido implantado manualmente
+    no cadastro.
+    """
+    movimentos = _movimentos(material.id, inicio=inicio)
+
+    variacao = db.session.execute(
+        select(func.coalesce(func.sum(movimentos.c.quantidade), 0))
+    ).scalar()
+
+    if arquivadas is None:
+        arquivadas = _saidas_arquivadas(material.id, inicio)
+
+    variacao = Decimal(str(variacao or 0)) + sum(
+        (linha.quantidade for linha in arquivadas),
+        Decimal("0"),
+    )
+
+    return material.saldo_decimal - variacao
+
+
+def suporta_window_functions():
+    dialeto = db.engine.dialect
+
+    if dialeto.name == "sqlite":
+        versao = dialeto.server_version_info or (0,)
+        return tuple(versao) >= SQLITE_VERSAO_WINDOW
+
+    return True
+
+
+def iterar_kardex(material, data_de=None, data_ate=None):
+    """
+    Gera as linhas do kardex em ordem cronológica, com o saldo
+    acumulado após cada movimento.
+
+    O saldo corrido é calculado no banco com SUM() OVER quando o
+    dialeto suporta window functions; caso contrário é acumulado
+    aqui, linha a linha. Nos dois casos o resultado é consumido em
+    lotes (yield_per), sem montar a lista inteira em memória.
+
+    Entregas de solicitações arquivadas no período são intercaladas
+    com as do banco pela data; aí o saldo é sempre acumulado aqui.
+    """
+    fim = data_ate + timedelta(days=1) if data_ate else None
+
+    arquivadas = _saidas_arquivadas(material.id, data_de)
+
+    saldo_inicial = calcular_saldo_inicial(material, data_de, arquivadas)
+
+    arquivadas = [
+        linha
+        for linha in arquivadas
+        if fim is None or linha.data < fim
+    ]
+
+    movimentos = _movimentos(material.id, inicio=data_de, fim=fim)
+
+    ordenacao = (
+        movimentos.c.data,
+        movimentos.c.ordem,
+        movimentos.c.movimento_id,
+    )
+
+    colunas = [
+        movimentos.c.data,
+        movimentos.c.tipo,
+        movimentos.c.documento_id,
+        movimentos.c.referencia,
+        movimentos.c.origem,
+        movimentos.c.quantidade,
+        movimentos.c.ordem,
+        movimentos.c.movimento_id,
+    ]
+
+    usar_window = suporta_window_functions() and not arquivadas
+
+    if usar_window:
+        colunas.append(
+            func.sum(movimentos.c.quantidade)
+            .over(order_by=ordenacao, rows=(None, 0))
+            .label("acumulado")
+        )
+
+    resultado = db.session.execute(
+        select(*colunas).order_by(*ordenacao),
+        execution_options={"yield_per": TAMANHO_LOTE},
+    )
+
+    if arquivadas:
+        resultado = heapq.merge(resultado, arquivadas, key=_ordem)
+
+    acumulado = Decimal("0")
+
+    for linha in resultado:
+        quantidade = Decimal(str(linha.quantidade or 0))
+
+        if usar_window:
+            acumulado = Decimal(str(linha.acumulado or 0))
+        else:
+            acumulado += quantidade
+
+        yield {
+            "data": linha.data,
+            "tipo": linha.tipo,
+            "documento_id": linha.documento_id,
+            "referencia": linha.referencia,
+            "origem": (linha.origem or "").strip(),
+            "entrada": quantidade if quantidade > 0 else None,
+            "saida": -quantidade if quantidade < 0 else None,
+            "saldo": saldo_inicial + acumulado,
+        }
+
+
+def obter_material(material_id):
+    if not material_id:
+        return None
+
+    try:
+        material_id = int(material_id)
+    except (TypeError, ValueError):
+        raise ValueError("Material inválido.")
+
+    return db.session.get(Material, material_id)
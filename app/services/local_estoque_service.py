@@ -0,0 +1,197 @@
+from decimal import Decimal
+
+from sqlalchemy import select, update
+
+from app.extensions import db
+from app.models.local_estoque import EstoqueLocal, LocalEstoque
+from app.models.obra import Obra
+from app.services import obra_service
+
+
+def listar_locais(apenas_ativos=False, obra_id=None):
+    """Locais da obra: o central primeiro, depois por torre e nome."""
+    consulta = select(LocalEstoque)
+
+    if obra_id is not None:
+        consulta = consulta.where(LocalEstoque.obra_id == obra_id)
+
+    if apenas_ativos:
+        consulta = consulta.where(LocalEstoque.ativo.is_(True))
+
+    return db.session.execute(
+        consulta.order_by(
+            LocalEstoque.central.desc(),
+            LocalEstoque.torre.is_(None).desc(),
+            LocalEstoque.torre,
+            LocalEstoque.nome,
+        )
+    ).scalars().all()
+
+
+def _posicoes(nomes):
+    return {nome.strip().lower(): i for i, nome in enumerate(nomes)}
+
+
+def _chave(texto):
+    return (texto or "").strip().lower()
+
+
+def ordenar_por_proximidade(locais, layout, torre, pavimento=None):
+    """
+    Ordena os locais do mais próximo ao mais distante do ponto
+    (torre, pavimento) da obra:
+
+    1. depósitos na mesma torre, do pavimento mais perto ao mais longe;
+    2. locais fora das torres, o central primeiro;
+    3. depósitos de outras torres, pela distância na ordem das torres
+       do layout.
+
+    Empates ficam com o local cadastrado primeiro.
+    """
+    torres = _posicoes(layout["torres"])
+    pavimentos = _posicoes(layout["pavimentos"])
+
+    torre = _chave(torre)
+    pavimento = _chave(pavimento)
+
+    def distancia(posicoes, a, b):
+        if a in posicoes and b in posicoes:
+            return abs(posicoes[a] - posicoes[b])
+
+        # fora do layout: depois dos conhecidos
+        return len(posicoes)
+
+    def chave(local):
+        torre_local = _chave(local.torre)
+
+        if torre_local and torre_local == torre:
+            return (
+                0,
+                distancia(pavimentos, _chave(local.pavimento), pavimento),
+                local.id,
+            )
+
+        if not torre_local:
+            return (1, 0 if local.central else 1, local.id)
+
+        return (2, distancia(torres, torre_local, torre), local.id)
+
+    return sorted(locais, key=chave)
+
+
+def locais_para_entrega(solicitacao):
+    """Locais ativos da obra da solicitação, do mais próximo do local dela."""
+    obra = db.session.get(Obra, solicitacao.obra_id)
+
+    return ordenar_por_proximidade(
+        listar_locais(apenas_ativos=True, obra_id=solicitacao.obra_id),
+        obra_service.obter_layout(obra),
+        solicitacao.local_torre,
+        solicitacao.local_pav,
+    )
+
+
+def saldos_por_local(material_id):
+    """[(local, saldo)] do material, só os locais com saldo."""
+    linhas = db.session.execute(
+        select(LocalEstoque, EstoqueLocal.saldo)
+        .join(EstoqueLocal, EstoqueLocal.local_id == LocalEstoque.id)
+        .where(
+            EstoqueLocal.material_id == material_id,
+            EstoqueLocal.saldo != 0,
+        )
+        .order_by(LocalEstoque.central.desc(), LocalEstoque.nome)
+    ).all()
+
+    return [(local, Decimal(saldo or 0)) for local, saldo in linhas]
+
+
+def _validar(local, nome, torre, pavimento, obra):
+    nome = (nome or "").strip()
+
+    if not nome:
+        raise ValueError("Informe o nome do local.")
+
+    repetido = db.session.execute(
+        select(LocalEstoque.id).where(
+            LocalEstoque.obra_id == obra.id,
+            db.func.lower(LocalEstoque.nome) == nome.lower(),
+            LocalEstoque.id != (local.id if local else 0),
+        )
+    ).first()
+
+    if repetido:
+        raise ValueError(f'Já existe um local chamado "{nome}".')
+
+    torre = (torre or "").strip() or None
+    pavimento = (pavimento or "").strip() or None
+
+    layout = obra_service.obter_layout(obra)
+
+    if torre and torre not in layout["torres"]:
+        raise ValueError(f"A torre {torre} não existe no layout da obra.")
+
+    if pavimento and not torre:
+        raise ValueError("Informe a torre do pavimento.")
+
+    if pavimento and pavimento not in layout["pavimentos"]:
+        raise ValueError(
+            f"O pavimento {pavimento} não existe no layout da obra."
+        )
+
+    return nome[:80], torre, pavimento
+
+
+def salvar_local(local, obra, nome, torre, pavimento, central, ativo):
+    """
+    Cria (local=None) ou altera um local. Marcar um local como central
+    tira a marca do anterior; a obra nunca fica sem central.
+    """
+    nome, torre, pavimento = _validar(local, nome, torre, pavimento, obra)
+
+    if local is None:
+        local = LocalEstoque(obra_id=obra.id)
+        db.session.add(local)
+
+    if local.central and not central:
+        raise ValueError(
+            "Marque outro local como central antes de desmarcar este."
+        )
+
+    if central and not ativo:
+        raise ValueError("O almoxarifado central não pode ser inativado.")
+
+    if local.id and local.ativo and not ativo:
+        com_saldo = db.session.execute(
+            select(EstoqueLocal.material_id).where(
+                EstoqueLocal.local_id == local.id,
+                EstoqueLocal.saldo != 0,
+            ).limit(1)
+        ).first()
+
+        if com_saldo:
+            raise ValueError(
+                "Transfira o saldo do local antes de inativá-lo."
+            )
+
+    local.nome = nome
+    local.torre = torre
+    local.pavimento = pavimento
+    local.ativo = ativo
+
+    if central and not local.central:
+        db.session.execute(
+            update(LocalEstoque)
+            .where(
+                LocalEstoque.obra_id == obra.id,
+                LocalEstoque.central.is_(True),
+            )
+            .values(central=False)
+            .execution_options(synchronize_session="fetch")
+        )
+
+        local.central = True
+
+    db.session.commit()
+
+    return local
@@ -0,0 +1,186 @@
+import hashlib
+import json
+from decimal import Decimal
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import contains_eager
+
+from app.extensions import db
+from app.models.categoria import Categoria
+from app.models.material import Material
+
+
+POR_PAGINA = 50
+POR_PAGINA_MAXIMO = 200
+
+# Abaixo disso o índice de trigramas não ajuda (cada trigrama tem 3
+# letras); termos curtos viram busca por prefixo, que usa btree.
+TAMANHO_MINIMO_TRIGRAMA = 3
+
+ORDENACOES = {
+    "nome": Material.nome,
+    "codigo": Material.codigo,
+    "categoria": Categoria.nome,
+    "saldo": Material.saldo_atual,
+}
+
+SEM_CATEGORIA = -1
+
+
+def _escapar_like(termo):
+    return (
+        termo.replace("\\", "\\\\")
+        .replace("%", "\\%")
+        .replace("_", "\\_")
+    )
+
+
+def filtro_busca(termo):
+    """
+    Condição de busca por descrição ou código.
+
+    No PostgreSQL o ILIKE '%termo%' é atendido pelos índices GIN de
+    trigramas (u010); termos com menos de três letras procuram só pelo
+    começo da descrição ou do código, atendidos pelos índices
+    text_pattern_ops.
+    """
+    termo = (termo or "").strip()
+
+    if not termo:
+        return None
+
+    padrao = _escapar_like(termo)
+
+    if len(termo) < TAMANHO_MINIMO_TRIGRAMA:
+        return or_(
+            func.lower(Material.nome).like(
+                f"{padrao.lower()}%", escape="\\"
+            ),
+            Material.codigo.like(f"{padrao}%", escape="\\"),
+        )
+
+    return or_(
+        Material.nome.ilike(f"%{padrao}%", escape="\\"),
+        Material.codigo.ilike(f"%{padrao}%", escape="\\"),
+    )
+
+
+def _filtros(busca):
+    filtros = [Material.ativo.is_(True)]
+
+    condicao = filtro_busca(busca)
+
+    if condicao is not None:
+        filtros.append(condicao)
+
+    return filtros
+
+
+def listar_materiais(
+    busca="",
+    categoria_id=0,
+    ordem="nome",
+    direcao="asc",
+    pagina=1,
+    por_pagina=POR_PAGINA,
+):
+    """
+    Página de materiais ativos, ordenada no banco.
+    Devolve o objeto de paginação do Flask-SQLAlchemy.
+    """
+    coluna = ORDENACOES.get(ordem, Material.nome)
+    coluna = coluna.desc() if direcao == "desc" else coluna.asc()
+
+    consulta = (
+        select(Material)
+        .outerjoin(Material.categoria)
+        .options(contains_eager(Material.categoria))
+        .where(*_filtros(busca))
+        # desempate estável para a paginação não repetir linhas
+        .order_by(coluna, Material.id)
+    )
+
+    if categoria_id == SEM_CATEGORIA:
+        consulta = consulta.where(Material.categoria_id.is_(None))
+    elif categoria_id:
+        consulta = consulta.where(Material.categoria_id == categoria_id)
+
+    return db.paginate(
+        consulta,
+        page=pagina,
+        per_page=min(por_pagina or POR_PAGINA, POR_PAGINA_MAXIMO),
+        error_out=False,
+    )
+
+
+def contar_por_categoria(busca=""):
+    """
+    Facetas de categoria para a busca atual, num único GROUP BY.
+    Só aparecem categorias que têm material no resultado.
+    """
+    linhas = db.session.execute(
+        select(
+            Material.categoria_id,
+            Categoria.nome,
+            func.count(Material.id),
+        )
+        .outerjoin(Categoria, Categoria.id == Material.categoria_id)
+        .where(*_filtros(busca))
+        .group_by(Material.categoria_id, Categoria.nome)
+        .order_by(Categoria.nome)
+    ).all()
+
+    return [
+        {
+            "id": categoria_id or SEM_CATEGORIA,
+            "nome": nome or "Sem categoria",
+            "total": total,
+        }
+        for categoria_id, nome, total in linhas
+    ]
+
+
+# Ordem das colunas de cada material no catálogo offline.
+COLUNAS_CATALOGO = ["id", "codigo", "nome", "unidade", "disponivel"]
+
+
+def catalogo_compacto():
+    """
+    Catálogo de materiais ativos para o modo offline do app: uma lista
+    por material, na ordem de COLUNAS_CATALOGO, e uma versão (hash do
+    conteúdo) usada como ETag. O aparelho só baixa de novo quando algum
+    material ou saldo disponível muda.
+    """
+    linhas = db.session.execute(
+        select(
+            Material.id,
+            Material.codigo,
+            Material.nome,
+            Material.unidade,
+            Material.saldo_atual,
+            Material.reservado_atual,
+        )
+        .where(Material.ativo.is_(True))
+        .order_by(Material.nome, Material.id)
+    )
+
+    materiais = [
+        [
+            id,
+            codigo or "",
+            nome,
+            unidade or "",
+            float(Decimal(saldo or 0) - Decimal(reservado or 0)),
+        ]
+        for id, codigo, nome, unidade, saldo, reservado in linhas
+    ]
+
+    conteudo = json.dumps(
+        materiais,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+
+    versao = hashlib.sha1(conteudo.encode()).hexdigest()[:16]
+
+    return versao, materiais
@@ -0,0 +1,583 @@
+import csv
+import io
+import unicodedata
+from decimal import Decimal, InvalidOperation
+
+from openpyxl import Workbook, load_workbook
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import escopo_obra
+from app.extensions import db
+from app.models.categoria import Categoria
+from app.models.material import Material
+from app.services import (
+    codigo_material_service,
+    estoque_service,
+    obra_service,
+)
+
+
+TAMANHO_LOTE = 1000
+
+# Só as primeiras mensagens de erro voltam para a tela.
+LIMITE_ERROS = 200
+
+COLUNAS_EXPORTACAO = [
+    "codigo",
+    "nome",
+    "unidade",
+    "categoria",
+    "estoque_minimo",
+    "saldo_atual",
+    "ativo",
+]
+
+# Cabeçalhos aceitos na importação (já sem acento e em minúsculas).
+APELIDOS_COLUNAS = {
+    "codigo": "codigo",
+    "cod": "codigo",
+    "nome": "nome",
+    "descricao": "nome",
+    "material": "nome",
+    "unidade": "unidade",
+    "un": "unidade",
+    "unid": "unidade",
+    "categoria": "categoria",
+    "estoque_minimo": "estoque_minimo",
+    "estoque minimo": "estoque_minimo",
+    "minimo": "estoque_minimo",
+    "saldo_atual": "saldo_atual",
+    "saldo atual": "saldo_atual",
+    "saldo": "saldo_atual",
+    "ativo": "ativo",
+}
+
+VALORES_FALSO = {"0", "n", "nao", "false", "f", "inativo"}
+
+
+def _normalizar_texto(valor):
+    texto = unicodedata.normalize("NFKD", str(valor or ""))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return texto.strip().lower()
+
+
+def _decimal(valor, nome_campo):
+    if valor is None or str(valor).strip() == "":
+        return Decimal("0")
+
+    texto = str(valor).strip()
+
+    # célula numérica do XLSX vem pronta; texto pode ser
+    # "1.234,56" (planilha pt-BR) ou "1234.56"
+    if not isinstance(valor, (int, float, Decimal)) and "," in texto:
+        texto = texto.replace(".", "").replace(",", ".")
+
+    try:
+        numero = Decimal(texto)
+    except InvalidOperation:
+        raise ValueError(f"Valor inválido para {nome_campo}.")
+
+    if not numero.is_finite():
+        raise ValueError(f"Valor inválido para {nome_campo}.")
+
+    if numero < 0:
+        raise ValueError(f"{nome_campo} não pode ser negativo.")
+
+    return numero
+
+
+def _formatar_decimal(valor):
+    return str(Decimal(valor or 0)).replace(".", ",")
+
+
+# ------------------------------------------------------------------
+# Leitura
+# ------------------------------------------------------------------
+def _mapear_cabecalho(cabecalho):
+    mapa = {}
+
+    for indice, nome in enumerate(cabecalho):
+        coluna = APELIDOS_COLUNAS.get(_normalizar_texto(nome))
+
+        if coluna and coluna not in mapa:
+            mapa[coluna] = indice
+
+    if "nome" not in mapa:
+        raise ValueError(
+            "A planilha precisa ter a coluna nome (ou descrição)."
+        )
+
+    return mapa
+
+
+def _linhas_csv(arquivo):
+    texto = io.TextIOWrapper(arquivo, encoding="utf-8-sig", newline="")
+
+    amostra = texto.read(4096)
+    texto.seek(0)
+
+    try:
+        delimitador = csv.Sniffer().sniff(
+            amostra,
+            delimiters=";,\t",
+        ).delimiter
+    except csv.Error:
+        delimitador = ";"
+
+    yield from csv.reader(texto, delimiter=delimitador)
+
+
+def _linhas_xlsx(arquivo):
+    # read_only: o openpyxl lê a planilha em fluxo, sem montar as células
+    wb = load_workbook(arquivo, read_only=True, data_only=True)
+
+    try:
+        for linha in wb.active.iter_rows(values_only=True):
+            yield list(linha)
+    finally:
+        wb.close()
+
+
+def ler_planilha(arquivo, nome_arquivo):
+    """
+    Gera (numero_da_linha, dict) para cada linha da planilha,
+    já com as colunas normalizadas.
+    """
+    nome_arquivo = (nome_arquivo or "").lower()
+
+    if nome_arquivo.endswith(".xlsx"):
+        linhas = _linhas_xlsx(arquivo)
+    elif nome_arquivo.endswith(".csv") or nome_arquivo.endswith(".txt"):
+        linhas = _linhas_csv(arquivo)
+    else:
+        raise ValueError("Envie um arquivo .csv ou .xlsx.")
+
+    try:
+        cabecalho = next(linhas)
+    except StopIteration:
+        raise ValueError("O arquivo está vazio.")
+
+    mapa = _mapear_cabecalho(cabecalho)
+
+    for numero, valores in enumerate(linhas, start=2):
+        if not any(
+            valor is not None and str(valor).strip()
+            for valor in valores
+        ):
+            continue
+
+        yield numero, {
+            coluna: (
+                valores[indice]
+                if indice < len(valores)
+                else None
+            )
+            for coluna, indice in mapa.items()
+        }
+
+
+def _em_lotes(iteravel, tamanho):
+    lote = []
+
+    for elemento in iteravel:
+        lote.append(elemento)
+
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+
+    if lote:
+        yield lote
+
+
+# ------------------------------------------------------------------
+# Validação e gravação
+# ------------------------------------------------------------------
+def _validar_linha(dados):
+    nome = str(dados.get("nome") or "").strip()
+
+    if not nome:
+        raise ValueError("Informe o nome do material.")
+
+    unidade = str(dados.get("unidade") or "").strip()
+
+    if not unidade:
+        raise ValueError("Informe a unidade.")
+
+    codigo = dados.get("codigo")
+
+    if isinstance(codigo, float) and codigo.is_integer():
+        codigo = int(codigo)
+
+    codigo = str(codigo or "").strip()
+
+    if codigo.isdigit():
+        codigo = codigo_material_service.formatar_codigo(codigo)
+
+    if len(codigo) > 20:
+        raise ValueError("Código com mais de 20 caracteres.")
+
+    ativo = dados.get("ativo")
+    ativo = (
+        True
+        if ativo is None or str(ativo).strip() == ""
+        else _normalizar_texto(ativo) not in VALORES_FALSO
+    )
+
+    return {
+        "codigo": codigo,
+        "nome": nome[:120],
+        "unidade": unidade[:10],
+        "categoria": str(dados.get("categoria") or "").strip(),
+        "estoque_minimo": _decimal(
+            dados.get("estoque_minimo"),
+            "estoque mínimo",
+        ),
+        "saldo_atual": _decimal(
+            dados.get("saldo_atual"),
+            "saldo atual",
+        ),
+        "ativo": ativo,
+    }
+
+
+def _resolver_categorias(nomes):
+    """
+    Devolve {nome normalizado: id}, criando de uma vez só as
+    categorias que ainda não existem.
+    """
+    chaves = {_normalizar_texto(nome): nome for nome in nomes if nome}
+
+    if not chaves:
+        return {}
+
+    # comparação sem acento dos dois lados ("Elétrica" = "Eletrica"),
+    # que o banco não faz; as categorias são poucas
+    mapa = {}
+
+    for categoria_id, nome in db.session.execute(
+        select(Categoria.id, Categoria.nome).order_by(Categoria.id)
+    ):
+        mapa.setdefault(_normalizar_texto(nome), categoria_id)
+
+    novas = [
+        Categoria(nome=nome[:80])
+        for chave, nome in chaves.items()
+        if chave not in mapa
+    ]
+
+    if novas:
+        db.session.add_all(novas)
+        db.session.flush()
+
+        for categoria in novas:
+            mapa[_normalizar_texto(categoria.nome)] = categoria.id
+
+    return mapa
+
+
+def _insert_dialeto():
+    if db.engine.dialect.name == "postgresql":
+        return postgresql.insert
+
+    if db.engine.dialect.name == "sqlite":
+        return sqlite.insert
+
+    raise RuntimeError(
+        "Importação em lote disponível apenas para "
+        "PostgreSQL e SQLite."
+    )
+
+
+def _gravar_lote(registros, atualizar=True):
+    """
+    INSERT ... ON CONFLICT (obra_id, codigo) DO UPDATE para o lote
+    inteiro.
+    O comando é sempre o mesmo (fica no cache de compilação) e as
+    linhas vão como lista de parâmetros, que o SQLAlchemy envia num
+    INSERT de múltiplos VALUES.
+
+    O saldo só é gravado em materiais novos: a importação de catálogo
+    não sobrescreve o estoque de quem já existe.
+
+    Sem `atualizar` (códigos alocados pelo sistema), o conflito não
+    altera nada e a linha fica de fora. Devolve os códigos gravados.
+    """
+    insert = _insert_dialeto()
+
+    comando = insert(Material.__table__)
+
+    if atualizar:
+        comando = comando.on_conflict_do_update(
+            index_elements=[Material.obra_id, Material.codigo],
+            set_={
+                "nome": comando.excluded.nome,
+                "unidade": comando.excluded.unidade,
+                "categoria_id": comando.excluded.categoria_id,
+                "estoque_minimo": comando.excluded.estoque_minimo,
+                "ativo": comando.excluded.ativo,
+            },
+        )
+
+    else:
+        comando = comando.on_conflict_do_nothing(
+            index_elements=[Material.obra_id, Material.codigo],
+        )
+
+    return set(
+        db.session.execute(
+            comando.returning(Material.codigo),
+            registros,
+        ).scalars().all()
+    )
+
+
+def _gravar_validas(obra_id, validas, atualizar=True):
+    """
+    Grava as linhas de `validas` ({codigo: (numero, registro)}) e leva
+    o saldo dos materiais novos ao almoxarifado central. Devolve os
+    códigos gravados; o commit fica com o chamador.
+    """
+    categorias = _resolver_categorias(
+        registro["categoria"]
+        for _, registro in validas.values()
+    )
+
+    registros = [
+        {
+            "obra_id": obra_id,
+            "codigo": registro["codigo"],
+            "nome": registro["nome"],
+            "unidade": registro["unidade"],
+            "categoria_id": categorias.get(
+                _normalizar_texto(registro["categoria"])
+            ),
+            "estoque_minimo": registro["estoque_minimo"],
+            "saldo_atual": registro["saldo_atual"],
+            "reservado_atual": Decimal("0"),
+            "ativo": registro["ativo"],
+        }
+        for _, registro in validas.values()
+    ]
+
+    gravados = _gravar_lote(registros, atualizar)
+
+    # o saldo dos materiais novos fica no almoxarifado central
+    estoque_service.conciliar_locais(
+        db.session.execute(
+            select(Material.id).where(
+                Material.obra_id == obra_id,
+                Material.codigo.in_(list(gravados)),
+            )
+        ).scalars().all()
+    )
+
+    return gravados
+
+
+def importar_materiais(arquivo, nome_arquivo, tamanho_lote=TAMANHO_LOTE):
+    """
+    Importa (ou atualiza pelo código) o catálogo de materiais.
+
+    Linhas inválidas são ignoradas e relatadas pelo número da linha;
+    cada lote válido é gravado e confirmado separadamente.
+
+    As linhas com código vão primeiro; as sem código só recebem código
+    depois que o alocador passou do maior código numérico da planilha,
+    e um código alocado nunca atualiza um material existente.
+    """
+    resultado = {
+        "linhas": 0,
+        "gravadas": 0,
+        "erros": [],
+        "total_erros": 0,
+    }
+
+    def registrar_erro(numero, mensagem):
+        resultado["total_erros"] += 1
+
+        if len(resultado["erros"]) < LIMITE_ERROS:
+            resultado["erros"].append((numero, mensagem))
+
+    maior_codigo = 0
+    sem_codigo = []
+
+    # a obra selecionada; em scripts, a obra padrão
+    obra_id = escopo_obra.obra_atual_id() or obra_service.obra_padrao_id()
+
+    linhas = ler_planilha(arquivo, nome_arquivo)
+
+    for lote in _em_lotes(linhas, tamanho_lote):
+        validas = {}
+
+        for numero, dados in lote:
+            resultado["linhas"] += 1
+
+            try:
+                registro = _validar_linha(dados)
+            except ValueError as erro:
+                registrar_erro(numero, str(erro))
+                continue
+
+            if not registro["codigo"]:
+                sem_codigo.append((numero, registro))
+                continue
+
+            if registro["codigo"] in validas:
+                registrar_erro(
+                    validas[registro["codigo"]][0],
+                    f"Código {registro['codigo']} repetido na "
+                    f"linha {numero}; vale a última ocorrência.",
+                )
+
+            validas[registro["codigo"]] = (numero, registro)
+
+        if not validas:
+            continue
+
+        for codigo in validas:
+            if codigo.isdigit():
+                maior_codigo = max(maior_codigo, int(codigo))
+
+        try:
+            gravados = _gravar_validas(obra_id, validas)
+            db.session.commit()
+
+        except Exception:
+            db.session.rollback()
+            raise
+
+        resultado["gravadas"] += len(gravados)
+
+    if not sem_codigo:
+        return resultado
+
+    try:
+        # códigos numéricos da planilha passam à frente do alocador
+        # antes de ele entregar o primeiro código
+        if maior_codigo:
+            codigo_material_service.registrar_codigo_manual(
+                str(maior_codigo)
+            )
+
+        db.session.commit()
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+    for lote in _em_lotes(sem_codigo, tamanho_lote):
+        try:
+            codigos = codigo_material_service.alocar_codigos(len(lote))
+            validas = {}
+
+            for codigo, (numero, registro) in zip(codigos, lote):
+                registro["codigo"] = codigo
+                validas[codigo] = (numero, registro)
+
+            gravados = _gravar_validas(obra_id, validas, atualizar=False)
+            db.session.commit()
+
+        except Exception:
+            db.session.rollback()
+            raise
+
+        # código alocado que já existia (carga feita por fora do
+        # alocador): a linha não sobrescreve o material
+        colisoes = [
+            (numero, codigo)
+            for codigo, (numero, _) in validas.items()
+            if codigo not in gravados
+        ]
+
+        for numero, codigo in colisoes:
+            registrar_erro(
+                numero,
+                f"O código {codigo} alocado já está em uso; linha não "
+                f"importada, envie-a de novo.",
+            )
+
+        if colisoes:
+            try:
+                codigo_material_service.sincronizar_com_cadastro()
+                db.session.commit()
+
+            except Exception:
+                db.session.rollback()
+                raise
+
+        resultado["gravadas"] += len(gravados)
+
+    return resultado
+
+
+# ------------------------------------------------------------------
+# Exportação
+# ------------------------------------------------------------------
+def iterar_catalogo():
+    """
+    Linhas do catálogo para exportação, lidas do banco em lotes.
+    """
+    resultado = db.session.execute(
+        select(
+            Material.codigo,
+            Material.nome,
+            Material.unidade,
+            Categoria.nome,
+            Material.estoque_minimo,
+            Material.saldo_atual,
+            Material.ativo,
+        )
+        .outerjoin(Categoria, Categoria.id == Material.categoria_id)
+        .order_by(Material.codigo),
+        execution_options={"yield_per": TAMANHO_LOTE},
+    )
+
+    for codigo, nome, unidade, categoria, minimo, saldo, ativo in resultado:
+        yield [
+            codigo,
+            nome,
+            unidade,
+            categoria or "",
+            _formatar_decimal(minimo),
+            _formatar_decimal(saldo),
+            "sim" if ativo else "nao",
+        ]
+
+
+def gerar_csv_catalogo():
+    """
+    Gera o CSV (separador ";", padrão do Excel em português) em
+    pedaços, para ser enviado enquanto é lido do banco.
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=";")
+
+    buffer.write("﻿")
+    escritor.writerow(COLUNAS_EXPORTACAO)
+
+    for numero, linha in enumerate(iterar_catalogo(), start=1):
+        escritor.writerow(linha)
+
+        if numero % TAMANHO_LOTE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def gerar_xlsx_catalogo():
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Materiais")
+    ws.append(COLUNAS_EXPORTACAO)
+
+    for linha in iterar_catalogo():
+        ws.append(linha)
+
+    arquivo = io.BytesIO()
+    wb.save(arquivo)
+    arquivo.seek(0)
+
+    return arquivo
@@ -0,0 +1,316 @@
+import threading
+
+from sqlalchemy import exists, select
+
+from app.extensions import db
+from app.models.local_estoque import NOME_LOCAL_CENTRAL, LocalEstoque
+from app.models.obra import (
+    Obra,
+    ObraPavimento,
+    ObraTorre,
+    ObraUnidade,
+    usuario_obra,
+)
+
+
+NOME_OBRA_PADRAO = "Aruana Garden"
+
+TAMANHO_NOME = 20
+
+# {obra_id: (layout_versao, layout)}; cada processo guarda o seu e
+# descarta quando a versão gravada na obra muda
+_layouts = {}
+_lock_layouts = threading.Lock()
+
+
+def layout_padrao():
+    """
+    Layout da primeira obra (o que era fixo no código): 6 torres,
+    Térreo, Pav 1 a 7 e Cobertura, 8 apartamentos por pavimento.
+    """
+    torres = [f"{i:02d}" for i in range(1, 7)]
+
+    pavimentos = [("Térreo", [f"{i:02d}" for i in range(1, 9)])]
+    pavimentos += [
+        (f"Pav {p}", [f"{p}{i:02d}" for i in range(1, 9)])
+        for p in range(1, 8)
+    ]
+    pavimentos.append(("Cobertura", []))
+
+    return torres, pavimentos
+
+
+# ------------------------------------------------------------------
+# Layout: texto do formulário <-> tabelas
+# ------------------------------------------------------------------
+def _nomes(texto, separador):
+    nomes = []
+
+    for parte in (texto or "").replace("\r", "").split(separador):
+        nome = parte.strip()
+
+        if not nome:
+            continue
+
+        if len(nome) > TAMANHO_NOME:
+            raise ValueError(
+                f'"{nome}" tem mais de {TAMANHO_NOME} caracteres.'
+            )
+
+        if nome in nomes:
+            raise ValueError(f'"{nome}" aparece repetido.')
+
+        nomes.append(nome)
+
+    return nomes
+
+
+def ler_torres(texto):
+    """Uma torre por linha (ou separadas por vírgula)."""
+    torres = _nomes((texto or "").replace("\n", ","), ",")
+
+    if not torres:
+        raise ValueError("Informe pelo menos uma torre.")
+
+    return torres
+
+
+def ler_pavimentos(texto):
+    """
+    Um pavimento por linha, com as unidades depois de dois-pontos:
+
+        Térreo: 01, 02, 03
+        Pav 1: 101, 102, 103
+        Cobertura
+    """
+    pavimentos = []
+    nomes = set()
+
+    for numero, linha in enumerate((texto or "").splitlines(), start=1):
+        if not linha.strip():
+            continue
+
+        nome, _, unidades = linha.partition(":")
+        nome = nome.strip()
+
+        if not nome:
+            raise ValueError(f"Linha {numero}: informe o nome do pavimento.")
+
+        if len(nome) > TAMANHO_NOME:
+            raise ValueError(
+                f'Linha {numero}: "{nome}" tem mais de '
+                f"{TAMANHO_NOME} caracteres."
+            )
+
+        if nome in nomes:
+            raise ValueError(f'Pavimento "{nome}" aparece repetido.')
+
+        try:
+            unidades = _nomes(unidades, ",")
+        except ValueError as erro:
+            raise ValueError(f"Linha {numero}: {erro}") from None
+
+        nomes.add(nome)
+        pavimentos.append((nome, unidades))
+
+    if not pavimentos:
+        raise ValueError("Informe pelo menos um pavimento.")
+
+    return pavimentos
+
+
+def texto_torres(obra):
+    return "\n".join(torre.nome for torre in obra.torres)
+
+
+def texto_pavimentos(obra):
+    return "\n".join(
+        pavimento.nome
+        + (
+            ": " + ", ".join(unidade.nome for unidade in pavimento.unidades)
+            if pavimento.unidades
+            else ""
+        )
+        for pavimento in obra.pavimentos
+    )
+
+
+def _gravar_layout(obra, torres, pavimentos):
+    # o delete-orphan apaga as linhas antigas no flush; o flush antes
+    # das novas evita conflito de nome com elas
+    obra.torres = []
+    obra.pavimentos = []
+    db.session.flush()
+
+    obra.torres = [
+        ObraTorre(nome=nome, ordem=ordem)
+        for ordem, nome in enumerate(torres)
+    ]
+
+    obra.pavimentos = [
+        ObraPavimento(
+            nome=nome,
+            ordem=ordem,
+            unidades=[
+                ObraUnidade(nome=unidade, ordem=posicao)
+                for posicao, unidade in enumerate(unidades)
+            ],
+        )
+        for ordem, (nome, unidades) in enumerate(pavimentos)
+    ]
+
+    obra.layout_versao = (obra.layout_versao or 0) + 1
+
+
+def _validar_nome(nome, obra_id=None):
+    nome = (nome or "").strip()
+
+    if not nome:
+        raise ValueError("Informe o nome da obra.")
+
+    repetida = db.session.execute(
+        select(Obra.id).where(
+            db.func.lower(Obra.nome) == nome.lower(),
+            Obra.id != (obra_id or 0),
+        )
+    ).first()
+
+    if repetida:
+        raise ValueError(f'Já existe uma obra chamada "{nome}".')
+
+    return nome[:120]
+
+
+def criar_obra(nome, torres, pavimentos):
+    obra = Obra(nome=_validar_nome(nome), ativo=True, layout_versao=0)
+
+    db.session.add(obra)
+
+    _gravar_layout(obra, torres, pavimentos)
+
+    db.session.add(
+        LocalEstoque(obra_id=obra.id, nome=NOME_LOCAL_CENTRAL, central=True)
+    )
+
+    db.session.commit()
+
+    return obra
+
+
+def atualizar_obra(obra, nome, ativo, torres, pavimentos):
+    obra.nome = _validar_nome(nome, obra.id)
+    obra.ativo = ativo
+
+    _gravar_layout(obra, torres, pavimentos)
+
+    db.session.commit()
+
+    return obra
+
+
+def obter_layout(obra):
+    """
+    Torres, pavimentos e unidades da obra, montados uma vez por
+    processo e reaproveitados enquanto obra.layout_versao não mudar.
+    """
+    with _lock_layouts:
+        guardado = _layouts.get(obra.id)
+
+    if guardado and guardado[0] == obra.layout_versao:
+        return guardado[1]
+
+    torres = db.session.execute(
+        select(ObraTorre.nome)
+        .where(ObraTorre.obra_id == obra.id)
+        .order_by(ObraTorre.ordem)
+    ).scalars().all()
+
+    linhas = db.session.execute(
+        select(ObraPavimento.nome, ObraUnidade.nome)
+        .outerjoin(ObraUnidade, ObraUnidade.pavimento_id == ObraPavimento.id)
+        .where(ObraPavimento.obra_id == obra.id)
+        .order_by(ObraPavimento.ordem, ObraUnidade.ordem)
+    ).all()
+
+    unidades = {}
+
+    for pavimento, unidade in linhas:
+        unidades.setdefault(pavimento, [])
+
+        if unidade is not None:
+            unidades[pavimento].append(unidade)
+
+    layout = {
+        "torres": list(torres),
+        "pavimentos": list(unidades),
+        "unidades": unidades,
+    }
+
+    with _lock_layouts:
+        _layouts[obra.id] = (obra.layout_versao, layout)
+
+    return layout
+
+
+# ------------------------------------------------------------------
+# Obras do usuário
+# ------------------------------------------------------------------
+def _permitida(usuario_id):
+    restrito = exists().where(usuario_obra.c.usuario_id == usuario_id)
+
+    liberada = exists().where(
+        usuario_obra.c.usuario_id == usuario_id,
+        usuario_obra.c.obra_id == Obra.id,
+    )
+
+    return ~restrito | liberada
+
+
+def obras_do_usuario(usuario):
+    return db.session.execute(
+        select(Obra)
+        .where(Obra.ativo.is_(True), _permitida(usuario.id))
+        .order_by(Obra.nome)
+    ).scalars().all()
+
+
+def obra_para_usuario(usuario, obra_id=None):
+    """
+    A obra `obra_id`, se estiver ativa e o usuário puder usá-la; senão
+    a primeira a que ele tem acesso. None se não houver nenhuma.
+    """
+    consulta = (
+        select(Obra)
+        .where(Obra.ativo.is_(True), _permitida(usuario.id))
+    )
+
+    if obra_id:
+        obra = db.session.execute(
+            consulta.where(Obra.id == obra_id)
+        ).scalar()
+
+        if obra is not None:
+            return obra
+
+    return db.session.execute(
+        consulta.order_by(Obra.id).limit(1)
+    ).scalar()
+
+
+def obra_padrao_id():
+    """A primeira obra ativa: a dos dados de antes das obras."""
+    return db.session.execute(
+        select(db.func.min(Obra.id)).where(Obra.ativo.is_(True))
+    ).scalar()
+
+
+def listar_obras():
+    return Obra.query.order_by(Obra.ativo.desc(), Obra.nome).all()
+
+
+def definir_obras_do_usuario(usuario, obra_ids):
+    ids = {int(obra_id) for obra_id in obra_ids if str(obra_id).isdigit()}
+
+    usuario.obras = (
+        Obra.query.filter(Obra.id.in_(ids)).all() if ids else []
+    )
@@ -0,0 +1,268 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import delete, func, insert, select
+
+from app.extensions import db
+from app.models.material import Material
+from app.models.material_previsao import MaterialPrevisao
+from app.models.solicitacao_item_entrega import (
+    SolicitacaoItemEntrega,
+)
+
+
+def carregar_consumo_diario(material_ids, inicio, dias):
+    """
+    Monta a matriz materiais x dias com a quantidade entregue em cada
+    dia, a partir de um único GROUP BY no banco.
+    """
+    posicao = {
+        material_id: indice
+        for indice, material_id in enumerate(material_ids)
+    }
+
+    matriz = np.zeros((len(material_ids), dias), dtype=np.float64)
+
+    dia = func.date(SolicitacaoItemEntrega.data_entrega)
+
+    linhas = db.session.execute(
+        select(
+            SolicitacaoItemEntrega.material_id,
+            dia.label("dia"),
+            func.sum(SolicitacaoItemEntrega.qtd).label("total"),
+        )
+        .where(
+            SolicitacaoItemEntrega.data_entrega
+            >= datetime.combine(inicio, datetime.min.time())
+        )
+        .group_by(SolicitacaoItemEntrega.material_id, dia)
+    ).all()
+
+    if not linhas:
+        return matriz
+
+    linhas_validas = [
+        linha
+        for linha in linhas
+        if linha.material_id in posicao
+    ]
+
+    indices_material = np.fromiter(
+        (posicao[linha.material_id] for linha in linhas_validas),
+        dtype=np.intp,
+        count=len(linhas_validas),
+    )
+
+    indices_dia = np.fromiter(
+        (_dias_desde(inicio, linha.dia) for linha in linhas_validas),
+        dtype=np.intp,
+        count=len(linhas_validas),
+    )
+
+    totais = np.fromiter(
+        (float(linha.total or 0) for linha in linhas_validas),
+        dtype=np.float64,
+        count=len(linhas_validas),
+    )
+
+    dentro = (indices_dia >= 0) & (indices_dia < dias)
+
+    np.add.at(
+        matriz,
+        (indices_material[dentro], indices_dia[dentro]),
+        totais[dentro],
+    )
+
+    return matriz
+
+
+def _dias_desde(inicio, valor):
+    # SQLite devolve date() como texto; Postgres como date.
+    if isinstance(valor, str):
+        valor = date.fromisoformat(valor[:10])
+
+    if isinstance(valor, datetime):
+        valor = valor.date()
+
+    return (valor - inicio).days
+
+
+def calcular_indicadores(
+    matriz,
+    disponivel,
+    janela_media,
+    alpha,
+    prazo_reposicao,
+    fator_seguranca,
+):
+    """
+    Calcula os indicadores de todos os materiais de uma vez, operando
+    sobre a matriz inteira (uma linha por material).
+
+    - média móvel: média dos últimos `janela_media` dias;
+    - suavização exponencial: pesos alpha * (1 - alpha)^k aplicados
+      do dia mais recente para trás, num único produto matricial;
+    - ponto de reposição: consumo no prazo de reposição mais estoque
+      de segurança (fator * desvio * raiz do prazo);
+    - dias de cobertura: disponível / consumo suavizado.
+    """
+    dias = matriz.shape[1]
+    janela = matriz[:, -min(janela_media, dias):]
+
+    media = janela.mean(axis=1)
+    desvio = janela.std(axis=1)
+
+    idade = np.arange(dias - 1, -1, -1, dtype=np.float64)
+    pesos = alpha * np.power(1.0 - alpha, idade)
+    pesos /= pesos.sum()
+
+    suavizado = matriz @ pesos
+
+    consumo = np.maximum(suavizado, media)
+
+    ponto_reposicao = (
+        consumo * prazo_reposicao
+        + fator_seguranca * desvio * np.sqrt(prazo_reposicao)
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cobertura = np.where(
+            consumo > 0,
+            np.maximum(disponivel, 0) / consumo,
+            np.nan,
+        )
+
+    return {
+        "media": media,
+        "suavizado": suavizado,
+        "desvio": desvio,
+        "ponto_reposicao": ponto_reposicao,
+        "cobertura": cobertura,
+    }
+
+
+def recalcular_previsoes(hoje=None):
+    """
+    Recalcula e grava a previsão de todo o catálogo ativo.
+    Pensado para rodar uma vez por noite.
+    """
+    config = current_app.config
+
+    historico_dias = int(config["PREVISAO_HISTORICO_DIAS"])
+    hoje = hoje or date.today()
+    inicio = hoje - timedelta(days=historico_dias)
+
+    materiais = db.session.execute(
+        select(
+            Material.id,
+            Material.saldo_atual - Material.reservado_atual,
+        )
+        .where(Material.ativo.is_(True))
+        .order_by(Material.id)
+    ).all()
+
+    material_ids = [linha[0] for linha in materiais]
+
+    disponivel = np.fromiter(
+        (float(linha[1] or 0) for linha in materiais),
+        dtype=np.float64,
+        count=len(materiais),
+    )
+
+    matriz = carregar_consumo_diario(
+        material_ids,
+        inicio,
+        historico_dias,
+    )
+
+    indicadores = calcular_indicadores(
+        matriz,
+        disponivel,
+        janela_media=int(config["PREVISAO_JANELA_MEDIA_DIAS"]),
+        alpha=float(config["PREVISAO_ALPHA"]),
+        prazo_reposicao=float(config["PREVISAO_PRAZO_REPOSICAO_DIAS"]),
+        fator_seguranca=float(config["PREVISAO_FATOR_SEGURANCA"]),
+    )
+
+    agora = datetime.utcnow()
+
+    registros = [
+        {
+            "material_id": material_id,
+            "consumo_medio_diario": _decimal(indicadores["media"][i], 4),
+            "consumo_suavizado_diario": _decimal(
+                indicadores["suavizado"][i],
+                4,
+            ),
+            "desvio_diario": _decimal(indicadores["desvio"][i], 4),
+            "ponto_reposicao": _decimal(
+                indicadores["ponto_reposicao"][i],
+                2,
+            ),
+            "dias_cobertura": (
+                None
+                if np.isnan(indicadores["cobertura"][i])
+                else _decimal(min(indicadores["cobertura"][i], 99999), 1)
+            ),
+            "calculado_em": agora,
+        }
+        for i, material_id in enumerate(material_ids)
+    ]
+
+    try:
+        # A tabela é derivada: troca o conteúdo inteiro na mesma
+        # transação, então o dashboard nunca vê um cálculo pela metade.
+        db.session.execute(delete(MaterialPrevisao))
+
+        if registros:
+            db.session.execute(insert(MaterialPrevisao), registros)
+
+        db.session.commit()
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return len(registros)
+
+
+def _decimal(valor, casas):
+    return round(Decimal(str(float(valor))), casas)
+
+
+def listar_reposicao_sugerida(limite=10):
+    """
+    Materiais cujo disponível já está no ponto de reposição ou abaixo,
+    lidos da tabela pré-calculada.
+    """
+    disponivel = Material.saldo_atual - Material.reservado_atual
+
+    return (
+        db.session.query(
+            Material.id,
+            Material.codigo,
+            Material.nome,
+            Material.unidade,
+            disponivel.label("disponivel"),
+            MaterialPrevisao.ponto_reposicao,
+            MaterialPrevisao.dias_cobertura,
+            MaterialPrevisao.consumo_suavizado_diario,
+        )
+        .join(
+            MaterialPrevisao,
+            MaterialPrevisao.material_id == Material.id,
+        )
+        .filter(
+            Material.ativo.is_(True),
+            MaterialPrevisao.ponto_reposicao > 0,
+            disponivel <= MaterialPrevisao.ponto_reposicao,
+        )
+        .order_by(
+            MaterialPrevisao.dias_cobertura.asc(),
+            Material.nome.asc(),
+        )
+        .limit(limite)
+        .all()
+    )
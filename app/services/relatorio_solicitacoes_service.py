@@ -1,8 +1,10 @@
+from collections import namedtuple
 from datetime import datetime, time
 from decimal import Decimal
 from io import BytesIO
 
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Alignment, Font, PatternFill
 from openpyxl.utils import get_column_letter
 
@@ -19,12 +21,16 @@ from reportlab.platypus import (
     TableStyle,
 )
 
-from sqlalchemy.orm import joinedload
+from sqlalchemy import exists, func
+from sqlalchemy.orm import joinedload, noload, selectinload
+
+from app.extensions import db
 
 from app.models.material import Material
 from app.models.solicitacao import Solicitacao
 from app.models.solicitacao_item import SolicitacaoItem
 from app.models.user import User
+from app.services import arquivo_solicitacoes_service
 
 
 STATUS_SOLICITACOES = [
@@ -37,6 +43,21 @@ STATUS_SOLICITACOES = [
     "ENTREGUE_PARCIAL",
 ]
 
+# Solicitações carregadas por consulta ao montar o relatório.
+TAMANHO_LOTE = 500
+
+# Solicitações por página na tela do relatório.
+POR_PAGINA = 50
+POR_PAGINA_MAXIMO = 200
+
+# Perfis que veem as solicitações de todos os usuários.
+PERFIS_ACESSO_TOTAL = {
+    "ADMIN",
+    "ENGENHEIRO",
+    "ALMOXARIFE",
+    "AUX_ALMOX",
+}
+
 
 def converter_data(valor, final_do_dia=False):
     if not valor:
@@ -54,25 +75,14 @@ def converter_data(valor, final_do_dia=False):
 
 
 def montar_query_solicitacoes(filtros, current_user):
-    query = (
-        Solicitacao.query
-        .options(
-            joinedload(Solicitacao.usuario),
-            joinedload(Solicitacao.aprovado_por),
-            joinedload(Solicitacao.entregue_por),
-            joinedload(Solicitacao.itens)
-            .joinedload(SolicitacaoItem.material),
-        )
-    )
-
-    perfis_acesso_total = {
-        "ADMIN",
-        "ENGENHEIRO",
-        "ALMOXARIFE",
-        "AUX_ALMOX",
-    }
-
-    if current_user.role not in perfis_acesso_total:
+    """
+    Consulta só dos ids das solicitações que atendem os filtros, já na
+    ordem do relatório. O filtro por material é um EXISTS nos itens, em
+    vez de JOIN + DISTINCT, para não repetir a solicitação por item.
+    """
+    query = db.session.query(Solicitacao.id)
+
+    if current_user.role not in PERFIS_ACESSO_TOTAL:
         query = query.filter(
             Solicitacao.usuario_id == current_user.id
         )
@@ -127,17 +137,13 @@ def montar_query_solicitacoes(filtros, current_user):
         except (TypeError, ValueError):
             raise ValueError("Material inválido.")
 
-        query = (
-            query
-            .join(
-                SolicitacaoItem,
+        query = query.filter(
+            exists()
+            .where(
                 SolicitacaoItem.solicitacao_id
                 == Solicitacao.id,
+                SolicitacaoItem.material_id == material_id,
             )
-            .filter(
-                SolicitacaoItem.material_id == material_id
-            )
-            .distinct()
         )
 
     data_inicial = converter_data(
@@ -165,11 +171,249 @@ def montar_query_solicitacoes(filtros, current_user):
     )
 
 
-def listar_solicitacoes(filtros, current_user):
-    return montar_query_solicitacoes(
+def carregar_solicitacoes(ids, tamanho_lote=TAMANHO_LOTE):
+    """
+    Carrega as solicitações com itens, materiais e usuários, em lotes
+    de ids, devolvendo na mesma ordem de ``ids``.
+    """
+    carregadas = {}
+
+    for inicio in range(0, len(ids), tamanho_lote):
+        lote = ids[inicio:inicio + tamanho_lote]
+
+        solicitacoes = (
+            Solicitacao.query
+            .options(
+                joinedload(Solicitacao.usuario),
+                joinedload(Solicitacao.aprovado_por),
+                joinedload(Solicitacao.entregue_por),
+                selectinload(Solicitacao.itens)
+                .joinedload(SolicitacaoItem.material),
+                noload(Solicitacao.historico),
+            )
+            .filter(Solicitacao.id.in_(lote))
+            .all()
+        )
+
+        for solicitacao in solicitacoes:
+            carregadas[solicitacao.id] = solicitacao
+
+    return [
+        carregadas[solicitacao_id]
+        for solicitacao_id in ids
+        if solicitacao_id in carregadas
+    ]
+
+
+def listar_arquivadas(filtros, current_user):
+    """
+    Solicitações do arquivo que atendem os filtros, na ordem do
+    relatório. Só lê os arquivos que chegam até o período; sem data
+    inicial, todos (ver arquivo_solicitacoes_service).
+    """
+    inicio = converter_data(filtros.get("data_inicial"))
+    fim = converter_data(filtros.get("data_final"), final_do_dia=True)
+
+    status = (filtros.get("status") or "").strip()
+    torre = (filtros.get("torre") or "").strip()
+    pavimento = (filtros.get("pavimento") or "").strip()
+    apartamento = (filtros.get("apartamento") or "").strip()
+
+    usuario_id = filtros.get("usuario_id")
+    usuario_id = int(usuario_id) if usuario_id else None
+
+    if current_user.role not in PERFIS_ACESSO_TOTAL:
+        if usuario_id not in (None, current_user.id):
+            return []
+
+        usuario_id = current_user.id
+
+    material_id = filtros.get("material_id")
+    material_id = int(material_id) if material_id else None
+
+    arquivadas = [
+        solicitacao
+        for solicitacao in (
+            arquivo_solicitacoes_service
+            .solicitacoes_arquivadas(inicio, fim)
+        )
+        if (not status or solicitacao.status == status)
+        and (usuario_id is None or solicitacao.usuario_id == usuario_id)
+        and (not torre or solicitacao.local_torre == torre)
+        and (not pavimento or solicitacao.local_pav == pavimento)
+        and (not apartamento or solicitacao.local_apto == apartamento)
+        and (
+            material_id is None
+            or any(
+                item.material_id == material_id
+                for item in solicitacao.itens
+            )
+        )
+    ]
+
+    arquivadas.sort(
+        key=lambda solicitacao: (
+            solicitacao.data_solicitacao,
+            solicitacao.id,
+        ),
+        reverse=True,
+    )
+
+    return arquivadas
+
+
+def _ordem_combinada(query, arquivadas):
+    """
+    Ids do banco e solicitações arquivadas intercalados na ordem do
+    relatório (data desc, id desc).
+    """
+    chaves = [
+        (data_solicitacao, solicitacao_id, solicitacao_id)
+        for solicitacao_id, data_solicitacao in (
+            query.with_entities(
+                Solicitacao.id,
+                Solicitacao.data_solicitacao,
+            )
+        )
+    ]
+
+    chaves.extend(
+        (solicitacao.data_solicitacao, solicitacao.id, solicitacao)
+        for solicitacao in arquivadas
+    )
+
+    chaves.sort(
+        key=lambda chave: (chave[0] or datetime.min, chave[1]),
+        reverse=True,
+    )
+
+    return [chave[2] for chave in chaves]
+
+
+def _hidratar(ordem, tamanho_lote=TAMANHO_LOTE):
+    """
+    Troca os ids de ``ordem`` pelas solicitações carregadas do banco;
+    as arquivadas já vêm prontas.
+    """
+    carregadas = {
+        solicitacao.id: solicitacao
+        for solicitacao in carregar_solicitacoes(
+            [item for item in ordem if isinstance(item, int)],
+            tamanho_lote,
+        )
+    }
+
+    return [
+        carregadas.get(item) if isinstance(item, int) else item
+        for item in ordem
+        if not isinstance(item, int) or item in carregadas
+    ]
+
+
+def iterar_solicitacoes(filtros, current_user, tamanho_lote=TAMANHO_LOTE):
+    """
+    Percorre todas as solicitações dos filtros, na ordem do relatório,
+    carregando um lote de ids por vez. Usado pelas exportações, que
+    não precisam manter o conjunto inteiro em memória.
+    """
+    query = montar_query_solicitacoes(
         filtros,
         current_user,
-    ).all()
+    )
+
+    arquivadas = listar_arquivadas(filtros, current_user)
+
+    if arquivadas:
+        ordem = _ordem_combinada(query, arquivadas)
+    else:
+        ordem = [solicitacao_id for (solicitacao_id,) in query]
+
+    for inicio in range(0, len(ordem), tamanho_lote):
+        yield from _hidratar(
+            ordem[inicio:inicio + tamanho_lote],
+            tamanho_lote,
+        )
+
+
+def contar_solicitacoes(filtros, current_user, arquivadas=None):
+    """
+    Total de solicitações e quantidade por status para os filtros, num
+    único GROUP BY, sem carregar as solicitações. As arquivadas entram
+    na conta quando o período alcança o arquivo.
+    """
+    query = (
+        montar_query_solicitacoes(
+            filtros,
+            current_user,
+        )
+        .order_by(None)
+        .with_entities(
+            Solicitacao.status,
+            func.count(Solicitacao.id),
+        )
+        .group_by(Solicitacao.status)
+    )
+
+    totais_status = dict(query.all())
+
+    if arquivadas is None:
+        arquivadas = listar_arquivadas(filtros, current_user)
+
+    for solicitacao in arquivadas:
+        totais_status[solicitacao.status] = (
+            totais_status.get(solicitacao.status, 0) + 1
+        )
+
+    return sum(totais_status.values()), totais_status
+
+
+def paginar_solicitacoes(
+    filtros,
+    current_user,
+    pagina=1,
+    por_pagina=POR_PAGINA,
+):
+    """
+    Página do relatório para a tela. Os ids da página vêm de um
+    LIMIT/OFFSET na consulta de ids e só eles são carregados; o total
+    vem de contar_solicitacoes, que também devolve os totais por status.
+    """
+    arquivadas = listar_arquivadas(filtros, current_user)
+
+    total, totais_status = contar_solicitacoes(
+        filtros,
+        current_user,
+        arquivadas,
+    )
+
+    query = montar_query_solicitacoes(
+        filtros,
+        current_user,
+    )
+
+    paginacao = db.paginate(
+        query.statement,
+        page=pagina,
+        per_page=min(por_pagina or POR_PAGINA, POR_PAGINA_MAXIMO),
+        error_out=False,
+        count=False,
+    )
+
+    paginacao.total = total
+
+    if arquivadas:
+        # a página sai da ordem combinada, e não do LIMIT/OFFSET do banco
+        inicio = (paginacao.page - 1) * paginacao.per_page
+
+        paginacao.items = _hidratar(
+            _ordem_combinada(query, arquivadas)[
+                inicio:inicio + paginacao.per_page
+            ]
+        )
+    else:
+        paginacao.items = carregar_solicitacoes(list(paginacao.items))
+
+    return paginacao, totais_status
 
 
 def decimal_para_float(valor):
@@ -216,97 +460,103 @@ def formatar_local(solicitacao):
     return " / ".join(partes) if partes else "-"
 
 
-def montar_linhas_relatorio(solicitacoes):
-    linhas = []
+# Campos da solicitação, calculados uma vez e compartilhados pelas
+# linhas de todos os seus itens. As datas já vão formatadas.
+CabecalhoSolicitacao = namedtuple(
+    "CabecalhoSolicitacao",
+    [
+        "id",
+        "data_solicitacao",
+        "solicitante",
+        "local",
+        "status",
+        "aprovado_por",
+        "data_aprovacao",
+        "entregue_por",
+        "data_entrega",
+    ],
+)
+
+# Uma linha do relatório: o cabeçalho da solicitação mais o item.
+# Solicitações sem itens geram uma linha com os campos do item vazios.
+LinhaRelatorio = namedtuple(
+    "LinhaRelatorio",
+    [
+        "solicitacao",
+        "codigo_material",
+        "material",
+        "unidade",
+        "qtd_solicitada",
+        "qtd_aprovada",
+        "status_item",
+        "motivo_rejeicao",
+    ],
+)
+
+
+def _nome(usuario):
+    return usuario.nome if usuario else "-"
+
+
+def montar_cabecalho(solicitacao):
+    return CabecalhoSolicitacao(
+        solicitacao.id,
+        formatar_data(solicitacao.data_solicitacao),
+        _nome(solicitacao.usuario),
+        formatar_local(solicitacao),
+        solicitacao.status,
+        _nome(solicitacao.aprovado_por),
+        formatar_data(solicitacao.data_aprovacao),
+        _nome(solicitacao.entregue_por),
+        formatar_data(solicitacao.data_entrega),
+    )
+
 
+def iterar_linhas_relatorio(solicitacoes):
+    """
+    Gera as linhas do relatório, uma por item, a partir de qualquer
+    iterável de solicitações (lista ou iterar_solicitacoes).
+    """
     for solicitacao in solicitacoes:
+        cabecalho = montar_cabecalho(solicitacao)
+
         if not solicitacao.itens:
-            linhas.append({
-                "solicitacao_id": solicitacao.id,
-                "data_solicitacao": solicitacao.data_solicitacao,
-                "solicitante": (
-                    solicitacao.usuario.nome
-                    if solicitacao.usuario
-                    else "-"
-                ),
-                "local": formatar_local(solicitacao),
-                "status_solicitacao": solicitacao.status,
-                "material": "-",
-                "codigo_material": "-",
-                "unidade": "-",
-                "qtd_solicitada": None,
-                "qtd_aprovada": None,
-                "status_item": "-",
-                "motivo_rejeicao": "-",
-                "aprovado_por": (
-                    solicitacao.aprovado_por.nome
-                    if solicitacao.aprovado_por
-                    else "-"
-                ),
-                "entregue_por": (
-                    solicitacao.entregue_por.nome
-                    if solicitacao.entregue_por
-                    else "-"
-                ),
-                "data_aprovacao": solicitacao.data_aprovacao,
-                "data_entrega": solicitacao.data_entrega,
-            })
+            yield LinhaRelatorio(
+                cabecalho,
+                "-",
+                "-",
+                "-",
+                None,
+                None,
+                "-",
+                "-",
+            )
 
             continue
 
         for item in solicitacao.itens:
-            linhas.append({
-                "solicitacao_id": solicitacao.id,
-                "data_solicitacao": solicitacao.data_solicitacao,
-                "solicitante": (
-                    solicitacao.usuario.nome
-                    if solicitacao.usuario
-                    else "-"
-                ),
-                "local": formatar_local(solicitacao),
-                "status_solicitacao": solicitacao.status,
-                "material": (
-                    item.material.nome
-                    if item.material
-                    else "-"
-                ),
-                "codigo_material": (
-                    item.material.codigo
-                    if item.material
-                    else "-"
-                ),
-                "unidade": (
-                    item.material.unidade
-                    if item.material
-                    else "-"
-                ),
-                "qtd_solicitada": item.qtd,
-                "qtd_aprovada": item.qtd_aprovada,
-                "status_item": item.status,
-                "motivo_rejeicao": (
-                    item.motivo_rejeicao or "-"
-                ),
-                "aprovado_por": (
-                    solicitacao.aprovado_por.nome
-                    if solicitacao.aprovado_por
-                    else "-"
-                ),
-                "entregue_por": (
-                    solicitacao.entregue_por.nome
-                    if solicitacao.entregue_por
-                    else "-"
-                ),
-                "data_aprovacao": solicitacao.data_aprovacao,
-                "data_entrega": solicitacao.data_entrega,
-            })
+            material = item.material
+
+            yield LinhaRelatorio(
+                cabecalho,
+                material.codigo if material else "-",
+                material.nome if material else "-",
+                material.unidade if material else "-",
+                item.qtd,
+                item.qtd_aprovada,
+                item.status,
+                item.motivo_rejeicao or "-",
+            )
 
-    return linhas
-def gerar_excel_solicitacoes(solicitacoes):
-    linhas = montar_linhas_relatorio(solicitacoes)
 
-    workbook = Workbook()
-    planilha = workbook.active
-    planilha.title = "Solicitações"
+def gerar_excel_solicitacoes(linhas, total, totais_status):
+    """
+    Planilha do relatório a partir de iterar_linhas_relatorio. Usa o
+    modo write_only do openpyxl, que grava as linhas conforme chegam em
+    vez de montar a planilha inteira em memória.
+    """
+    workbook = Workbook(write_only=True)
+    planilha = workbook.create_sheet("Solicitações")
 
     cabecalhos = [
         "Solicitação",
@@ -327,51 +577,6 @@ def gerar_excel_solicitacoes(solicitacoes):
         "Data da entrega",
     ]
 
-    planilha.append(cabecalhos)
-
-    preenchimento = PatternFill(
-        fill_type="solid",
-        fgColor="0D6EFD",
-    )
-
-    for celula in planilha[1]:
-        celula.font = Font(
-            bold=True,
-            color="FFFFFF",
-        )
-        celula.fill = preenchimento
-        celula.alignment = Alignment(
-            horizontal="center",
-            vertical="center",
-        )
-
-    for linha in linhas:
-        planilha.append([
-            linha["solicitacao_id"],
-            formatar_data(linha["data_solicitacao"]),
-            linha["solicitante"],
-            linha["local"],
-            linha["status_solicitacao"],
-            linha["codigo_material"],
-            linha["material"],
-            linha["unidade"],
-            decimal_para_float(
-                linha["qtd_solicitada"]
-            ),
-            decimal_para_float(
-                linha["qtd_aprovada"]
-            ),
-            linha["status_item"],
-            linha["motivo_rejeicao"],
-            linha["aprovado_por"],
-            formatar_data(linha["data_aprovacao"]),
-            linha["entregue_por"],
-            formatar_data(linha["data_entrega"]),
-        ])
-
-    planilha.freeze_panes = "A2"
-    planilha.auto_filter.ref = planilha.dimensions
-
     larguras = {
         "A": 12,
         "B": 20,
@@ -391,51 +596,111 @@ def gerar_excel_solicitacoes(solicitacoes):
         "P": 20,
     }
 
+    # no modo write_only larguras e painéis vêm antes das linhas
     for coluna, largura in larguras.items():
         planilha.column_dimensions[coluna].width = largura
 
-    for linha in planilha.iter_rows(
-        min_row=2,
-        max_row=planilha.max_row,
-    ):
-        for celula in linha:
-            celula.alignment = Alignment(
-                vertical="top",
-                wrap_text=True,
-            )
+    planilha.freeze_panes = "A2"
 
-    for coluna in ["I", "J"]:
-        for celula in planilha[coluna][1:]:
-            celula.number_format = '#,##0.00'
+    preenchimento = PatternFill(
+        fill_type="solid",
+        fgColor="0D6EFD",
+    )
 
-    resumo = workbook.create_sheet("Resumo")
+    fonte_cabecalho = Font(
+        bold=True,
+        color="FFFFFF",
+    )
 
-    resumo.append([
-        "Indicador",
-        "Quantidade",
-    ])
+    alinhamento_cabecalho = Alignment(
+        horizontal="center",
+        vertical="center",
+    )
 
-    for celula in resumo[1]:
-        celula.font = Font(
-            bold=True,
-            color="FFFFFF",
-        )
-        celula.fill = preenchimento
+    alinhamento = Alignment(
+        vertical="top",
+        wrap_text=True,
+    )
 
-    totais_status = {}
+    # Uma célula por coluna, estilizada uma vez e reaproveitada em todas
+    # as linhas: no modo write_only a linha é gravada no append, então só
+    # o valor muda. Estilizar célula por célula custava mais que gravar.
+    celulas = []
 
-    for solicitacao in solicitacoes:
-        totais_status[solicitacao.status] = (
-            totais_status.get(
-                solicitacao.status,
-                0,
-            )
-            + 1
+    for coluna in range(1, len(cabecalhos) + 1):
+        nova = WriteOnlyCell(planilha)
+        nova.alignment = alinhamento
+
+        if get_column_letter(coluna) in ("I", "J"):
+            nova.number_format = "#,##0.00"
+
+        celulas.append(nova)
+
+    linha_cabecalho = []
+
+    for titulo in cabecalhos:
+        nova = WriteOnlyCell(planilha, value=titulo)
+        nova.font = fonte_cabecalho
+        nova.fill = preenchimento
+        nova.alignment = alinhamento_cabecalho
+        linha_cabecalho.append(nova)
+
+    planilha.append(linha_cabecalho)
+
+    quantidade_linhas = 0
+
+    for linha in linhas:
+        solicitacao = linha.solicitacao
+
+        valores = (
+            solicitacao.id,
+            solicitacao.data_solicitacao,
+            solicitacao.solicitante,
+            solicitacao.local,
+            solicitacao.status,
+            linha.codigo_material,
+            linha.material,
+            linha.unidade,
+            decimal_para_float(linha.qtd_solicitada),
+            decimal_para_float(linha.qtd_aprovada),
+            linha.status_item,
+            linha.motivo_rejeicao,
+            solicitacao.aprovado_por,
+            solicitacao.data_aprovacao,
+            solicitacao.entregue_por,
+            solicitacao.data_entrega,
         )
 
+        for celula, valor in zip(celulas, valores):
+            celula.value = valor
+
+        planilha.append(celulas)
+
+        quantidade_linhas += 1
+
+    planilha.auto_filter.ref = (
+        f"A1:{get_column_letter(len(cabecalhos))}"
+        f"{quantidade_linhas + 1}"
+    )
+
+    resumo = workbook.create_sheet("Resumo")
+
+    resumo.column_dimensions["A"].width = 35
+    resumo.column_dimensions["B"].width = 18
+
+    linha_cabecalho = []
+
+    for titulo in ["Indicador", "Quantidade"]:
+        nova = WriteOnlyCell(resumo, value=titulo)
+        nova.font = fonte_cabecalho
+        nova.fill = preenchimento
+        linha_cabecalho.append(nova)
+
+    resumo.append(linha_cabecalho)
+
     resumo.append([
         "Total de solicitações",
-        len(solicitacoes),
+        total,
     ])
 
     for status in STATUS_SOLICITACOES:
@@ -444,9 +709,6 @@ def gerar_excel_solicitacoes(solicitacoes):
             totais_status.get(status, 0),
         ])
 
-    resumo.column_dimensions["A"].width = 35
-    resumo.column_dimensions["B"].width = 18
-
     arquivo = BytesIO()
     workbook.save(arquivo)
     arquivo.seek(0)
@@ -454,11 +716,10 @@ def gerar_excel_solicitacoes(solicitacoes):
     return arquivo
 
 def gerar_pdf_solicitacoes(
-    solicitacoes,
+    linhas,
+    total,
     filtros,
 ):
-    linhas = montar_linhas_relatorio(solicitacoes)
-
     arquivo = BytesIO()
 
     documento = SimpleDocTemplate(
@@ -508,7 +769,7 @@ def gerar_pdf_solicitacoes(
     descricao_filtros = (
         f"Período: {periodo} | "
         f"Status: {filtros.get('status') or 'Todos'} | "
-        f"Total de solicitações: {len(solicitacoes)}"
+        f"Total de solicitações: {total}"
     )
 
     elementos.append(
@@ -536,45 +797,45 @@ def gerar_pdf_solicitacoes(
     ]]
 
     for linha in linhas:
+        solicitacao = linha.solicitacao
+
         dados.append([
-            str(linha["solicitacao_id"]),
+            str(solicitacao.id),
             Paragraph(
-                formatar_data(
-                    linha["data_solicitacao"]
-                ),
+                solicitacao.data_solicitacao,
                 estilo_normal,
             ),
             Paragraph(
-                linha["solicitante"],
+                solicitacao.solicitante,
                 estilo_normal,
             ),
             Paragraph(
-                linha["local"],
+                solicitacao.local,
                 estilo_normal,
             ),
             Paragraph(
-                linha["status_solicitacao"],
+                solicitacao.status,
                 estilo_normal,
             ),
             Paragraph(
                 (
-                    f"{linha['codigo_material']} - "
-                    f"{linha['material']}"
+                    f"{linha.codigo_material} - "
+                    f"{linha.material}"
                 ),
                 estilo_normal,
             ),
             formatar_decimal(
-                linha["qtd_solicitada"]
+                linha.qtd_solicitada
             ),
             formatar_decimal(
-                linha["qtd_aprovada"]
+                linha.qtd_aprovada
             ),
             Paragraph(
-                linha["status_item"],
+                linha.status_item,
                 estilo_normal,
             ),
             Paragraph(
-                linha["motivo_rejeicao"],
+                linha.motivo_rejeicao,
                 estilo_normal,
             ),
         ])
@@ -0,0 +1,225 @@
+"""
+Envio de várias solicitações de uma vez, com chave de idempotência.
+
+Cada solicitação do lote traz uma chave gerada pelo aparelho. O
+resultado (criada ou recusada) fica gravado em solicitacao_envio; um
+reenvio com a mesma chave devolve o resultado gravado, sem criar nada.
+"""
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models.solicitacao import Solicitacao
+from app.models.solicitacao_envio import SolicitacaoEnvio
+from app.models.solicitacao_historico import SolicitacaoHistorico
+from app.services.solicitacao_service import (
+    STATUS_SOLICITACAO_PENDENTE,
+    carregar_materiais,
+    montar_itens,
+)
+
+
+TAMANHO_MAXIMO_LOTE = 100
+TAMANHO_MAXIMO_CHAVE = 64
+
+RESULTADO_CRIADA = "CRIADA"
+RESULTADO_RECUSADA = "RECUSADA"
+
+
+def _texto(valor, tamanho=None):
+    valor = str(valor or "").strip()
+
+    return valor[:tamanho] if tamanho else valor
+
+
+def _ler_envio(envio):
+    """
+    Converte uma solicitação do JSON nos campos de criar_solicitacao.
+    Erros de formato viram recusa daquela solicitação, não do lote.
+    """
+    itens = envio.get("itens")
+
+    if not isinstance(itens, list):
+        raise ValueError("Informe os itens da solicitação.")
+
+    materiais_ids = []
+    quantidades = []
+
+    for item in itens:
+        if not isinstance(item, dict):
+            raise ValueError("Item da solicitação em formato inválido.")
+
+        materiais_ids.append(item.get("material_id"))
+        quantidades.append(item.get("qtd"))
+
+    return {
+        "observacao": _texto(envio.get("observacao")),
+        "local_torre": _texto(envio.get("local_torre"), 20),
+        "local_pav": _texto(envio.get("local_pav"), 20),
+        "local_apto": _texto(envio.get("local_apto"), 20),
+        "materiais_ids": materiais_ids,
+        "quantidades": quantidades,
+    }
+
+
+def _validar_lote(envios):
+    if not isinstance(envios, list) or not envios:
+        raise ValueError("Envie uma lista de solicitações.")
+
+    if len(envios) > TAMANHO_MAXIMO_LOTE:
+        raise ValueError(
+            f"Envie no máximo {TAMANHO_MAXIMO_LOTE} solicitações por vez."
+        )
+
+    chaves = []
+
+    for envio in envios:
+        chave = envio.get("chave") if isinstance(envio, dict) else None
+
+        if (
+            not isinstance(chave, str)
+            or not chave.strip()
+            or len(chave) > TAMANHO_MAXIMO_CHAVE
+        ):
+            raise ValueError(
+                "Cada solicitação precisa de uma chave de até "
+                f"{TAMANHO_MAXIMO_CHAVE} caracteres."
+            )
+
+        chaves.append(chave)
+
+    return chaves
+
+
+def _resultado(registro, repetido):
+    return {
+        "chave": registro.chave,
+        "resultado": registro.resultado,
+        "solicitacao_id": registro.solicitacao_id,
+        "erro": registro.erro,
+        "repetido": repetido,
+    }
+
+
+def _processar(usuario_id, envios, chaves):
+    registros = {
+        registro.chave: registro
+        for registro in SolicitacaoEnvio.query.filter(
+            SolicitacaoEnvio.usuario_id == usuario_id,
+            SolicitacaoEnvio.chave.in_(set(chaves)),
+        )
+    }
+
+    ja_recebidas = set(registros)
+
+    novos = {}
+
+    for envio, chave in zip(envios, chaves):
+        if chave in registros or chave in novos:
+            continue
+
+        try:
+            novos[chave] = _ler_envio(envio)
+        except ValueError as erro:
+            novos[chave] = erro
+
+    # uma consulta para os materiais de todo o lote
+    materiais = carregar_materiais([
+        material_id
+        for campos in novos.values()
+        if isinstance(campos, dict)
+        for material_id in campos["materiais_ids"]
+    ])
+
+    for chave, campos in novos.items():
+        registro = SolicitacaoEnvio(
+            usuario_id=usuario_id,
+            chave=chave,
+        )
+
+        try:
+            if isinstance(campos, ValueError):
+                raise campos
+
+            itens = montar_itens(
+                campos["materiais_ids"],
+                campos["quantidades"],
+                materiais,
+            )
+
+        except ValueError as erro:
+            registro.resultado = RESULTADO_RECUSADA
+            registro.erro = str(erro)
+
+        else:
+            solicitacao = Solicitacao(
+                usuario_id=usuario_id,
+                observacao=campos["observacao"],
+                local_torre=campos["local_torre"],
+                local_pav=campos["local_pav"],
+                local_apto=campos["local_apto"],
+                status=STATUS_SOLICITACAO_PENDENTE,
+                itens=itens,
+            )
+
+            # pelo relacionamento, e não por registrar_evento, para não
+            # fazer um flush por solicitação
+            solicitacao.historico.append(
+                SolicitacaoHistorico(
+                    usuario_id=usuario_id,
+                    acao="CRIACAO",
+                    descricao=(
+                        f"Solicitação criada com "
+                        f"{len(itens)} item(ns)."
+                    ),
+                )
+            )
+
+            db.session.add(solicitacao)
+
+            registro.resultado = RESULTADO_CRIADA
+            registro.solicitacao = solicitacao
+
+        db.session.add(registro)
+        registros[chave] = registro
+
+    # os ids saem no flush; montar a resposta antes do commit evita
+    # recarregar cada registro expirado
+    db.session.flush()
+
+    resultados = []
+    vistas = set(ja_recebidas)
+
+    for chave in chaves:
+        resultados.append(_resultado(registros[chave], chave in vistas))
+        vistas.add(chave)
+
+    db.session.commit()
+
+    return resultados
+
+
+def enviar_lote(usuario_id, envios):
+    """
+    Cria as solicitações do lote numa transação só e devolve, na mesma
+    ordem, o resultado de cada uma. Solicitações recusadas (saldo,
+    material inativo...) não impedem as outras.
+
+    Se outro envio com as mesmas chaves for gravado ao mesmo tempo, a
+    chave única acusa o conflito; o lote é refeito uma vez e passa a
+    ver o resultado gravado pelo outro.
+    """
+    chaves = _validar_lote(envios)
+
+    for tentativa in range(2):
+        try:
+            return _processar(usuario_id, envios, chaves)
+
+        except IntegrityError:
+            db.session.rollback()
+
+            if tentativa:
+                raise
+
+        except Exception:
+            db.session.rollback()
+            raise
@@ -5,12 +5,23 @@ from datetime import datetime
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
 
+from sqlalchemy import select
 from sqlalchemy.orm import joinedload
 
 from app.extensions import db
 from app.models.material import Material
 from app.models.solicitacao import Solicitacao
 from app.models.solicitacao_item import SolicitacaoItem
+from app.models.solicitacao_item_entrega import (
+    SolicitacaoItemEntrega,
+)
+from app.models.user import User
+from app.services.estoque_service import (
+    agrupar_por_material,
+    ajustar_reservas_em_lote,
+    baixar_por_proximidade,
+)
+from app.services import local_estoque_service
 from app.services.solicitacao_historico_service import (
     registrar_evento,
 )
@@ -27,6 +38,12 @@ STATUS_ITEM_PENDENTE = "PENDENTE"
 STATUS_ITEM_APROVADO = "APROVADO"
 STATUS_ITEM_REJEITADO = "REJEITADO"
 STATUS_ITEM_ENTREGUE = "ENTREGUE"
+STATUS_ITEM_ENTREGUE_PARCIAL = "ENTREGUE_PARCIAL"
+
+STATUS_ITEM_ENTREGAVEIS = {
+    STATUS_ITEM_APROVADO,
+    STATUS_ITEM_ENTREGUE_PARCIAL,
+}
 
 
 def converter_decimal(valor, nome_campo="quantidade"):
@@ -54,6 +71,31 @@ def obter_solicitacao(solicitacao_id):
     )
 
 
+def travar_solicitacao(solicitacao):
+    """
+    Trava a solicitação e seus itens (FOR UPDATE) até o commit e
+    recarrega o que está gravado, para que duas análises ou entregas
+    simultâneas não partam do mesmo status e qtd_entregue lidos sem
+    trava. Ordem: solicitação, itens por id e, depois, os materiais.
+    """
+    db.session.execute(
+        select(Solicitacao)
+        .where(Solicitacao.id == solicitacao.id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).scalar_one()
+
+    db.session.execute(
+        select(SolicitacaoItem)
+        .where(SolicitacaoItem.solicitacao_id == solicitacao.id)
+        .order_by(SolicitacaoItem.id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    ).scalars().all()
+
+    return solicitacao
+
+
 def recalcular_status(solicitacao):
     itens = list(solicitacao.itens)
 
@@ -87,6 +129,12 @@ def recalcular_status(solicitacao):
         if item.status == STATUS_ITEM_ENTREGUE
     )
 
+    entregues_parcial = sum(
+        1
+        for item in itens
+        if item.status == STATUS_ITEM_ENTREGUE_PARCIAL
+    )
+
     if pendentes == total:
         status = STATUS_SOLICITACAO_PENDENTE
 
@@ -99,7 +147,7 @@ def recalcular_status(solicitacao):
     elif aprovados == total:
         status = STATUS_SOLICITACAO_APROVADA
 
-    elif entregues > 0:
+    elif entregues > 0 or entregues_parcial > 0:
         status = STATUS_SOLICITACAO_ENTREGUE_PARCIAL
 
     elif aprovados > 0 and rejeitados > 0 and pendentes == 0:
@@ -117,15 +165,33 @@ def recalcular_status(solicitacao):
     return status
 
 
-def criar_solicitacao(
-    usuario_id,
-    observacao,
-    local_torre,
-    local_pav,
-    local_apto,
-    materiais_ids,
-    quantidades,
-):
+def carregar_materiais(materiais_ids):
+    """
+    Materiais referenciados pelos ids (texto do formulário), numa
+    consulta só. Ids inválidos ficam de fora; montar_itens acusa.
+    """
+    ids = set()
+
+    for material_id_texto in materiais_ids:
+        try:
+            ids.add(int(material_id_texto))
+        except (TypeError, ValueError):
+            continue
+
+    if not ids:
+        return {}
+
+    return {
+        material.id: material
+        for material in Material.query.filter(Material.id.in_(ids))
+    }
+
+
+def montar_itens(materiais_ids, quantidades, materiais):
+    """
+    Valida os materiais e quantidades de uma solicitação contra os
+    materiais já carregados (carregar_materiais) e devolve os itens.
+    """
     if not materiais_ids:
         raise ValueError(
             "Inclua pelo menos um material."
@@ -136,92 +202,102 @@ def criar_solicitacao(
             "A lista de materiais e quantidades está inconsistente."
         )
 
-    solicitacao = Solicitacao(
-        usuario_id=usuario_id,
-        observacao=observacao,
-        local_torre=local_torre,
-        local_pav=local_pav,
-        local_apto=local_apto,
-        status=STATUS_SOLICITACAO_PENDENTE,
-    )
-    
-    db.session.add(solicitacao)
-
-    materiais_adicionados = 0
+    itens = []
 
-    try:
-        for material_id_texto, quantidade_texto in zip(
-            materiais_ids,
-            quantidades,
-        ):
-            if not material_id_texto:
-                continue
-
-            try:
-                material_id = int(material_id_texto)
-            except (TypeError, ValueError):
-                raise ValueError(
-                    "Foi informado um material inválido."
-                )
+    for material_id_texto, quantidade_texto in zip(
+        materiais_ids,
+        quantidades,
+    ):
+        if not material_id_texto:
+            continue
 
-            quantidade = converter_decimal(
-                quantidade_texto,
-                "quantidade solicitada",
+        try:
+            material_id = int(material_id_texto)
+        except (TypeError, ValueError):
+            raise ValueError(
+                "Foi informado um material inválido."
             )
 
-            if quantidade <= 0:
-                raise ValueError(
-                    "A quantidade solicitada deve ser maior que zero."
-                )
+        quantidade = converter_decimal(
+            quantidade_texto,
+            "quantidade solicitada",
+        )
 
-            material = db.session.get(
-                Material,
-                material_id,
+        if quantidade <= 0:
+            raise ValueError(
+                "A quantidade solicitada deve ser maior que zero."
             )
 
-            if material is None:
-                raise ValueError(
-                    f"Material de código interno "
-                    f"{material_id} não encontrado."
-                )
+        material = materiais.get(material_id)
 
-            if not material.ativo:
-                raise ValueError(
-                    f"O material {material.nome} está inativo."
-                )
+        if material is None:
+            raise ValueError(
+                f"Material de código interno "
+                f"{material_id} não encontrado."
+            )
 
-            saldo = Decimal(
-                material.saldo_atual or 0
+        if not material.ativo:
+            raise ValueError(
+                f"O material {material.nome} está inativo."
             )
 
-            if quantidade > saldo:
-                raise ValueError(
-                    f"A quantidade solicitada de "
-                    f"{material.nome} é maior que o saldo disponível."
-                )
+        if quantidade > material.disponivel_decimal:
+            raise ValueError(
+                f"A quantidade solicitada de "
+                f"{material.nome} é maior que o saldo disponível."
+            )
 
-            item = SolicitacaoItem(
+        itens.append(
+            SolicitacaoItem(
                 material_id=material.id,
                 qtd=quantidade,
+                status=STATUS_ITEM_PENDENTE,
             )
-            
-            if hasattr(item, "status"):
-                item.status = STATUS_ITEM_PENDENTE
-            
-            solicitacao.itens.append(item)
-            materiais_adicionados += 1
-
-        if materiais_adicionados == 0:
-            raise ValueError(
-                "Nenhum item válido foi incluído."
-            )
+        )
+
+    if not itens:
+        raise ValueError(
+            "Nenhum item válido foi incluído."
+        )
+
+    return itens
+
+
+def criar_solicitacao(
+    usuario_id,
+    observacao,
+    local_torre,
+    local_pav,
+    local_apto,
+    materiais_ids,
+    quantidades,
+):
+    try:
+        itens = montar_itens(
+            materiais_ids,
+            quantidades,
+            carregar_materiais(materiais_ids),
+        )
+
+        solicitacao = Solicitacao(
+            usuario_id=usuario_id,
+            observacao=observacao,
+            local_torre=local_torre,
+            local_pav=local_pav,
+            local_apto=local_apto,
+            status=STATUS_SOLICITACAO_PENDENTE,
+            itens=itens,
+        )
+
+        db.session.add(solicitacao)
+
         registrar_evento(
             solicitacao=solicitacao,
             usuario_id=usuario_id,
             acao="CRIACAO",
             descricao=(
                 f"Solicitação criada com "
-                f"{materiais_adicionados} item(ns)."
+                f"{len(itens)} item(ns)."
             ),
         )
         db.session.commit()
@@ -232,11 +308,24 @@ def criar_solicitacao(
         raise
 
 
+def _reserva_do_item(item):
+    """
+    Quantidade que o item mantém reservada no estoque: o saldo
+    aprovado e ainda não entregue.
+    """
+    if item.status not in STATUS_ITEM_ENTREGAVEIS:
+        return Decimal("0")
+
+    return item.qtd_a_entregar
+
+
 def analisar_itens(
     solicitacao,
     decisoes,
     usuario_id,
 ):
+    travar_solicitacao(solicitacao)
+
     if solicitacao.status in {
         STATUS_SOLICITACAO_ENTREGUE,
     }:
@@ -246,6 +335,10 @@ def analisar_itens(
 
     houve_alteracao = False
 
+    # Variação de reserva por item: aprovar reserva a quantidade
+    # aprovada, rejeitar (ou reduzir a aprovação) devolve a diferença.
+    variacoes_reserva = []
+
     try:
         for item in solicitacao.itens:
             dados = decisoes.get(item.id)
@@ -267,6 +360,12 @@ def analisar_itens(
                     "já foi entregue."
                 )
 
+            if item.status == STATUS_ITEM_ENTREGUE_PARCIAL:
+                raise ValueError(
+                    f"O item {item.material.nome} "
+                    "já possui entrega registrada."
+                )
+
             if decisao == "APROVAR":
                 quantidade = converter_decimal(
                     dados.get("qtd_aprovada"),
@@ -290,6 +389,11 @@ def analisar_itens(
                         "a quantidade solicitada."
                     )
 
+                variacoes_reserva.append((
+                    item.material_id,
+                    quantidade - _reserva_do_item(item),
+                ))
+
                 item.status = STATUS_ITEM_APROVADO
                 item.qtd_aprovada = quantidade
                 item.motivo_rejeicao = None
@@ -316,6 +420,11 @@ def analisar_itens(
                         f"{item.material.nome}."
                     )
 
+                variacoes_reserva.append((
+                    item.material_id,
+                    -_reserva_do_item(item),
+                ))
+
                 item.status = STATUS_ITEM_REJEITADO
                 item.qtd_aprovada = Decimal("0")
                 item.motivo_rejeicao = motivo
@@ -344,6 +453,14 @@ def analisar_itens(
                 "Nenhum item foi selecionado para análise."
             )
 
+        ajustar_reservas_em_lote(
+            agrupar_por_material(variacoes_reserva),
+            nomes={
+                item.material_id: item.material.nome
+                for item in solicitacao.itens
+            },
+        )
+
         status = recalcular_status(solicitacao)
         registrar_evento(
             solicitacao=solicitacao,
@@ -373,6 +490,8 @@ def aprovar_todos_pendentes(
     solicitacao,
     usuario_id,
 ):
+    travar_solicitacao(solicitacao)
+
     decisoes = {}
 
     for item in solicitacao.itens:
@@ -406,6 +525,8 @@ def rejeitar_todos_pendentes(
             "Informe o motivo da rejeição."
         )
 
+    travar_solicitacao(solicitacao)
+
     decisoes = {}
 
     for item in solicitacao.itens:
@@ -427,65 +548,215 @@ def rejeitar_todos_pendentes(
     )
 
 
+def obter_resumo_entrega(solicitacao_id):
+    """
+    Projeção da tela de entrega: busca apenas as colunas exibidas,
+    sem carregar itens, histórico e usuários da solicitação.
+    """
+    cabecalho = (
+        db.session.query(
+            Solicitacao.id,
+            Solicitacao.status,
+            Solicitacao.usuario_id,
+            Solicitacao.local_torre,
+            Solicitacao.local_pav,
+            Solicitacao.local_apto,
+            User.nome.label("solicitante"),
+        )
+        .outerjoin(User, User.id == Solicitacao.usuario_id)
+        .filter(Solicitacao.id == solicitacao_id)
+        .first()
+    )
+
+    if cabecalho is None:
+        return None, []
+
+    itens = (
+        db.session.query(
+            SolicitacaoItem.id,
+            SolicitacaoItem.status,
+            SolicitacaoItem.qtd,
+            SolicitacaoItem.qtd_aprovada,
+            SolicitacaoItem.qtd_entregue,
+            Material.codigo,
+            Material.nome,
+            Material.unidade,
+            Material.saldo_atual,
+        )
+        .join(
+            Material,
+            Material.id == SolicitacaoItem.material_id,
+        )
+        .filter(
+            SolicitacaoItem.solicitacao_id == solicitacao_id,
+            SolicitacaoItem.status.in_(
+                STATUS_ITEM_ENTREGAVEIS
+            ),
+        )
+        .order_by(SolicitacaoItem.id.asc())
+        .all()
+    )
+
+    return cabecalho, itens
+
+
+def _partes_do_item(retiradas, quantidade):
+    """
+    Tira `quantidade` do início de `retiradas` ([(local_id, qtd)] do
+    material, já na ordem de proximidade), consumindo a lista para o
+    próximo item do mesmo material.
+    """
+    partes = []
+
+    while quantidade > 0:
+        local_id, disponivel = retiradas[0]
+        parte = min(quantidade, disponivel)
+
+        partes.append((local_id, parte))
+        quantidade -= parte
+
+        if parte == disponivel:
+            retiradas.pop(0)
+        else:
+            retiradas[0] = (local_id, disponivel - parte)
+
+    return partes
+
+
 def entregar_itens_aprovados(
     solicitacao,
     usuario_id,
+    quantidades=None,
 ):
-    itens_aprovados = [
+    """
+    Registra uma entrega (total ou parcial) dos itens aprovados.
+
+    `quantidades` mapeia item_id -> quantidade a entregar agora.
+    Quando não é informado, entrega o saldo restante de todos os
+    itens aprovados. Itens ausentes do mapa ou com quantidade zero
+    ficam para uma próxima entrega.
+    """
+    travar_solicitacao(solicitacao)
+
+    itens_entregaveis = [
         item
         for item in solicitacao.itens
-        if item.status == STATUS_ITEM_APROVADO
+        if item.status in STATUS_ITEM_ENTREGAVEIS
     ]
 
-    if not itens_aprovados:
+    if not itens_entregaveis:
         raise ValueError(
             "Não existem itens aprovados para entrega."
         )
 
-    try:
-        for item in itens_aprovados:
-            quantidade = Decimal(
-                item.qtd_aprovada
-                if item.qtd_aprovada is not None
-                else item.qtd
+    lote = []
+
+    for item in itens_entregaveis:
+        restante = item.qtd_a_entregar
+
+        if quantidades is None:
+            quantidade = restante
+        else:
+            quantidade = converter_decimal(
+                quantidades.get(item.id),
+                "quantidade entregue",
             )
 
-            saldo = Decimal(
-                item.material.saldo_atual or 0
+        if quantidade == 0:
+            continue
+
+        if quantidade < 0:
+            raise ValueError(
+                f"A quantidade entregue de "
+                f"{item.material.nome} não pode ser negativa."
             )
 
-            if saldo < quantidade:
-                raise ValueError(
-                    f"Estoque insuficiente para "
-                    f"{item.material.nome}."
-                )
+        if quantidade > restante:
+            raise ValueError(
+                f"A quantidade entregue de "
+                f"{item.material.nome} ultrapassa o saldo "
+                f"a entregar ({restante})."
+            )
+
+        lote.append((item, quantidade))
 
-        for item in itens_aprovados:
-            quantidade = Decimal(
-                item.qtd_aprovada
-                if item.qtd_aprovada is not None
-                else item.qtd
+    if not lote:
+        raise ValueError(
+            "Informe a quantidade de pelo menos um item."
+        )
+
+    try:
+        # cada material sai do local mais próximo da torre pedida que
+        # tiver saldo, e do seguinte se esse não bastar
+        locais = local_estoque_service.locais_para_entrega(solicitacao)
+        nomes_locais = {local.id: local.nome for local in locais}
+
+        retiradas = baixar_por_proximidade(
+            agrupar_por_material(
+                (item.material_id, quantidade)
+                for item, quantidade in lote
+            ),
+            [local.id for local in locais],
+            nomes={
+                item.material_id: item.material.nome
+                for item, _ in lote
+            },
+            liberar_reserva=True,
+        )
+
+        agora = datetime.utcnow()
+
+        for item, quantidade in lote:
+            partes = _partes_do_item(
+                retiradas[item.material_id],
+                quantidade,
             )
 
-            item.material.saldo_atual = (
-                Decimal(item.material.saldo_atual or 0)
-                - quantidade
+            item.qtd_entregue = (
+                Decimal(item.qtd_entregue or 0)
+                + quantidade
             )
 
-            item.status = STATUS_ITEM_ENTREGUE
+            if item.qtd_a_entregar <= 0:
+                item.status = STATUS_ITEM_ENTREGUE
+                acao = "ITEM_ENTREGUE"
+            else:
+                item.status = STATUS_ITEM_ENTREGUE_PARCIAL
+                acao = "ITEM_ENTREGUE_PARCIAL"
+
+            for local_id, parte in partes:
+                item.entregas.append(
+                    SolicitacaoItemEntrega(
+                        solicitacao_id=solicitacao.id,
+                        material_id=item.material_id,
+                        local_id=local_id,
+                        qtd=parte,
+                        usuario_id=usuario_id,
+                        data_entrega=agora,
+                    )
+                )
+
             registrar_evento(
                 solicitacao=solicitacao,
                 item=item,
                 usuario_id=usuario_id,
-                acao="ITEM_ENTREGUE",
+                acao=acao,
                 descricao=(
                     f"Material {item.material.nome} entregue. "
                     f"Quantidade: {quantidade} "
-                    f"{item.material.unidade or ''}."
+                    f"{item.material.unidade or ''}. "
+                    f"Total entregue: {item.qtd_entregue}. "
+                    f"Retirado de: "
+                    + ", ".join(
+                        f"{nomes_locais[local_id]} ({parte.normalize():f})"
+                        for local_id, parte in partes
+                    )
+                    + "."
                 ),
             )
+
         solicitacao.entregue_por_id = usuario_id
-        solicitacao.data_entrega = datetime.utcnow()
+        solicitacao.data_entrega = agora
 
         recalcular_status(solicitacao)
         registrar_evento(
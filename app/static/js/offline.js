@@ -0,0 +1,494 @@
+/*
+ * Modo offline do app de estoque.
+ *
+ * Usado pelas páginas e pelo service worker (sw.js faz importScripts),
+ * por isso não mexe no DOM. Guarda no IndexedDB:
+ *   - catalogo: cópia compacta dos materiais ativos, com a versão
+ *     devolvida por /materiais/catalogo (ETag);
+ *   - fila: solicitações criadas sem conexão, reenviadas depois;
+ *   - sessao: o usuário logado, para a fila só enviar o que é dele.
+ */
+(function (escopo) {
+    "use strict";
+
+    const NOME_BANCO = "aruana-estoque";
+    const VERSAO_BANCO = 1;
+
+    const URL_CATALOGO = "/materiais/catalogo";
+    const URL_NOVA_SOLICITACAO = "/solicitacoes/nova";
+    const URL_LOTE = "/solicitacoes/lote";
+
+    // Igual a solicitacao_lote_service.TAMANHO_MAXIMO_LOTE.
+    const TAMANHO_LOTE = 100;
+
+    const TAG_SYNC = "fila-solicitacoes";
+
+    const LIMITE_RESULTADOS = 30;
+
+    // Igual ao material_consulta_service: termos curtos buscam só
+    // pelo começo da descrição ou do código.
+    const TAMANHO_MINIMO_TRECHO = 3;
+
+    let bancoAberto = null;
+    let indiceBusca = null;
+
+    function abrirBanco() {
+        if (bancoAberto) {
+            return bancoAberto;
+        }
+
+        bancoAberto = new Promise(function (resolve, reject) {
+            const pedido = indexedDB.open(NOME_BANCO, VERSAO_BANCO);
+
+            pedido.onupgradeneeded = function () {
+                const banco = pedido.result;
+
+                banco.createObjectStore("catalogo");
+                banco.createObjectStore("sessao");
+                banco.createObjectStore("fila", {
+                    keyPath: "id",
+                    autoIncrement: true,
+                });
+            };
+
+            pedido.onsuccess = function () {
+                resolve(pedido.result);
+            };
+
+            pedido.onerror = function () {
+                bancoAberto = null;
+                reject(pedido.error);
+            };
+        });
+
+        return bancoAberto;
+    }
+
+    function executar(loja, modo, operacao) {
+        return abrirBanco().then(function (banco) {
+            return new Promise(function (resolve, reject) {
+                const transacao = banco.transaction(loja, modo);
+                const pedido = operacao(transacao.objectStore(loja));
+
+                transacao.oncomplete = function () {
+                    resolve(pedido ? pedido.result : undefined);
+                };
+
+                transacao.onerror = function () {
+                    reject(transacao.error);
+                };
+
+                transacao.onabort = function () {
+                    reject(transacao.error);
+                };
+            });
+        });
+    }
+
+    function ler(loja, chave) {
+        return executar(loja, "readonly", function (store) {
+            return store.get(chave);
+        });
+    }
+
+    function gravar(loja, valor, chave) {
+        return executar(loja, "readwrite", function (store) {
+            return store.put(valor, chave);
+        });
+    }
+
+    function apagar(loja, chave) {
+        return executar(loja, "readwrite", function (store) {
+            return store.delete(chave);
+        });
+    }
+
+    function listar(loja) {
+        return executar(loja, "readonly", function (store) {
+            return store.getAll();
+        });
+    }
+
+    /* ---------- sessão ---------- */
+
+    function definirUsuario(usuarioId) {
+        return gravar("sessao", usuarioId, "usuario_id");
+    }
+
+    function usuarioAtual() {
+        return ler("sessao", "usuario_id");
+    }
+
+    function encerrarSessao() {
+        return apagar("sessao", "usuario_id");
+    }
+
+    /* ---------- catálogo ---------- */
+
+    function normalizar(texto) {
+        return String(texto || "")
+            .normalize("NFD")
+            .replace(/[\u0300-\u036f]/g, "")
+            .toLowerCase();
+    }
+
+    function montarIndice(catalogo) {
+        const colunas = catalogo.colunas;
+        const posicao = {};
+
+        colunas.forEach(function (coluna, i) {
+            posicao[coluna] = i;
+        });
+
+        return catalogo.materiais.map(function (linha) {
+            const material = {
+                id: linha[posicao.id],
+                codigo: linha[posicao.codigo],
+                nome: linha[posicao.nome],
+                unidade: linha[posicao.unidade],
+                disponivel: linha[posicao.disponivel],
+            };
+
+            material.nomeBusca = normalizar(material.nome);
+            material.codigoBusca = normalizar(material.codigo);
+
+            return material;
+        });
+    }
+
+    function carregarIndice() {
+        if (indiceBusca) {
+            return Promise.resolve(indiceBusca);
+        }
+
+        return ler("catalogo", "atual").then(function (catalogo) {
+            if (catalogo) {
+                indiceBusca = montarIndice(catalogo);
+            }
+
+            return indiceBusca;
+        });
+    }
+
+    // Baixa o catálogo se mudou desde a última vez (If-None-Match com a
+    // versão guardada). Sem conexão, fica com a cópia local.
+    function atualizarCatalogo() {
+        return ler("catalogo", "atual").then(function (atual) {
+            const cabecalhos = { Accept: "application/json" };
+
+            if (atual) {
+                cabecalhos["If-None-Match"] = '"' + atual.versao + '"';
+            }
+
+            return fetch(URL_CATALOGO, {
+                headers: cabecalhos,
+                credentials: "same-origin",
+                cache: "no-store",
+            }).then(function (resposta) {
+                if (resposta.status === 304 || !resposta.ok || resposta.redirected) {
+                    return atual;
+                }
+
+                return resposta.json().then(function (catalogo) {
+                    catalogo.baixado_em = Date.now();
+
+                    return gravar("catalogo", catalogo, "atual").then(function () {
+                        indiceBusca = montarIndice(catalogo);
+                        return catalogo;
+                    });
+                });
+            }).catch(function () {
+                return atual;
+            });
+        });
+    }
+
+    // Resultados no formato do select2, ou null se ainda não há
+    // catálogo no aparelho (a página cai para a busca no servidor).
+    function buscarMateriais(termo) {
+        return carregarIndice().then(function (indice) {
+            if (!indice) {
+                return null;
+            }
+
+            const texto = normalizar(termo).trim();
+
+            if (!texto) {
+                return [];
+            }
+
+            const curto = texto.length < TAMANHO_MINIMO_TRECHO;
+            const resultados = [];
+
+            for (let i = 0; i < indice.length; i++) {
+                const material = indice[i];
+
+                const comeca = (
+                    material.nomeBusca.startsWith(texto)
+                    || material.codigoBusca.startsWith(texto)
+                );
+
+                if (comeca || (!curto && (
+                    material.nomeBusca.includes(texto)
+                    || material.codigoBusca.includes(texto)
+                ))) {
+                    resultados.push({ material: material, comeca: comeca });
+                }
+            }
+
+            // o índice já vem em ordem de nome; quem começa com o termo
+            // aparece primeiro
+            resultados.sort(function (a, b) {
+                return Number(b.comeca) - Number(a.comeca);
+            });
+
+            return resultados.slice(0, LIMITE_RESULTADOS).map(function (r) {
+                const m = r.material;
+
+                return {
+                    id: m.id,
+                    text: (m.codigo || "-") + " - " + m.nome,
+                    disponivel: m.disponivel,
+                    unidade: m.unidade,
+                };
+            });
+        });
+    }
+
+    /* ---------- fila de solicitações ---------- */
+
+    // campos: pares [nome, valor] do formulário (FormData.entries()).
+    function novaChave() {
+        if (escopo.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+
+        return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2);
+    }
+
+    // Se o formulário já saiu com uma chave (o service worker põe uma
+    // antes do primeiro envio), a fila usa a mesma.
+    function enfileirarSolicitacao(campos) {
+        let chave = null;
+
+        const demais = Array.from(campos).filter(function (campo) {
+            if (campo[0] === "chave") {
+                chave = campo[1];
+                return false;
+            }
+
+            return true;
+        });
+
+        return usuarioAtual().then(function (usuarioId) {
+            return executar("fila", "readwrite", function (store) {
+                return store.add({
+                    // chave de idempotência: reenvios do mesmo item não
+                    // duplicam a solicitação no servidor
+                    chave: chave || novaChave(),
+                    usuario_id: usuarioId,
+                    criada_em: Date.now(),
+                    campos: demais,
+                    erro: null,
+                });
+            });
+        }).then(function (id) {
+            return agendarEnvio().then(function () {
+                return id;
+            });
+        });
+    }
+
+    function listarFila() {
+        return Promise.all([usuarioAtual(), listar("fila")]).then(function (r) {
+            const usuarioId = r[0];
+
+            return r[1].filter(function (item) {
+                return item.usuario_id === usuarioId;
+            });
+        });
+    }
+
+    function descartar(id) {
+        return apagar("fila", id);
+    }
+
+    function avisarPaginas() {
+        if (escopo.clients && escopo.clients.matchAll) {
+            return escopo.clients.matchAll().then(function (paginas) {
+                paginas.forEach(function (pagina) {
+                    pagina.postMessage({ tipo: "fila-atualizada" });
+                });
+            });
+        }
+
+        if (escopo.dispatchEvent && escopo.CustomEvent) {
+            escopo.dispatchEvent(new CustomEvent("fila-atualizada"));
+        }
+
+        return Promise.resolve();
+    }
+
+    // Pares do formulário -> formato do /solicitacoes/lote.
+    function paraEnvio(item) {
+        const envio = { chave: item.chave, itens: [] };
+        const materiais = [];
+        const quantidades = [];
+
+        item.campos.forEach(function (campo) {
+            if (campo[0] === "material_id[]") {
+                materiais.push(campo[1]);
+            } else if (campo[0] === "qtd[]") {
+                quantidades.push(campo[1]);
+            } else {
+                envio[campo[0]] = campo[1];
+            }
+        });
+
+        materiais.forEach(function (materialId, i) {
+            envio.itens.push({ material_id: materialId, qtd: quantidades[i] });
+        });
+
+        return envio;
+    }
+
+    function enviarLote(itens) {
+        return fetch(URL_LOTE, {
+            method: "POST",
+            body: JSON.stringify({ solicitacoes: itens.map(paraEnvio) }),
+            credentials: "same-origin",
+            headers: {
+                Accept: "application/json",
+                "Content-Type": "application/json",
+            },
+        }).then(function (resposta) {
+            const tipo = resposta.headers.get("Content-Type") || "";
+
+            // sessão expirada: o login devolve HTML; tenta de novo depois
+            if (resposta.redirected || !tipo.includes("application/json")) {
+                throw new Error("Sessão expirada.");
+            }
+
+            if (!resposta.ok) {
+                throw new Error("Lote não aceito (" + resposta.status + ").");
+            }
+
+            return resposta.json();
+        }).then(function (dados) {
+            const porChave = {};
+
+            itens.forEach(function (item) {
+                porChave[item.chave] = item;
+            });
+
+            return Promise.all(dados.resultados.map(function (resultado) {
+                const item = porChave[resultado.chave];
+
+                if (resultado.resultado === "CRIADA") {
+                    return apagar("fila", item.id);
+                }
+
+                // recusada (saldo, material inativo...): fica na fila com
+                // o motivo, para o usuário ver e descartar
+                item.erro = resultado.erro || "Solicitação recusada.";
+                return gravar("fila", item);
+            }));
+        });
+    }
+
+    // Envia a fila do usuário logado em lotes. Cada item leva sua chave,
+    // então repetir um lote que já chegou ao servidor não duplica nada.
+    // Rejeita se faltar conexão, para o Background Sync tentar de novo.
+    function enviarFila() {
+        return listarFila().then(function (itens) {
+            const pendentes = itens.filter(function (item) {
+                return !item.erro;
+            });
+
+            let envio = Promise.resolve();
+
+            for (let i = 0; i < pendentes.length; i += TAMANHO_LOTE) {
+                const lote = pendentes.slice(i, i + TAMANHO_LOTE);
+
+                envio = envio.then(function () {
+                    return enviarLote(lote);
+                });
+            }
+
+            return envio;
+        }).finally(avisarPaginas);
+    }
+
+    function agendarEnvio() {
+        // dentro do service worker
+        if (escopo.registration) {
+            if (escopo.registration.sync) {
+                return escopo.registration.sync.register(TAG_SYNC);
+            }
+
+            return Promise.resolve();
+        }
+
+        if (!navigator.serviceWorker) {
+            return navigator.onLine
+                ? enviarFila().catch(function () {})
+                : Promise.resolve();
+        }
+
+        return navigator.serviceWorker.getRegistration().then(function (registro) {
+            if (registro && registro.sync) {
+                return registro.sync.register(TAG_SYNC);
+            }
+
+            // sem Background Sync (Safari): envia agora se houver rede,
+            // senão no evento "online" registrado em iniciar()
+            if (navigator.onLine) {
+                return enviarFila().catch(function () {});
+            }
+        });
+    }
+
+    /* ---------- páginas ---------- */
+
+    function iniciar(usuarioId) {
+        if (!("indexedDB" in escopo)) {
+            return Promise.resolve();
+        }
+
+        if (navigator.serviceWorker) {
+            navigator.serviceWorker.register("/sw.js").catch(function (erro) {
+                console.log("Service worker não registrado:", erro);
+            });
+
+            navigator.serviceWorker.addEventListener("message", function (evento) {
+                if (evento.data && evento.data.tipo === "fila-atualizada") {
+                    escopo.dispatchEvent(new CustomEvent("fila-atualizada"));
+                }
+            });
+        }
+
+        escopo.addEventListener("online", function () {
+            enviarFila().catch(function () {});
+        });
+
+        return definirUsuario(usuarioId).then(function () {
+            if (navigator.onLine) {
+                return enviarFila().catch(function () {});
+            }
+        });
+    }
+
+    escopo.EstoqueOffline = {
+        TAG_SYNC: TAG_SYNC,
+        URL_NOVA_SOLICITACAO: URL_NOVA_SOLICITACAO,
+        iniciar: iniciar,
+        encerrarSessao: encerrarSessao,
+        atualizarCatalogo: atualizarCatalogo,
+        buscarMateriais: buscarMateriais,
+        novaChave: novaChave,
+        enfileirarSolicitacao: enfileirarSolicitacao,
+        listarFila: listarFila,
+        descartar: descartar,
+        enviarFila: enviarFila,
+    };
+})(self);
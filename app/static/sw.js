@@ -0,0 +1,266 @@
+/*
+ * Service worker do app de estoque.
+ *
+ * - Arquivos estáticos (CSS/JS do CDN, estilo, logo): servidos do cache.
+ * - Páginas: rede primeiro; a tela de nova solicitação fica guardada e
+ *   é servida do aparelho quando a rede não responde.
+ * - POST de nova solicitação: sai com uma chave de idempotência; sem
+ *   rede, vai para a fila do IndexedDB com a mesma chave e é reenviado
+ *   pelo Background Sync (ou pela página, ao voltar a rede).
+ *
+ * Ao mudar a lista de arquivos ou o comportamento, suba VERSAO: o cache
+ * antigo é apagado na ativação.
+ */
+importScripts("/static/js/offline.js");
+
+const VERSAO = "v2";
+const CACHE_ESTATICOS = "estoque-estaticos-" + VERSAO;
+const CACHE_PAGINAS = "estoque-paginas-" + VERSAO;
+
+const ARQUIVOS_ESTATICOS = [
+    "/static/estilo.css",
+    "/static/logo.png",
+    "/static/js/offline.js",
+    "/static/manifest.json",
+    "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css",
+    "https://cdn.jsdelivr.net/npm/select2@4.1.0-rc.0/dist/css/select2.min.css",
+    "https://code.jquery.com/jquery-3.6.0.min.js",
+    "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js",
+    "https://cdn.jsdelivr.net/npm/select2@4.1.0-rc.0/dist/js/select2.min.js",
+];
+
+// Páginas guardadas para uso sem conexão.
+const PAGINAS_OFFLINE = [
+    EstoqueOffline.URL_NOVA_SOLICITACAO,
+];
+
+// Quanto esperar pela rede antes de servir a página guardada.
+const ESPERA_REDE_MS = 4000;
+
+const PAGINA_SEM_CONEXAO = `<!doctype html>
+<html lang="pt-br">
+<head>
+  <meta charset="utf-8">
+  <meta name="viewport" content="width=device-width, initial-scale=1">
+  <title>Sem conexão</title>
+  <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css">
+</head>
+<body class="bg-light">
+  <div class="container py-5 text-center">
+    <h4>Sem conexão</h4>
+    <p class="text-muted">Esta página não está disponível offline.</p>
+    <a class="btn btn-primary" href="${EstoqueOffline.URL_NOVA_SOLICITACAO}">
+      Nova solicitação
+    </a>
+  </div>
+</body>
+</html>`;
+
+self.addEventListener("install", function (evento) {
+    evento.waitUntil(
+        caches.open(CACHE_ESTATICOS).then(function (cache) {
+            return cache.addAll(
+                ARQUIVOS_ESTATICOS.map(function (url) {
+                    return new Request(url, { mode: "cors" });
+                })
+            );
+        }).then(function () {
+            return self.skipWaiting();
+        })
+    );
+});
+
+self.addEventListener("activate", function (evento) {
+    const atuais = [CACHE_ESTATICOS, CACHE_PAGINAS];
+
+    evento.waitUntil(
+        caches.keys().then(function (nomes) {
+            return Promise.all(
+                nomes
+                    .filter(function (nome) {
+                        return nome.startsWith("estoque-") && !atuais.includes(nome);
+                    })
+                    .map(function (nome) {
+                        return caches.delete(nome);
+                    })
+            );
+        }).then(function () {
+            return self.clients.claim();
+        })
+    );
+});
+
+function estatico(url) {
+    return (
+        url.pathname.startsWith("/static/")
+        || ARQUIVOS_ESTATICOS.includes(url.href)
+    );
+}
+
+function guardarEstatico(requisicao, resposta) {
+    if (resposta.ok) {
+        const copia = resposta.clone();
+
+        caches.open(CACHE_ESTATICOS).then(function (cache) {
+            cache.put(requisicao, copia);
+        });
+    }
+
+    return resposta;
+}
+
+// Arquivos do CDN têm a versão na URL: o que está guardado vale.
+// Os do próprio app são servidos do cache e atualizados em segundo
+// plano, para a próxima carga.
+function servirEstatico(requisicao, url) {
+    return caches.match(requisicao).then(function (guardada) {
+        if (guardada && url.origin !== self.location.origin) {
+            return guardada;
+        }
+
+        const daRede = fetch(requisicao).then(function (resposta) {
+            return guardarEstatico(requisicao, resposta);
+        });
+
+        if (!guardada) {
+            return daRede;
+        }
+
+        daRede.catch(function () {});
+
+        return guardada;
+    });
+}
+
+function comLimite(promessa, ms) {
+    return new Promise(function (resolve, reject) {
+        const timer = setTimeout(function () {
+            reject(new Error("Tempo esgotado."));
+        }, ms);
+
+        promessa.then(
+            function (valor) {
+                clearTimeout(timer);
+                resolve(valor);
+            },
+            function (erro) {
+                clearTimeout(timer);
+                reject(erro);
+            }
+        );
+    });
+}
+
+function semConexao(url) {
+    return caches.match(url.pathname, {
+        cacheName: CACHE_PAGINAS,
+        ignoreSearch: true,
+    }).then(function (guardada) {
+        return guardada || new Response(PAGINA_SEM_CONEXAO, {
+            status: 503,
+            headers: { "Content-Type": "text/html; charset=utf-8" },
+        });
+    });
+}
+
+function paginaRedePrimeiro(requisicao, url) {
+    const guardar = PAGINAS_OFFLINE.includes(url.pathname);
+
+    const daRede = fetch(requisicao).then(function (resposta) {
+        // só guarda a página de verdade, não o redirect para o login
+        if (guardar && resposta.ok && resposta.type === "basic" && !resposta.redirected) {
+            const copia = resposta.clone();
+
+            caches.open(CACHE_PAGINAS).then(function (cache) {
+                cache.put(url.pathname, copia);
+            });
+        }
+
+        return resposta;
+    });
+
+    if (!guardar) {
+        return daRede.catch(function () {
+            return semConexao(url);
+        });
+    }
+
+    return comLimite(daRede, ESPERA_REDE_MS).catch(function () {
+        return semConexao(url);
+    });
+}
+
+// A chave de idempotência vai já no primeiro envio: se a rede cair
+// depois de o servidor gravar, o reenvio pela fila usa a mesma chave e
+// recebe a solicitação já criada, em vez de duplicá-la.
+function postarSolicitacao(requisicao) {
+    return requisicao.formData().then(function (formulario) {
+        if (!formulario.get("chave")) {
+            formulario.set("chave", EstoqueOffline.novaChave());
+        }
+
+        return fetch(requisicao.url, {
+            method: "POST",
+            body: formulario,
+            credentials: "same-origin",
+            // navegação não aceita resposta já redirecionada
+            redirect: "manual",
+        }).catch(function () {
+            return EstoqueOffline.enfileirarSolicitacao(
+                formulario.entries()
+            ).then(function () {
+                return Response.redirect(
+                    EstoqueOffline.URL_NOVA_SOLICITACAO + "?pendente=1",
+                    303
+                );
+            });
+        });
+    });
+}
+
+function sair() {
+    // outro usuário pode entrar no mesmo aparelho
+    return Promise.all([
+        caches.delete(CACHE_PAGINAS),
+        EstoqueOffline.encerrarSessao(),
+    ]);
+}
+
+self.addEventListener("fetch", function (evento) {
+    const requisicao = evento.request;
+    const url = new URL(requisicao.url);
+
+    if (
+        requisicao.method === "POST"
+        && url.origin === self.location.origin
+        && url.pathname === EstoqueOffline.URL_NOVA_SOLICITACAO
+        && requisicao.mode === "navigate"
+    ) {
+        evento.respondWith(postarSolicitacao(requisicao));
+        return;
+    }
+
+    if (requisicao.method !== "GET") {
+        return;
+    }
+
+    if (estatico(url)) {
+        evento.respondWith(servirEstatico(requisicao, url));
+        return;
+    }
+
+    if (requisicao.mode === "navigate" && url.origin === self.location.origin) {
+        if (url.pathname === "/auth/logout") {
+            evento.waitUntil(sair());
+            return;
+        }
+
+        evento.respondWith(paginaRedePrimeiro(requisicao, url));
+    }
+});
+
+self.addEventListener("sync", function (evento) {
+    if (evento.tag === EstoqueOffline.TAG_SYNC) {
+        evento.waitUntil(EstoqueOffline.enviarFila());
+    }
+});
@@ -1,11 +1,325 @@
+"""Gera e restaura backups do banco de DATABASE_URL.
+
+Não sobe o app: lê só a URL do banco (config.py).
+
+PostgreSQL: pg_dump em formato custom (um arquivo) ou directory (uma
+pasta, que permite o dump em paralelo), comprimido. A restauração usa
+pg_restore com vários jobs.
+
+SQLite: cópia pela API de backup online do SQLite, que pode rodar com
+o app no ar, comprimida com gzip.
+
+Uso:
+  python backup.py                              # backup em backups/
+  python backup.py --formato directory --jobs 4
+  python backup.py --manter 14                  # guarda os 14 mais novos
+  python backup.py --restaurar backups/backup_20260101_020000.dump
+  python backup.py --restaurar ARQUIVO --destino postgresql://.../outro
+"""
+
+import argparse
+import gzip
 import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
 from datetime import datetime
-from app import create_app
-from app.extensions import db
+from pathlib import Path
+
+from sqlalchemy.engine import make_url
+
+from config import Config
+
+
+PREFIXO = "backup_"
+
+EXTENSOES = {
+    "custom": ".dump",
+    "directory": ".dir",
+    "sqlite": ".db.gz",
+}
+
+# O Flask-SQLAlchemy resolve "sqlite:///aruana.db" dentro da pasta
+# instance/ do projeto, e não no diretório atual.
+PASTA_INSTANCE = Path(__file__).resolve().parent / "instance"
+
+# Páginas copiadas por passo da API de backup do SQLite. Entre um passo
+# e outro o app consegue gravar no banco.
+PAGINAS_POR_PASSO = 1024
+
+
+def _parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=Config.SQLALCHEMY_DATABASE_URI)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--pasta", default="backups")
+    parser.add_argument(
+        "--formato",
+        choices=["custom", "directory"],
+        default="custom",
+        help="PostgreSQL: directory permite dump em paralelo (--jobs)",
+    )
+    parser.add_argument("--compressao", type=int, default=6, help="de 0 (sem) a 9")
+    parser.add_argument("--manter", type=int, default=7, help="backups guardados; 0 guarda todos")
+    parser.add_argument("--restaurar", metavar="ARQUIVO", help="restaura o backup em vez de gerar")
+    parser.add_argument("--destino", help="banco que recebe a restauração (padrão: --url)")
+    parser.add_argument(
+        "--limpar",
+        action="store_true",
+        help="PostgreSQL: apaga os objetos existentes antes de restaurar",
+    )
+    return parser
+
+
+def _url(texto):
+    url = make_url(texto)
+
+    # "postgres://" (Heroku e afins) e "postgresql+psycopg2://" são a
+    # mesma coisa para o pg_dump
+    if url.drivername.split("+")[0] in ("postgres", "postgresql"):
+        return url.set(drivername="postgresql")
+
+    if url.drivername.split("+")[0] == "sqlite":
+        return url.set(drivername="sqlite")
+
+    raise SystemExit(f"Banco não suportado: {url.drivername}")
+
+
+def _arquivo_sqlite(url):
+    caminho = Path(url.database or "")
+
+    if not url.database or url.database == ":memory:":
+        raise SystemExit("Banco SQLite em memória não tem backup.")
+
+    if not caminho.is_absolute():
+        caminho = PASTA_INSTANCE / caminho
+
+    return caminho
+
+
+def _ambiente_pg(url):
+    # a senha vai pelo ambiente, e não na linha de comando (visível no ps)
+    ambiente = dict(os.environ)
+
+    if url.password:
+        ambiente["PGPASSWORD"] = url.password
+
+    return ambiente, url.set(password=None).render_as_string(hide_password=False)
+
+
+def _tamanho(caminho):
+    if caminho.is_dir():
+        return sum(p.stat().st_size for p in caminho.rglob("*") if p.is_file())
+
+    return caminho.stat().st_size
+
+
+def _mb(caminho):
+    return f"{_tamanho(caminho) / 1024 / 1024:.1f} MB"
+
+
+def _remover(caminho):
+    if caminho.is_dir():
+        shutil.rmtree(caminho)
+    else:
+        caminho.unlink()
+
+
+# ------------------------------------------------------------------
+# Backup
+# ------------------------------------------------------------------
+def _backup_postgres(url, destino, formato, jobs, compressao):
+    ambiente, dbname = _ambiente_pg(url)
+
+    comando = [
+        "pg_dump",
+        f"--dbname={dbname}",
+        f"--format={formato}",
+        f"--compress={compressao}",
+        f"--file={destino}",
+    ]
+
+    if formato == "directory" and jobs > 1:
+        comando.append(f"--jobs={jobs}")
+
+    subprocess.run(comando, env=ambiente, check=True)
+
+
+def _backup_sqlite(url, destino, compressao):
+    arquivo = _arquivo_sqlite(url)
+
+    # sqlite3.connect criaria um banco vazio
+    if not arquivo.exists():
+        raise SystemExit(f"Banco SQLite não encontrado: {arquivo}")
+
+    origem = sqlite3.connect(arquivo)
+
+    with tempfile.TemporaryDirectory(dir=destino.parent) as pasta:
+        copia_caminho = Path(pasta) / "copia.db"
+        copia = sqlite3.connect(copia_caminho)
+
+        try:
+            origem.backup(copia, pages=PAGINAS_POR_PASSO)
+
+            verificacao = copia.execute("PRAGMA quick_check").fetchone()[0]
+
+            if verificacao != "ok":
+                raise SystemExit(f"Cópia do SQLite corrompida: {verificacao}")
+
+        finally:
+            copia.close()
+            origem.close()
+
+        with open(copia_caminho, "rb") as entrada, gzip.open(
+            destino, "wb", compresslevel=compressao
+        ) as saida:
+            shutil.copyfileobj(entrada, saida, 1024 * 1024)
+
+
+def gerar(args):
+    url = _url(args.url)
+    pasta = Path(args.pasta)
+    pasta.mkdir(parents=True, exist_ok=True)
+
+    sqlite = url.drivername == "sqlite"
+    extensao = EXTENSOES["sqlite" if sqlite else args.formato]
+
+    nome = f"{PREFIXO}{datetime.now().strftime('%Y%m%d_%H%M%S')}{extensao}"
+    destino = pasta / nome
+
+    # grava com outro nome e renomeia no fim: um backup interrompido
+    # não é confundido com um pronto pela rotação nem pela restauração
+    parcial = pasta / f".{nome}.parcial"
+
+    inicio = time.perf_counter()
+
+    try:
+        if sqlite:
+            _backup_sqlite(url, parcial, args.compressao)
+        else:
+            _backup_postgres(
+                url, parcial, args.formato, args.jobs, args.compressao
+            )
+    except BaseException:
+        if parcial.exists():
+            _remover(parcial)
+        raise
+
+    parcial.rename(destino)
+
+    print(
+        f"Backup gerado: {destino} ({_mb(destino)}) "
+        f"em {time.perf_counter() - inicio:.1f} s"
+    )
+
+    if args.manter:
+        rotacionar(pasta, args.manter)
+
+
+def rotacionar(pasta, manter):
+    """
+    Apaga os backups mais antigos da pasta, deixando os `manter` mais
+    novos. O nome tem a data, então a ordem alfabética é a cronológica.
+    """
+    backups = sorted(
+        caminho
+        for caminho in pasta.iterdir()
+        if caminho.name.startswith(PREFIXO)
+        and caminho.name.endswith(tuple(EXTENSOES.values()))
+    )
+
+    for antigo in backups[:-manter]:
+        _remover(antigo)
+        print(f"Backup antigo removido: {antigo}")
+
+
+# ------------------------------------------------------------------
+# Restauração
+# ------------------------------------------------------------------
+def _restaurar_postgres(url, arquivo, jobs, limpar):
+    ambiente, dbname = _ambiente_pg(url)
+
+    comando = [
+        "pg_restore",
+        f"--dbname={dbname}",
+        f"--jobs={max(jobs, 1)}",
+        "--no-owner",
+        "--no-privileges",
+        "--exit-on-error",
+    ]
+
+    if limpar:
+        comando += ["--clean", "--if-exists"]
+
+    comando.append(str(arquivo))
+
+    subprocess.run(comando, env=ambiente, check=True)
+
+
+def _restaurar_sqlite(url, arquivo):
+    destino = _arquivo_sqlite(url)
+
+    with tempfile.TemporaryDirectory(dir=destino.parent) as pasta:
+        copia_caminho = Path(pasta) / "copia.db"
+
+        with gzip.open(arquivo, "rb") as entrada, open(
+            copia_caminho, "wb"
+        ) as saida:
+            shutil.copyfileobj(entrada, saida, 1024 * 1024)
+
+        # pela API de backup, no sentido contrário: o banco de destino
+        # fica consistente para quem estiver conectado
+        copia = sqlite3.connect(copia_caminho)
+        banco = sqlite3.connect(destino)
+
+        try:
+            copia.backup(banco)
+        finally:
+            banco.close()
+            copia.close()
+
+
+def restaurar(args):
+    arquivo = Path(args.restaurar)
+
+    if not arquivo.exists():
+        raise SystemExit(f"Arquivo não encontrado: {arquivo}")
+
+    url = _url(args.destino or args.url)
+
+    inicio = time.perf_counter()
+
+    if url.drivername == "sqlite":
+        _restaurar_sqlite(url, arquivo)
+    else:
+        _restaurar_postgres(url, arquivo, args.jobs, args.limpar)
+
+    print(
+        f"Backup restaurado: {arquivo} "
+        f"em {time.perf_counter() - inicio:.1f} s"
+    )
+
+
+def main():
+    args = _parser().parse_args()
+
+    try:
+        if args.restaurar:
+            restaurar(args)
+        else:
+            gerar(args)
+
+    except FileNotFoundError as erro:
+        # pg_dump/pg_restore fora do PATH
+        raise SystemExit(f"Comando não encontrado: {erro.filename}")
+
+    except subprocess.CalledProcessError as erro:
+        print(f"{erro.cmd[0]} terminou com erro {erro.returncode}.")
+        sys.exit(erro.returncode)
 
-app = create_app()
 
-with app.app_context():
-    filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M')}.sql"
-    os.system(f"pg_dump $DATABASE_URL > {filename}")
-    print("Backup gerado:", filename)
+if __name__ == "__main__":
+    main()
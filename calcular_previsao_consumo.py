@@ -0,0 +1,20 @@
+"""Recalcula a previsão de consumo e o ponto de reposição dos materiais.
+
+Uso (agendar uma vez por noite, ex.: cron 0 2 * * *):
+  python calcular_previsao_consumo.py
+"""
+
+from app import create_app
+from app.services.previsao_service import recalcular_previsoes
+
+
+def main():
+    app = create_app()
+
+    with app.app_context():
+        total = recalcular_previsoes()
+        print(f"Previsão recalculada para {total} material(is).")
+
+
+if __name__ == "__main__":
+    main()
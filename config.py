@@ -10,3 +10,51 @@ class Config:
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Previsão de consumo (calcular_previsao_consumo.py)
+    PREVISAO_HISTORICO_DIAS = int(os.environ.get("PREVISAO_HISTORICO_DIAS", 180))
+    PREVISAO_JANELA_MEDIA_DIAS = int(os.environ.get("PREVISAO_JANELA_MEDIA_DIAS", 30))
+    PREVISAO_ALPHA = float(os.environ.get("PREVISAO_ALPHA", 0.1))
+    PREVISAO_PRAZO_REPOSICAO_DIAS = float(os.environ.get("PREVISAO_PRAZO_REPOSICAO_DIAS", 7))
+    PREVISAO_FATOR_SEGURANCA = float(os.environ.get("PREVISAO_FATOR_SEGURANCA", 1.65))
+
+    # Instrumentação de consultas por requisição (app/instrumentacao.py)
+    INSTRUMENTACAO_ATIVA = os.environ.get("INSTRUMENTACAO_ATIVA", "1") == "1"
+    # Server-Timing vai só para administradores; "1" libera para todos (depuração)
+    INSTRUMENTACAO_SERVER_TIMING = os.environ.get("INSTRUMENTACAO_SERVER_TIMING", "0") == "1"
+    INSTRUMENTACAO_CONSULTA_LENTA_MS = float(os.environ.get("INSTRUMENTACAO_CONSULTA_LENTA_MS", 100))
+    INSTRUMENTACAO_REQUISICAO_LENTA_MS = float(os.environ.get("INSTRUMENTACAO_REQUISICAO_LENTA_MS", 1000))
+    INSTRUMENTACAO_LIMITE_CONSULTAS = int(os.environ.get("INSTRUMENTACAO_LIMITE_CONSULTAS", 50))
+
+    # Métricas Prometheus em /metrics (app/metricas.py); sem token só
+    # ficam ativas em debug
+    METRICAS_ATIVAS = os.environ.get("METRICAS_ATIVAS", "1") == "1"
+    METRICAS_TOKEN = os.environ.get("METRICAS_TOKEN", "")
+
+    # Atualizações de banco (app/database_updates/runner.py): quanto um
+    # comando espera por trava antes de desistir. Vazio desliga o limite.
+    ATUALIZACAO_LOCK_TIMEOUT = os.environ.get("ATUALIZACAO_LOCK_TIMEOUT", "5s")
+
+    # Correções de dados em lotes (app/database_updates/lotes.py)
+    ATUALIZACAO_LOTE_TAMANHO = int(os.environ.get("ATUALIZACAO_LOTE_TAMANHO", 5000))
+    ATUALIZACAO_LOTE_PAUSA_SEGUNDOS = float(os.environ.get("ATUALIZACAO_LOTE_PAUSA_SEGUNDOS", 0.1))
+
+    # Arquivo de solicitações finalizadas (app/services/arquivo_solicitacoes_service.py).
+    # Pasta relativa fica dentro de instance/.
+    ARQUIVO_PASTA = os.environ.get("ARQUIVO_PASTA", "arquivo")
+    ARQUIVO_MESES = int(os.environ.get("ARQUIVO_MESES", 24))
+    ARQUIVO_SOLICITACOES_POR_ARQUIVO = int(os.environ.get("ARQUIVO_SOLICITACOES_POR_ARQUIVO", 5000))
+
+    # Réplica de leitura para relatórios e dashboard (app/replica.py),
+    # ligada por DATABASE_URL_REPLICA. Atrasada além do limite, as
+    # leituras voltam para o banco principal.
+    REPLICA_ATRASO_MAXIMO_SEGUNDOS = float(os.environ.get("REPLICA_ATRASO_MAXIMO_SEGUNDOS", 30))
+    REPLICA_VERIFICACAO_SEGUNDOS = float(os.environ.get("REPLICA_VERIFICACAO_SEGUNDOS", 10))
+
+    # SQLite com WAL e escritas serializadas, para vários workers
+    # (app/banco_sqlite.py). Só vale quando o banco é SQLite.
+    SQLITE_OTIMIZADO = os.environ.get("SQLITE_OTIMIZADO", "1") == "1"
+    SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+    SQLITE_MMAP_MB = int(os.environ.get("SQLITE_MMAP_MB", 256))
+    SQLITE_CACHE_MB = int(os.environ.get("SQLITE_CACHE_MB", 64))
@@ -0,0 +1,21 @@
+# Carregado automaticamente pelo gunicorn quando iniciado nesta pasta.
+import glob
+import os
+
+
+def on_starting(server):
+    # Arquivos de métricas de uma execução anterior distorcem os totais.
+    pasta = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+
+        for arquivo in glob.glob(os.path.join(pasta, "*.db")):
+            os.remove(arquivo)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
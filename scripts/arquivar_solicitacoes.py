@@ -0,0 +1,56 @@
+"""Move solicitações finalizadas antigas do banco para o arquivo.
+
+Solicitações ENTREGUE, REJEITADA ou CANCELADA de antes do mês de
+--meses atrás (padrão: ARQUIVO_MESES) vão, com itens, entregas e
+histórico, para arquivos .jsonl.gz em ARQUIVO_PASTA. Agendar uma vez
+por mês (ex.: cron 0 3 1 * *).
+
+  DATABASE_URL=... python -m scripts.arquivar_solicitacoes [--meses 24]
+"""
+
+import argparse
+import sys
+import time
+
+from app import create_app
+from app.services.arquivo_solicitacoes_service import (
+    arquivar_solicitacoes,
+    calcular_corte,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--meses", type=int)
+    parser.add_argument("--limite", type=int, help="no máximo N solicitações nesta execução")
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        meses = args.meses or app.config["ARQUIVO_MESES"]
+        inicio = time.perf_counter()
+
+        try:
+            criados = arquivar_solicitacoes(meses, limite=args.limite)
+        except ValueError as erro:
+            print(erro)
+            sys.exit(1)
+
+        duracao = time.perf_counter() - inicio
+
+        print(f"Corte: finalizadas antes de {calcular_corte(meses):%d/%m/%Y}.")
+
+        for registro in criados:
+            print(
+                f"  {registro.arquivo}: {registro.quantidade} solicitação(ões), "
+                f"{registro.tamanho_bytes / 1024:.0f} KB"
+            )
+
+        total = sum(registro.quantidade for registro in criados)
+
+        print(f"{total} solicitação(ões) arquivada(s) em {duracao:.1f} s.")
+
+
+if __name__ == "__main__":
+    main()
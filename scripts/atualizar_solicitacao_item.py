@@ -1,6 +1,7 @@
 from sqlalchemy import text
 
 from app import create_app
+from app.database_updates.lotes import preencher_em_lotes
 from app.extensions import db
 
 
@@ -41,9 +42,17 @@ def executar():
             for comando in comandos:
                 db.session.execute(text(comando))
 
-            # Ajusta os itens antigos conforme o status da solicitação.
-            db.session.execute(
-                text(
+            db.session.commit()
+
+            # Ajusta os itens antigos conforme o status da solicitação,
+            # em lotes, sem travar a tabela inteira.
+            with db.engine.connect().execution_options(
+                isolation_level="AUTOCOMMIT"
+            ) as conexao:
+                preencher_em_lotes(
+                    conexao,
+                    "script_atualizar_solicitacao_item",
+                    "solicitacao_item",
                     """
                     UPDATE solicitacao_item AS item
                     SET
@@ -71,11 +80,10 @@ def executar():
                     FROM solicitacao
 
                     WHERE solicitacao.id = item.solicitacao_id
-                    """
+                      AND item.id > :inicio
+                      AND item.id <= :fim
+                    """,
                 )
-            )
-
-            db.session.commit()
 
             print("========================================")
             print("BANCO ATUALIZADO COM SUCESSO")
@@ -0,0 +1,473 @@
+"""Mede o tempo de resposta das telas, buscas, fluxos e exportações.
+
+Dois modos:
+
+- padrão: usa o test client do Flask no próprio processo, contra o
+  banco de DATABASE_URL (de preferência gerado por
+  scripts.gerar_dados_sinteticos). Cobre leitura, criação, aprovação
+  e entrega de solicitações, e todas as exportações.
+
+    DATABASE_URL=... python -m scripts.benchmark --repeticoes 20
+
+- HTTP: dispara as requisições de leitura contra um servidor já no ar,
+  com várias conexões simultâneas.
+
+    python -m scripts.benchmark --url http://localhost:8000 --concorrencia 8
+
+O resultado vai para um JSON (benchmarks/ por padrão). Para comparar
+com uma execução anterior:
+
+    python -m scripts.benchmark --comparar benchmarks/antes.json
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import re
+import statistics
+import subprocess
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+PASTA_RESULTADOS = "benchmarks"
+
+SUFIXOS_EXPORTACAO = (".xlsx", ".pdf", ".csv", "/excel", "/pdf")
+
+# Variação (em %) a partir da qual a comparação destaca o cenário.
+LIMIAR_COMPARACAO = 10
+
+_CONSULTAS = re.compile(r'desc="(\d+) consultas"')
+
+
+def _parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeticoes", type=int, default=10)
+    parser.add_argument("--aquecimento", type=int, default=1)
+    parser.add_argument("--login", default="admin")
+    parser.add_argument("--senha", default="123")
+    parser.add_argument("--filtro", default="", help="só cenários cujo nome contém o texto")
+    parser.add_argument("--url", help="servidor a testar via HTTP")
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--saida", help="arquivo JSON do resultado")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    return parser
+
+
+def _percentil(valores, fracao):
+    ordenados = sorted(valores)
+    posicao = min(int(round(fracao * (len(ordenados) - 1))), len(ordenados) - 1)
+    return ordenados[posicao]
+
+
+def _resumir(tempos, consultas, status):
+    tempos_ms = [t * 1000 for t in tempos]
+
+    return {
+        "n": len(tempos_ms),
+        "min_ms": round(min(tempos_ms), 2),
+        "p50_ms": round(statistics.median(tempos_ms), 2),
+        "p95_ms": round(_percentil(tempos_ms, 0.95), 2),
+        "max_ms": round(max(tempos_ms), 2),
+        "media_ms": round(statistics.fmean(tempos_ms), 2),
+        "consultas": max(consultas) if consultas else None,
+        "status": sorted(set(status)),
+    }
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ------------------------------------------------------------------
+# Cenários
+# ------------------------------------------------------------------
+def _contexto(app):
+    """
+    Ids usados pelos cenários, escolhidos de forma determinística
+    para que duas execuções sobre o mesmo banco sejam comparáveis.
+    """
+    from sqlalchemy import func, select
+
+    from app.extensions import db
+    from app.models import Material, Solicitacao, SolicitacaoItem
+
+    with app.app_context():
+        material_id = db.session.execute(
+            select(SolicitacaoItem.material_id)
+            .group_by(SolicitacaoItem.material_id)
+            .order_by(func.count().desc(), SolicitacaoItem.material_id)
+            .limit(1)
+        ).scalar()
+
+        solicitacao_id = db.session.execute(
+            select(func.max(Solicitacao.id))
+        ).scalar()
+
+        # materiais com folga para criar/aprovar/entregar várias vezes
+        materiais_fluxo = db.session.execute(
+            select(Material.id)
+            .where(
+                Material.ativo.is_(True),
+                Material.saldo_atual - Material.reservado_atual >= 100,
+            )
+            .order_by(Material.id)
+            .limit(3)
+        ).scalars().all()
+
+        termo = db.session.execute(
+            select(Material.nome).order_by(Material.id).limit(1)
+        ).scalar() or "cimento"
+
+    return {
+        "material_id": material_id,
+        "solicitacao_id": solicitacao_id,
+        "materiais_fluxo": materiais_fluxo,
+        "termo": termo.split()[0].lower(),
+    }
+
+
+def cenarios_leitura(app, ctx):
+    cenarios = [
+        ("dashboard", "/dashboard"),
+        ("materiais", "/materiais"),
+        ("materiais_pagina_10", "/materiais?page=10"),
+        ("materiais_busca", f"/materiais?busca={ctx['termo']}"),
+        ("materiais_buscar_json", f"/materiais/buscar?q={ctx['termo']}"),
+        ("solicitacoes", "/solicitacoes"),
+        ("solicitacoes_pendentes_qtd", "/solicitacoes/pendentes/qtd"),
+        ("entradas", "/entradas"),
+        ("relatorio_solicitacoes", "/relatorios/solicitacoes"),
+        ("kardex", f"/relatorios/kardex?material_id={ctx['material_id']}"),
+    ]
+
+    if ctx["solicitacao_id"]:
+        cenarios.append(
+            ("solicitacao_detalhe", f"/solicitacoes/{ctx['solicitacao_id']}")
+        )
+
+    # todas as exportações registradas, descobertas pelo url_map
+    for regra in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if (
+            "GET" in regra.methods
+            and not regra.arguments
+            and regra.rule.endswith(SUFIXOS_EXPORTACAO)
+        ):
+            url = regra.rule
+
+            if "kardex" in url:
+                url += f"?material_id={ctx['material_id']}"
+
+            cenarios.append((f"exportar:{regra.endpoint}", url))
+
+    return cenarios
+
+
+# ------------------------------------------------------------------
+# Modo test client
+# ------------------------------------------------------------------
+class ClienteLocal:
+    def __init__(self, app, login, senha):
+        self.client = app.test_client()
+
+        resposta = self.client.post(
+            "/auth/login",
+            data={"login": login, "senha": senha},
+        )
+
+        if resposta.status_code != 302 or "login" in resposta.location:
+            raise SystemExit("Não foi possível entrar com o usuário informado.")
+
+    def executar(self, metodo, url, dados=None):
+        inicio = time.perf_counter()
+
+        resposta = self.client.open(url, method=metodo, data=dados)
+        # consome e fecha a resposta, incluindo as que vêm em streaming
+        resposta.get_data()
+        resposta.close()
+
+        duracao = time.perf_counter() - inicio
+
+        achado = _CONSULTAS.search(resposta.headers.get("Server-Timing", ""))
+
+        return (
+            duracao,
+            int(achado.group(1)) if achado else None,
+            resposta.status_code,
+            resposta,
+        )
+
+
+def _medir(cliente, repeticoes, aquecimento, metodo, url, dados=None):
+    for _ in range(aquecimento):
+        cliente.executar(metodo, url, dados)
+
+    tempos, consultas, status = [], [], []
+
+    for _ in range(repeticoes):
+        duracao, total, codigo, _ = cliente.executar(metodo, url, dados)
+        tempos.append(duracao)
+        status.append(codigo)
+
+        if total is not None:
+            consultas.append(total)
+
+    return _resumir(tempos, consultas, status)
+
+
+def _medir_fluxo(app, cliente, ctx, repeticoes):
+    """
+    Cria, aprova e entrega `repeticoes` solicitações, medindo cada
+    etapa separadamente.
+    """
+    from sqlalchemy import func, select
+
+    from app.extensions import db
+    from app.models import Solicitacao
+
+    if not ctx["materiais_fluxo"]:
+        print("  (fluxo ignorado: nenhum material com saldo disponível)")
+        return {}
+
+    etapas = {"criar": [], "aprovar": [], "entregar": []}
+    consultas = {"criar": [], "aprovar": [], "entregar": []}
+    status = {"criar": [], "aprovar": [], "entregar": []}
+
+    dados_criacao = {
+        "local_torre": "01",
+        "local_pav": "Pav 1",
+        "local_apto": "101",
+        "material_id[]": [str(m) for m in ctx["materiais_fluxo"]],
+        "qtd[]": ["1"] * len(ctx["materiais_fluxo"]),
+    }
+
+    for _ in range(repeticoes):
+        duracao, total, codigo, _ = cliente.executar(
+            "POST", "/solicitacoes/nova", dados_criacao
+        )
+        etapas["criar"].append(duracao)
+        consultas["criar"].append(total)
+        status["criar"].append(codigo)
+
+        with app.app_context():
+            solicitacao_id = db.session.execute(
+                select(func.max(Solicitacao.id))
+            ).scalar()
+
+        for etapa in ("aprovar", "entregar"):
+            duracao, total, codigo, _ = cliente.executar(
+                "POST", f"/solicitacoes/{solicitacao_id}/{etapa}"
+            )
+            etapas[etapa].append(duracao)
+            consultas[etapa].append(total)
+            status[etapa].append(codigo)
+
+    return {
+        f"fluxo:{etapa}": _resumir(
+            etapas[etapa],
+            [c for c in consultas[etapa] if c is not None],
+            status[etapa],
+        )
+        for etapa in etapas
+    }
+
+
+def executar_local(args):
+    from app import create_app
+    from app.extensions import db
+    from app.models import Material, Solicitacao, SolicitacaoItem
+
+    app = create_app()
+    ctx = _contexto(app)
+    cliente = ClienteLocal(app, args.login, args.senha)
+
+    with app.app_context():
+        volumes = {
+            "materiais": Material.query.count(),
+            "solicitacoes": Solicitacao.query.count(),
+            "itens": SolicitacaoItem.query.count(),
+        }
+        banco = db.engine.dialect.name
+
+    resultados = {}
+
+    for nome, url in cenarios_leitura(app, ctx):
+        if args.filtro and args.filtro not in nome:
+            continue
+
+        resultados[nome] = _medir(
+            cliente, args.repeticoes, args.aquecimento, "GET", url
+        )
+        print(f"  {nome:55s} p50 {resultados[nome]['p50_ms']:9.1f} ms")
+
+    if not args.filtro or "fluxo" in args.filtro:
+        for nome, resumo in _medir_fluxo(app, cliente, ctx, args.repeticoes).items():
+            resultados[nome] = resumo
+            print(f"  {nome:55s} p50 {resumo['p50_ms']:9.1f} ms")
+
+    return {
+        "modo": "local",
+        "banco": banco,
+        "volumes": volumes,
+        "cenarios": resultados,
+    }
+
+
+# ------------------------------------------------------------------
+# Modo HTTP
+# ------------------------------------------------------------------
+def _abrir_sessao(base, login, senha):
+    opener = urllib.request.build_opener(
+        urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+    )
+    opener.open(
+        base + "/auth/login",
+        data=urllib.parse.urlencode({"login": login, "senha": senha}).encode(),
+    ).read()
+    return opener
+
+
+def _requisicao_http(opener, url):
+    inicio = time.perf_counter()
+
+    try:
+        with opener.open(url) as resposta:
+            resposta.read()
+            status = resposta.status
+            timing = resposta.headers.get("Server-Timing", "")
+    except urllib.error.HTTPError as erro:
+        status = erro.code
+        timing = ""
+
+    achado = _CONSULTAS.search(timing)
+
+    return (
+        time.perf_counter() - inicio,
+        int(achado.group(1)) if achado else None,
+        status,
+    )
+
+
+def executar_http(args):
+    from app import create_app
+
+    base = args.url.rstrip("/")
+
+    # o app local só é usado para listar as rotas e escolher ids
+    app = create_app()
+    ctx = _contexto(app)
+
+    sessoes = [
+        _abrir_sessao(base, args.login, args.senha)
+        for _ in range(args.concorrencia)
+    ]
+
+    resultados = {}
+
+    for nome, url in cenarios_leitura(app, ctx):
+        if args.filtro and args.filtro not in nome:
+            continue
+
+        total = args.repeticoes * args.concorrencia
+
+        with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+            for _ in range(args.aquecimento):
+                _requisicao_http(sessoes[0], base + url)
+
+            inicio = time.perf_counter()
+            medidas = list(executor.map(
+                lambda n: _requisicao_http(sessoes[n % len(sessoes)], base + url),
+                range(total),
+            ))
+            decorrido = time.perf_counter() - inicio
+
+        resumo = _resumir(
+            [m[0] for m in medidas],
+            [m[1] for m in medidas if m[1] is not None],
+            [m[2] for m in medidas],
+        )
+        resumo["requisicoes_por_segundo"] = round(total / decorrido, 1)
+        resultados[nome] = resumo
+
+        print(
+            f"  {nome:55s} p50 {resumo['p50_ms']:9.1f} ms  "
+            f"{resumo['requisicoes_por_segundo']:7.1f} req/s"
+        )
+
+    return {
+        "modo": "http",
+        "url": base,
+        "concorrencia": args.concorrencia,
+        "cenarios": resultados,
+    }
+
+
+# ------------------------------------------------------------------
+# Comparação
+# ------------------------------------------------------------------
+def comparar(anterior, atual):
+    print(f"\n{'cenário':55s} {'antes':>9s} {'agora':>9s} {'var.':>7s}")
+
+    for nome, resumo in atual["cenarios"].items():
+        base = anterior["cenarios"].get(nome)
+
+        if not base:
+            continue
+
+        variacao = (resumo["p50_ms"] - base["p50_ms"]) / base["p50_ms"] * 100
+        marca = ""
+
+        if variacao >= LIMIAR_COMPARACAO:
+            marca = "  pior"
+        elif variacao <= -LIMIAR_COMPARACAO:
+            marca = "  melhor"
+
+        print(
+            f"{nome:55s} {base['p50_ms']:9.1f} {resumo['p50_ms']:9.1f} "
+            f"{variacao:6.1f}%{marca}"
+        )
+
+
+def main():
+    args = _parser().parse_args()
+
+    print("Executando cenários...")
+    resultado = executar_http(args) if args.url else executar_local(args)
+
+    resultado.update({
+        "executado_em": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_atual(),
+        "repeticoes": args.repeticoes,
+    })
+
+    saida = args.saida or os.path.join(
+        PASTA_RESULTADOS,
+        f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json",
+    )
+    os.makedirs(os.path.dirname(saida) or ".", exist_ok=True)
+
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+
+    print(f"Resultado gravado em {saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            comparar(json.load(arquivo), resultado)
+
+
+if __name__ == "__main__":
+    main()
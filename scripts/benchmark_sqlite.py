@@ -0,0 +1,351 @@
+"""Compara o SQLite no modo padrão com o modo otimizado (WAL).
+
+Simula vários workers do gunicorn, cada um num processo: escritores
+criam, aprovam e entregam solicitações sem parar, enquanto leitores
+abrem relatórios e exportações. Cada modo roda sobre uma cópia do
+banco de DATABASE_URL, com o journal_mode correspondente, e o
+resultado traz vazão, latências e quantos "database is locked"
+apareceram.
+
+  DATABASE_URL=sqlite:///... python -m scripts.benchmark_sqlite
+  python -m scripts.benchmark_sqlite --escritores 4 --leitores 4 --duracao 60
+
+- padrao: rollback journal, sem pragmas (SQLITE_OTIMIZADO=0).
+- otimizado: app/banco_sqlite.py (SQLITE_OTIMIZADO=1).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from sqlalchemy.engine import make_url
+
+from config import Config
+from scripts.benchmark import PASTA_RESULTADOS, ClienteLocal, _resumir
+
+
+MODOS = {
+    "padrao": {"SQLITE_OTIMIZADO": "0", "journal_mode": "DELETE"},
+    "otimizado": {"SQLITE_OTIMIZADO": "1", "journal_mode": "WAL"},
+}
+
+URLS_LEITURA = [
+    "/dashboard",
+    "/relatorios/solicitacoes",
+    "/relatorios/estoque",
+    "/relatorios/saidas",
+    # o material mais movimentado durante a medição
+    "/relatorios/kardex.xlsx?material_id={material_id}",
+]
+
+# Saldo somado aos materiais do fluxo na cópia, para as entregas não
+# esgotarem o estoque durante a medição.
+SALDO_EXTRA = 1_000_000
+
+PASTA_INSTANCE = Path(__file__).resolve().parent.parent / "instance"
+
+
+def _parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=Config.SQLALCHEMY_DATABASE_URI)
+    parser.add_argument("--modos", default="padrao,otimizado")
+    parser.add_argument("--escritores", type=int, default=2)
+    parser.add_argument("--leitores", type=int, default=2)
+    parser.add_argument("--duracao", type=float, default=20, help="segundos por modo")
+    parser.add_argument("--login", default="admin")
+    parser.add_argument("--senha", default="123")
+    parser.add_argument("--saida", help="arquivo JSON do resultado")
+    return parser
+
+
+def _arquivo_banco(texto):
+    url = make_url(texto)
+
+    if url.drivername.split("+")[0] != "sqlite" or not url.database:
+        raise SystemExit("Informe um banco SQLite em arquivo (--url).")
+
+    caminho = Path(url.database)
+
+    if not caminho.is_absolute():
+        caminho = PASTA_INSTANCE / caminho
+
+    if not caminho.exists():
+        raise SystemExit(f"Banco SQLite não encontrado: {caminho}")
+
+    return caminho
+
+
+def _preparar_copia(origem, destino, journal_mode, login):
+    """
+    Copia o banco e escolhe o usuário e os materiais do fluxo. O
+    journal_mode fica gravado no arquivo, então cada modo parte de uma
+    cópia própria.
+    """
+    banco_origem = sqlite3.connect(origem)
+    banco = sqlite3.connect(destino)
+
+    try:
+        banco_origem.backup(banco)
+        banco.execute(f"PRAGMA journal_mode={journal_mode}")
+
+        usuario = banco.execute(
+            'SELECT id FROM "user" WHERE login = ?', (login,)
+        ).fetchone()
+
+        materiais = [
+            material_id
+            for (material_id,) in banco.execute(
+                """
+                SELECT id FROM material
+                WHERE ativo = 1
+                ORDER BY saldo_atual - reservado_atual DESC, id
+                LIMIT 3
+                """
+            )
+        ]
+
+        banco.execute(
+            f"""
+            UPDATE material SET saldo_atual = saldo_atual + ?
+            WHERE id IN ({",".join("?" * len(materiais))})
+            """,
+            [SALDO_EXTRA, *materiais],
+        )
+        # o mesmo no almoxarifado central, de onde as entregas saem
+        banco.execute(
+            f"""
+            INSERT INTO estoque_local (material_id, local_id, saldo)
+            SELECT m.id, (
+                SELECT MIN(l.id) FROM local_estoque l
+                WHERE l.obra_id = m.obra_id AND l.central = 1
+            ), ?
+            FROM material m
+            WHERE m.id IN ({",".join("?" * len(materiais))})
+            ON CONFLICT (material_id, local_id)
+            DO UPDATE SET saldo = saldo + excluded.saldo
+            """,
+            [SALDO_EXTRA, *materiais],
+        )
+        banco.commit()
+
+    finally:
+        banco.close()
+        banco_origem.close()
+
+    if not usuario or not materiais:
+        raise SystemExit("O banco precisa do usuário informado e de materiais ativos.")
+
+    return usuario[0], materiais
+
+
+def _eh_travamento(erro):
+    return "database is locked" in str(erro)
+
+
+def _escrever(app, usuario_id, materiais):
+    """Um ciclo completo: criar, aprovar e entregar."""
+    from app.services import solicitacao_service
+
+    with app.test_request_context("/", method="POST"):
+        solicitacao = solicitacao_service.criar_solicitacao(
+            usuario_id=usuario_id,
+            observacao="benchmark_sqlite",
+            local_torre="01",
+            local_pav="Pav 1",
+            local_apto="101",
+            materiais_ids=[str(m) for m in materiais],
+            quantidades=["1"] * len(materiais),
+        )
+        solicitacao_id = solicitacao.id
+
+    for operacao in (
+        solicitacao_service.aprovar_todos_pendentes,
+        solicitacao_service.entregar_itens_aprovados,
+    ):
+        with app.test_request_context("/", method="POST"):
+            operacao(
+                solicitacao=solicitacao_service.obter_solicitacao(solicitacao_id),
+                usuario_id=usuario_id,
+            )
+
+
+def _trabalhador(papel, numero, modo, banco, args, usuario_id, materiais, barreira, fila):
+    # a configuração é lida do ambiente na importação do app
+    os.environ["DATABASE_URL"] = f"sqlite:///{banco}"
+    os.environ["SQLITE_OTIMIZADO"] = MODOS[modo]["SQLITE_OTIMIZADO"]
+    os.environ["METRICAS_ATIVAS"] = "0"
+
+    from app import create_app
+    from app.extensions import db
+
+    app = create_app()
+    # exceções chegam aqui em vez de virar página de erro
+    app.testing = True
+    app.logger.disabled = True
+
+    cliente = ClienteLocal(app, args.login, args.senha) if papel == "leitura" else None
+
+    barreira.wait()
+
+    tempos, travamentos, outros_erros = [], 0, []
+    fim = time.monotonic() + args.duracao
+    passo = numero
+
+    while time.monotonic() < fim:
+        inicio = time.perf_counter()
+
+        try:
+            if papel == "escrita":
+                _escrever(app, usuario_id, materiais)
+            else:
+                url = URLS_LEITURA[passo % len(URLS_LEITURA)]
+                cliente.executar("GET", url.format(material_id=materiais[0]))
+                passo += 1
+
+        except Exception as erro:
+            with app.app_context():
+                db.session.rollback()
+
+            if _eh_travamento(erro):
+                travamentos += 1
+            else:
+                outros_erros.append(f"{type(erro).__name__}: {erro}"[:200])
+
+            continue
+
+        tempos.append(time.perf_counter() - inicio)
+
+    fila.put({
+        "papel": papel,
+        "tempos": tempos,
+        "travamentos": travamentos,
+        "outros_erros": outros_erros,
+    })
+
+
+def executar_modo(modo, origem, args):
+    contexto = multiprocessing.get_context("spawn")
+
+    with tempfile.TemporaryDirectory() as pasta:
+        banco = Path(pasta) / "benchmark.db"
+
+        usuario_id, materiais = _preparar_copia(
+            origem, banco, MODOS[modo]["journal_mode"], args.login
+        )
+
+        papeis = ["escrita"] * args.escritores + ["leitura"] * args.leitores
+        barreira = contexto.Barrier(len(papeis))
+        fila = contexto.Queue()
+
+        processos = [
+            contexto.Process(
+                target=_trabalhador,
+                args=(papel, numero, modo, str(banco), args, usuario_id, materiais, barreira, fila),
+            )
+            for numero, papel in enumerate(papeis)
+        ]
+
+        for processo in processos:
+            processo.start()
+
+        parciais = [fila.get() for _ in processos]
+
+        for processo in processos:
+            processo.join()
+
+    resultado = {}
+
+    for papel in ("escrita", "leitura"):
+        deste_papel = [p for p in parciais if p["papel"] == papel]
+
+        if not deste_papel:
+            continue
+
+        tempos = [t for p in deste_papel for t in p["tempos"]]
+        outros_erros = [e for p in deste_papel for e in p["outros_erros"]]
+
+        resumo = _resumir(tempos, [], []) if tempos else {"n": 0}
+        resumo.pop("consultas", None)
+        resumo.pop("status", None)
+        resumo["por_segundo"] = round(len(tempos) / args.duracao, 1)
+        resumo["travamentos"] = sum(p["travamentos"] for p in deste_papel)
+        resumo["outros_erros"] = len(outros_erros)
+        resumo["exemplos_erros"] = sorted(set(outros_erros))[:3]
+
+        resultado[papel] = resumo
+
+    return resultado
+
+
+def _imprimir(modo, resultado):
+    for papel, resumo in resultado.items():
+        if not resumo["n"]:
+            print(
+                f"  {modo:10s} {papel:8s} nenhuma operação concluída, "
+                f"{resumo['travamentos']} travamento(s)"
+            )
+            continue
+
+        print(
+            f"  {modo:10s} {papel:8s} {resumo['por_segundo']:7.1f} op/s  "
+            f"p50 {resumo['p50_ms']:8.1f} ms  p95 {resumo['p95_ms']:8.1f} ms  "
+            f"travamentos {resumo['travamentos']:4d}  "
+            f"outros erros {resumo['outros_erros']}"
+        )
+
+        for exemplo in resumo["exemplos_erros"]:
+            print(f"      {exemplo}")
+
+
+def main():
+    args = _parser().parse_args()
+    origem = _arquivo_banco(args.url)
+
+    modos = [m.strip() for m in args.modos.split(",") if m.strip()]
+
+    for modo in modos:
+        if modo not in MODOS:
+            raise SystemExit(f"Modo desconhecido: {modo}")
+
+    print(
+        f"{args.escritores} escritor(es), {args.leitores} leitor(es), "
+        f"{args.duracao:.0f} s por modo"
+    )
+
+    resultados = {}
+
+    for modo in modos:
+        resultados[modo] = executar_modo(modo, origem, args)
+        _imprimir(modo, resultados[modo])
+
+    saida = args.saida or os.path.join(
+        PASTA_RESULTADOS,
+        f"benchmark_sqlite_{datetime.now():%Y%m%d_%H%M%S}.json",
+    )
+    os.makedirs(os.path.dirname(saida) or ".", exist_ok=True)
+
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump(
+            {
+                "executado_em": datetime.now().isoformat(timespec="seconds"),
+                "escritores": args.escritores,
+                "leitores": args.leitores,
+                "duracao_s": args.duracao,
+                "modos": resultados,
+            },
+            arquivo,
+            ensure_ascii=False,
+            indent=2,
+        )
+
+    print(f"Resultado gravado em {saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,615 @@
+"""Gera uma massa de dados sintética de obra para testes de carga.
+
+Cria usuários, categorias, materiais, fornecedores, entradas de NF-e
+concluídas e solicitações em todos os status (com itens, entregas e
+histórico), espalhadas por torres, pavimentos e apartamentos. Saldo e
+reserva de cada material ficam coerentes com os movimentos gerados, e
+o kardex nunca fica negativo (há uma entrada de implantação no início
+do período).
+
+Use sempre um banco separado:
+
+  DATABASE_URL=postgresql://.../aruana_carga \\
+    python -m scripts.gerar_dados_sinteticos --solicitacoes 200000
+
+A mesma --semente gera sempre os mesmos dados.
+"""
+
+import argparse
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import bindparam, func, insert, select, update
+
+from app import create_app
+from app.extensions import db
+from app.models import (
+    Categoria,
+    Entrada,
+    EntradaItem,
+    Fornecedor,
+    Material,
+    Solicitacao,
+    SolicitacaoHistorico,
+    SolicitacaoItem,
+    SolicitacaoItemEntrega,
+    User,
+)
+from app.services import (
+    codigo_material_service,
+    estoque_service,
+    obra_service,
+)
+
+
+SENHA_USUARIOS = "123"
+
+TAMANHO_LOTE = 5000
+
+# Solicitações mais novas que isso ainda podem estar em andamento.
+DIAS_EM_ANDAMENTO = 14
+
+PERFIS = [
+    ("ENCARREGADO", 12),
+    ("MESTRE", 4),
+    ("ALMOXARIFE", 2),
+    ("ENGENHEIRO", 2),
+]
+
+CATEGORIAS = {
+    "Hidráulica": ["Tubo PVC", "Joelho PVC", "Registro", "Luva", "Tê PVC"],
+    "Elétrica": ["Cabo flexível", "Eletroduto", "Disjuntor", "Tomada", "Interruptor"],
+    "Alvenaria": ["Bloco cerâmico", "Bloco de concreto", "Argamassa", "Cimento", "Cal"],
+    "Acabamento": ["Porcelanato", "Rejunte", "Rodapé", "Soleira", "Argamassa AC-III"],
+    "Ferragens": ["Vergalhão", "Arame recozido", "Prego", "Parafuso", "Bucha"],
+    "Pintura": ["Tinta acrílica", "Massa corrida", "Selador", "Lixa", "Rolo de lã"],
+    "Impermeabilização": ["Manta asfáltica", "Primer", "Impermeabilizante", "Tela poliéster"],
+    "Esquadrias": ["Porta de madeira", "Batente", "Fechadura", "Dobradiça", "Janela"],
+    "Louças e metais": ["Bacia sanitária", "Lavatório", "Torneira", "Chuveiro", "Sifão"],
+    "Estrutura": ["Concreto usinado", "Forma", "Escora", "Espaçador", "Brita"],
+    "EPI": ["Luva de raspa", "Capacete", "Óculos", "Protetor auricular", "Bota"],
+    "Ferramentas": ["Disco de corte", "Broca", "Trena", "Colher de pedreiro", "Desempenadeira"],
+}
+
+UNIDADES = ["UN", "SC", "M3", "M", "M2", "KG", "L", "CX", "PC", "RL"]
+
+ESPECIFICACOES = [
+    "20mm", "25mm", "32mm", "40mm", "50mm", "3/4\"", "1/2\"", "2,5mm²",
+    "4mm²", "6mm²", "10A", "20A", "14x19x39", "9x19x39", "50kg", "20kg",
+    "18L", "3,6L", "60x60", "80x80", "CA-50 8mm", "CA-50 10mm", "nº 12",
+    "branco", "cinza", "tipo A", "tipo B", "reforçado", "pesado", "leve",
+]
+
+TORRES = ["01", "02", "03", "04"]
+PAVIMENTOS = [f"Pav {n}" for n in range(1, 21)] + ["Térreo", "Subsolo", "Cobertura"]
+APTOS_POR_PAVIMENTO = 8
+
+MOTIVOS_REJEICAO = [
+    "Quantidade acima do previsto.",
+    "Material já entregue para o local.",
+    "Serviço ainda não liberado.",
+    "Solicitar pelo orçamento da etapa.",
+]
+
+
+def _parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--materiais", type=int, default=3000)
+    parser.add_argument("--solicitacoes", type=int, default=100000)
+    parser.add_argument("--entradas", type=int, default=3000)
+    parser.add_argument("--fornecedores", type=int, default=60)
+    parser.add_argument("--dias", type=int, default=540, help="período coberto, até hoje")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument(
+        "--acrescentar",
+        action="store_true",
+        help="permite gerar num banco que já tem solicitações",
+    )
+    return parser
+
+
+def _inserir(tabela, linhas, retornar_ids=False):
+    if not linhas:
+        return []
+
+    comando = insert(tabela)
+
+    if not retornar_ids:
+        db.session.execute(comando, linhas)
+        return []
+
+    return db.session.execute(
+        comando.returning(tabela.c.id, sort_by_parameter_order=True),
+        linhas,
+    ).scalars().all()
+
+
+class Gerador:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.semente)
+        self.agora = datetime.utcnow().replace(microsecond=0)
+        self.inicio = self.agora - timedelta(days=args.dias)
+
+        # explícita nas linhas: o default de obra_id consultaria o banco
+        # a cada linha inserida
+        self.obra_id = obra_service.obra_padrao_id()
+
+        self.entrada_total = defaultdict(Decimal)
+        self.entregue_total = defaultdict(Decimal)
+        self.reservado_total = defaultdict(Decimal)
+
+    # --------------------------------------------------------------
+    # Cadastros
+    # --------------------------------------------------------------
+    def gerar_usuarios(self):
+        modelo = User(login="_", nome="_")
+        modelo.set_password(SENHA_USUARIOS)
+
+        linhas = []
+
+        for perfil, quantidade in PERFIS:
+            for n in range(1, quantidade + 1):
+                linhas.append({
+                    "nome": f"{perfil.title()} {n}",
+                    "login": f"sint_{perfil.lower()}_{n}_{self.args.semente}",
+                    "senha_hash": modelo.senha_hash,
+                    "role": perfil,
+                    "ativo": True,
+                })
+
+        ids = _inserir(User.__table__, linhas, retornar_ids=True)
+
+        self.usuarios = defaultdict(list)
+
+        for linha, usuario_id in zip(linhas, ids):
+            self.usuarios[linha["role"]].append(usuario_id)
+
+        self.solicitantes = (
+            self.usuarios["ENCARREGADO"] + self.usuarios["MESTRE"]
+        )
+        self.analistas = (
+            self.usuarios["ENGENHEIRO"] + self.usuarios["ALMOXARIFE"]
+        )
+
+    def gerar_materiais(self):
+        linhas_categoria = [{"nome": nome} for nome in CATEGORIAS]
+        categoria_ids = _inserir(
+            Categoria.__table__,
+            linhas_categoria,
+            retornar_ids=True,
+        )
+
+        nomes_base = [
+            (categoria_id, nome)
+            for categoria_id, (_, nomes) in zip(categoria_ids, CATEGORIAS.items())
+            for nome in nomes
+        ]
+
+        codigos = codigo_material_service.alocar_codigos(self.args.materiais)
+
+        linhas = []
+
+        for indice, codigo in enumerate(codigos):
+            categoria_id, base = self.rng.choice(nomes_base)
+            especificacao = self.rng.choice(ESPECIFICACOES)
+
+            linhas.append({
+                "obra_id": self.obra_id,
+                "codigo": codigo,
+                "nome": f"{base} {especificacao} #{indice + 1}",
+                "unidade": self.rng.choice(UNIDADES),
+                "categoria_id": categoria_id,
+                "estoque_minimo": Decimal(self.rng.choice([0, 5, 10, 20, 50])),
+                "saldo_atual": Decimal("0"),
+                "reservado_atual": Decimal("0"),
+                "ativo": self.rng.random() > 0.02,
+            })
+
+        self.materiais = _inserir(
+            Material.__table__,
+            linhas,
+            retornar_ids=True,
+        )
+
+        # Poucos materiais concentram a maior parte dos pedidos.
+        pesos = [
+            1 / (posicao + 1) ** 0.8
+            for posicao in range(len(self.materiais))
+        ]
+        self.rng.shuffle(pesos)
+
+        acumulado = 0
+        self.pesos_acumulados = []
+
+        for peso in pesos:
+            acumulado += peso
+            self.pesos_acumulados.append(acumulado)
+
+        db.session.commit()
+
+    def gerar_fornecedores(self):
+        linhas = [
+            {
+                "documento": f"{self.args.semente:04d}{n:010d}",
+                "nome": f"Fornecedor Sintético {n} Ltda",
+                "ativo": True,
+            }
+            for n in range(1, self.args.fornecedores + 1)
+        ]
+
+        _inserir(Fornecedor.__table__, linhas)
+        self.fornecedores = linhas
+
+    def _sortear_materiais(self, quantidade):
+        return set(
+            self.rng.choices(
+                self.materiais,
+                cum_weights=self.pesos_acumulados,
+                k=quantidade,
+            )
+        )
+
+    def _data_aleatoria(self, depois_de=None, ate=None):
+        inicio = depois_de or self.inicio
+        fim = ate or self.agora
+        segundos = max(int((fim - inicio).total_seconds()), 1)
+
+        return inicio + timedelta(seconds=self.rng.randrange(segundos))
+
+    # --------------------------------------------------------------
+    # Solicitações
+    # --------------------------------------------------------------
+    def _status_solicitacao(self, data):
+        if (self.agora - data).days > DIAS_EM_ANDAMENTO:
+            opcoes = [("ENTREGUE", 88), ("REJEITADA", 7), ("ENTREGUE_PARCIAL", 5)]
+        else:
+            opcoes = [
+                ("PENDENTE", 35),
+                ("APROVADA", 25),
+                ("ENTREGUE", 30),
+                ("ENTREGUE_PARCIAL", 5),
+                ("REJEITADA", 5),
+            ]
+
+        status, pesos = zip(*opcoes)
+
+        return self.rng.choices(status, weights=pesos)[0]
+
+    def _quantidade(self):
+        return Decimal(self.rng.choice([1, 2, 2, 3, 4, 5, 6, 8, 10, 12, 15, 20, 25, 40, 50]))
+
+    def gerar_lote_solicitacoes(self, datas):
+        cabecalhos = []
+        planos = []
+
+        for data in datas:
+            status = self._status_solicitacao(data)
+            analisada = status != "PENDENTE"
+            entregue = status in {"ENTREGUE", "ENTREGUE_PARCIAL"}
+
+            data_aprovacao = (
+                self._data_aleatoria(data, min(data + timedelta(days=2), self.agora))
+                if analisada else None
+            )
+            data_entrega = (
+                self._data_aleatoria(
+                    data_aprovacao,
+                    min(data_aprovacao + timedelta(days=3), self.agora),
+                )
+                if entregue else None
+            )
+
+            cabecalhos.append({
+                "obra_id": self.obra_id,
+                "usuario_id": self.rng.choice(self.solicitantes),
+                "aprovado_por_id": self.rng.choice(self.analistas) if analisada else None,
+                "entregue_por_id": (
+                    self.rng.choice(self.usuarios["ALMOXARIFE"]) if entregue else None
+                ),
+                "data_solicitacao": data,
+                "data_aprovacao": data_aprovacao,
+                "data_entrega": data_entrega,
+                "status": status,
+                "observacao": None,
+                "local_torre": self.rng.choice(TORRES),
+                "local_pav": self.rng.choice(PAVIMENTOS),
+                "local_apto": str(
+                    100 * self.rng.randint(1, 20)
+                    + self.rng.randint(1, APTOS_POR_PAVIMENTO)
+                ),
+            })
+
+            planos.append(
+                self._sortear_materiais(self.rng.randint(1, 6))
+            )
+
+        ids = _inserir(Solicitacao.__table__, cabecalhos, retornar_ids=True)
+
+        itens = []
+
+        for solicitacao_id, cabecalho, materiais in zip(ids, cabecalhos, planos):
+            status = cabecalho["status"]
+
+            for posicao, material_id in enumerate(sorted(materiais)):
+                qtd = self._quantidade()
+
+                parcial = status == "ENTREGUE_PARCIAL" and posicao == 0
+
+                if parcial:
+                    qtd = max(qtd, Decimal("2"))
+                item = {
+                    "solicitacao_id": solicitacao_id,
+                    "material_id": material_id,
+                    "qtd": qtd,
+                    "status": "PENDENTE",
+                    "qtd_aprovada": None,
+                    "motivo_rejeicao": None,
+                    "analisado_por_id": cabecalho["aprovado_por_id"],
+                    "data_analise": cabecalho["data_aprovacao"],
+                    "qtd_entregue": Decimal("0"),
+                }
+
+                if status == "REJEITADA":
+                    item["status"] = "REJEITADO"
+                    item["motivo_rejeicao"] = self.rng.choice(MOTIVOS_REJEICAO)
+
+                elif status in {"APROVADA", "ENTREGUE", "ENTREGUE_PARCIAL"}:
+                    item["status"] = "APROVADO"
+                    item["qtd_aprovada"] = qtd
+
+                    if status == "ENTREGUE":
+                        item["status"] = "ENTREGUE"
+                        item["qtd_entregue"] = qtd
+
+                    elif parcial:
+                        # o primeiro item sai pela metade, os demais inteiros
+                        item["status"] = "ENTREGUE_PARCIAL"
+                        item["qtd_entregue"] = qtd // 2
+
+                    elif status == "ENTREGUE_PARCIAL":
+                        item["status"] = "ENTREGUE"
+                        item["qtd_entregue"] = qtd
+
+                    self.entregue_total[material_id] += item["qtd_entregue"]
+                    self.reservado_total[material_id] += qtd - item["qtd_entregue"]
+
+                itens.append((cabecalho, item))
+
+        item_ids = _inserir(
+            SolicitacaoItem.__table__,
+            [item for _, item in itens],
+            retornar_ids=True,
+        )
+
+        entregas = []
+        historico = []
+
+        for solicitacao_id, cabecalho in zip(ids, cabecalhos):
+            historico.append({
+                "solicitacao_id": solicitacao_id,
+                "item_id": None,
+                "usuario_id": cabecalho["usuario_id"],
+                "acao": "CRIACAO",
+                "descricao": "Solicitação criada.",
+                "data_evento": cabecalho["data_solicitacao"],
+            })
+
+        for item_id, (cabecalho, item) in zip(item_ids, itens):
+            if item["status"] == "PENDENTE":
+                continue
+
+            historico.append({
+                "solicitacao_id": item["solicitacao_id"],
+                "item_id": item_id,
+                "usuario_id": cabecalho["aprovado_por_id"],
+                "acao": "ITEM_REJEITADO" if item["status"] == "REJEITADO" else "ITEM_APROVADO",
+                "descricao": (
+                    f"Item rejeitado: {item['motivo_rejeicao']}"
+                    if item["status"] == "REJEITADO"
+                    else f"Item aprovado: {item['qtd_aprovada']}."
+                ),
+                "data_evento": cabecalho["data_aprovacao"],
+            })
+
+            if item["qtd_entregue"] > 0:
+                entregas.append({
+                    "solicitacao_id": item["solicitacao_id"],
+                    "item_id": item_id,
+                    "material_id": item["material_id"],
+                    "qtd": item["qtd_entregue"],
+                    "usuario_id": cabecalho["entregue_por_id"],
+                    "data_entrega": cabecalho["data_entrega"],
+                })
+
+                historico.append({
+                    "solicitacao_id": item["solicitacao_id"],
+                    "item_id": item_id,
+                    "usuario_id": cabecalho["entregue_por_id"],
+                    "acao": "ENTREGA",
+                    "descricao": f"Item entregue: {item['qtd_entregue']}.",
+                    "data_evento": cabecalho["data_entrega"],
+                })
+
+        _inserir(SolicitacaoItemEntrega.__table__, entregas)
+        _inserir(SolicitacaoHistorico.__table__, historico)
+
+        db.session.commit()
+
+        return len(item_ids)
+
+    def gerar_solicitacoes(self):
+        datas = sorted(
+            self._data_aleatoria()
+            for _ in range(self.args.solicitacoes)
+        )
+
+        total_itens = 0
+
+        for inicio in range(0, len(datas), TAMANHO_LOTE):
+            total_itens += self.gerar_lote_solicitacoes(
+                datas[inicio:inicio + TAMANHO_LOTE]
+            )
+            print(
+                f"  {min(inicio + TAMANHO_LOTE, len(datas))}"
+                f"/{len(datas)} solicitações"
+            )
+
+        return total_itens
+
+    # --------------------------------------------------------------
+    # Entradas
+    # --------------------------------------------------------------
+    def _gravar_entradas(self, cabecalhos, itens_por_entrada):
+        ids = _inserir(Entrada.__table__, cabecalhos, retornar_ids=True)
+
+        itens = []
+
+        for entrada_id, itens_entrada in zip(ids, itens_por_entrada):
+            for material_id, qtd in itens_entrada:
+                itens.append({
+                    "entrada_id": entrada_id,
+                    "material_id": material_id,
+                    "qtd": qtd,
+                })
+                self.entrada_total[material_id] += qtd
+
+        _inserir(EntradaItem.__table__, itens)
+
+    def gerar_entradas(self):
+        registrador = self.rng.choice(self.usuarios["ALMOXARIFE"])
+
+        # Implantação: cobre todo o consumo e a reserva do período,
+        # para o saldo nunca ficar negativo no kardex.
+        implantacao = [
+            (
+                material_id,
+                self.entregue_total[material_id]
+                + self.reservado_total[material_id]
+                + self._quantidade(),
+            )
+            for material_id in self.materiais
+        ]
+
+        self._gravar_entradas(
+            [{
+                "obra_id": self.obra_id,
+                "data_entrada": self.inicio,
+                "status": "CONCLUIDA",
+                "numero_nf": "IMPLANTACAO",
+                "documento_fornecedor": None,
+                "nome_fornecedor": "Saldo inicial",
+                "registrado_por_id": registrador,
+            }],
+            [implantacao],
+        )
+
+        datas = sorted(
+            self._data_aleatoria()
+            for _ in range(self.args.entradas)
+        )
+
+        for inicio in range(0, len(datas), TAMANHO_LOTE):
+            cabecalhos = []
+            itens = []
+
+            for indice, data in enumerate(datas[inicio:inicio + TAMANHO_LOTE]):
+                fornecedor = self.rng.choice(self.fornecedores)
+
+                cabecalhos.append({
+                    "obra_id": self.obra_id,
+                    "data_entrada": data,
+                    "status": "CONCLUIDA",
+                    "numero_nf": str(100000 + inicio + indice),
+                    "documento_fornecedor": fornecedor["documento"],
+                    "nome_fornecedor": fornecedor["nome"],
+                    "registrado_por_id": registrador,
+                })
+                itens.append([
+                    (material_id, self._quantidade() * 4)
+                    for material_id in self._sortear_materiais(
+                        self.rng.randint(3, 15)
+                    )
+                ])
+
+            self._gravar_entradas(cabecalhos, itens)
+
+        db.session.commit()
+
+    def atualizar_saldos(self):
+        linhas = [
+            {
+                "b_id": material_id,
+                "b_saldo": (
+                    self.entrada_total[material_id]
+                    - self.entregue_total[material_id]
+                ),
+                "b_reservado": self.reservado_total[material_id],
+            }
+            for material_id in self.materiais
+        ]
+
+        tabela = Material.__table__
+
+        db.session.execute(
+            update(tabela)
+            .where(tabela.c.id == bindparam("b_id"))
+            .values(
+                saldo_atual=tabela.c.saldo_atual + bindparam("b_saldo"),
+                reservado_atual=(
+                    tabela.c.reservado_atual + bindparam("b_reservado")
+                ),
+            ),
+            linhas,
+        )
+
+        # o saldo gerado fica no almoxarifado central de cada obra
+        estoque_service.conciliar_locais()
+
+        db.session.commit()
+
+
+def main():
+    args = _parser().parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        existentes = db.session.execute(
+            select(func.count(Solicitacao.id))
+        ).scalar()
+
+        if existentes and not args.acrescentar:
+            raise SystemExit(
+                f"O banco já tem {existentes} solicitações. Use um banco "
+                "vazio ou passe --acrescentar."
+            )
+
+        gerador = Gerador(args)
+        inicio = time.perf_counter()
+
+        print("Usuários, categorias e materiais...")
+        gerador.gerar_usuarios()
+        gerador.gerar_materiais()
+        gerador.gerar_fornecedores()
+
+        print("Solicitações...")
+        total_itens = gerador.gerar_solicitacoes()
+
+        print("Entradas...")
+        gerador.gerar_entradas()
+        gerador.atualizar_saldos()
+
+        print(
+            f"Concluído em {time.perf_counter() - inicio:.1f}s: "
+            f"{args.materiais} materiais, {args.solicitacoes} solicitações "
+            f"({total_itens} itens), {args.entradas + 1} entradas. "
+            f"Usuários sint_* com senha {SENHA_USUARIOS}."
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Cria as partições futuras de solicitacao_historico e remove as antigas.
+
+Agendar uma vez por dia (ex.: cron 30 2 * * *). Sem --reter, nenhuma
+partição é removida.
+
+  DATABASE_URL=... python -m scripts.manter_particoes_historico
+  python -m scripts.manter_particoes_historico --reter 24 --arquivar
+
+--reter N mantém os N meses mais recentes (além do atual). Com
+--arquivar a partição antiga só é desanexada e fica no banco como
+tabela avulsa, para um pg_dump -t e DROP depois; sem, é apagada.
+"""
+
+import argparse
+import sys
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app import create_app
+from app.database_updates.particoes import (
+    criar_particoes,
+    inicio_do_mes,
+    mes_seguinte,
+    remover_particoes_antigas,
+    tabela_particionada,
+)
+from app.extensions import db
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--meses-futuros", type=int, default=3)
+    parser.add_argument("--reter", type=int, help="meses de histórico mantidos")
+    parser.add_argument("--arquivar", action="store_true")
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        if db.engine.dialect.name != "postgresql":
+            print("Particionamento só existe no PostgreSQL; nada a fazer.")
+            return
+
+        with db.engine.begin() as conexao:
+            # criar e desanexar partições trava a tabela toda por um
+            # instante; não pode ficar na fila atrás de transação longa
+            conexao.execute(
+                text("SELECT set_config('lock_timeout', :limite, true)"),
+                {"limite": app.config["ATUALIZACAO_LOCK_TIMEOUT"] or "0"},
+            )
+
+            if not tabela_particionada(conexao):
+                print(
+                    "solicitacao_historico ainda não é particionada; "
+                    "rode run_database_updates.py."
+                )
+                sys.exit(1)
+
+            # datas em UTC, como data_evento
+            mes_atual = inicio_do_mes(datetime.utcnow())
+
+            criadas = criar_particoes(
+                conexao,
+                mes_atual,
+                mes_seguinte(mes_atual, args.meses_futuros),
+            )
+
+            removidas = []
+
+            if args.reter is not None:
+                removidas = remover_particoes_antigas(
+                    conexao,
+                    mes_seguinte(mes_atual, -args.reter),
+                    arquivar=args.arquivar,
+                )
+
+        for nome in criadas:
+            print(f"Partição criada: {nome}")
+
+        for nome in removidas:
+            situacao = "desanexada" if args.arquivar else "removida"
+            print(f"Partição {situacao}: {nome}")
+
+        if not criadas and not removidas:
+            print("Partições em dia.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""Confere, via EXPLAIN, se as consultas mais usadas usam os índices.
+
+Para cada consulta quente (relatório de solicitações, consumo/saídas,
+itens da solicitação e kardex) mostra o plano e verifica se o índice
+esperado aparece nele. Sai com código 1 se algum não aparecer. As
+consultas levam o filtro da obra (a padrão), como nas requisições.
+
+No PostgreSQL o seq scan é desligado durante a verificação (SET LOCAL
+enable_seqscan = off): em tabelas pequenas o planejador prefere ler a
+tabela inteira, e o que interessa aqui é saber se o índice atende o
+formato da consulta.
+
+  DATABASE_URL=... python -m scripts.verificar_indices [-v]
+"""
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from sqlalchemy import select
+
+from app import create_app, escopo_obra
+from app.extensions import db
+from app.models import (
+    Entrada,
+    EntradaItem,
+    Material,
+    Solicitacao,
+    SolicitacaoItem,
+    SolicitacaoItemEntrega,
+)
+from app.services import obra_service, relatorio_solicitacoes_service
+
+
+def _consultas():
+    """
+    (nome, índice esperado, select). Os selects reproduzem os filtros
+    usados pelas rotas e serviços.
+    """
+    inicio = datetime.now() - timedelta(days=30)
+    fim = datetime.now()
+
+    admin = SimpleNamespace(id=0, role="ADMIN")
+    encarregado = SimpleNamespace(id=1, role="ENCARREGADO")
+
+    def relatorio(filtros, usuario):
+        return relatorio_solicitacoes_service.montar_query_solicitacoes(
+            filtros,
+            usuario,
+        ).statement
+
+    return [
+        (
+            "relatório por local",
+            "ix_solicitacao_obra_local_data",
+            relatorio(
+                {"torre": "01", "pavimento": "Pav 1", "apartamento": "101"},
+                admin,
+            ),
+        ),
+        (
+            "relatório do próprio usuário",
+            "ix_solicitacao_obra_usuario_data",
+            relatorio({}, encarregado),
+        ),
+        (
+            "relatório por status e período",
+            "ix_solicitacao_obra_status_data",
+            relatorio(
+                {
+                    "status": "PENDENTE",
+                    "data_inicial": inicio.strftime("%Y-%m-%d"),
+                },
+                admin,
+            ),
+        ),
+        (
+            "relatório por material",
+            "ix_solicitacao_item_material_solicitacao",
+            relatorio({"material_id": "1"}, admin),
+        ),
+        (
+            "consumo/saídas entregues no período",
+            "ix_solicitacao_obra_entregue_data_entrega",
+            select(Solicitacao.id)
+            .where(
+                Solicitacao.status == "ENTREGUE",
+                Solicitacao.data_entrega >= inicio,
+                Solicitacao.data_entrega <= fim,
+            )
+            .order_by(Solicitacao.id.desc()),
+        ),
+        (
+            "materiais da obra por nome",
+            "ix_material_obra_nome",
+            select(Material.id, Material.nome).order_by(Material.nome),
+        ),
+        (
+            "itens das solicitações (selectin)",
+            "ix_solicitacao_item_solicitacao_id",
+            select(SolicitacaoItem)
+            .where(SolicitacaoItem.solicitacao_id.in_([1, 2, 3])),
+        ),
+        (
+            "kardex: entradas do material",
+            "ix_entrada_item_material_entrada",
+            select(EntradaItem.qtd, Entrada.data_entrada)
+            .join(Entrada, Entrada.id == EntradaItem.entrada_id)
+            .where(
+                EntradaItem.material_id == 1,
+                Entrada.status == "CONCLUIDA",
+            ),
+        ),
+        (
+            "kardex: entregas do material",
+            "ix_solicitacao_item_entrega_material_id",
+            select(SolicitacaoItemEntrega.qtd)
+            .where(SolicitacaoItemEntrega.material_id == 1),
+        ),
+    ]
+
+
+def _plano(conexao, consulta):
+    dialeto = conexao.dialect
+
+    compilado = consulta.compile(
+        dialect=dialeto,
+        compile_kwargs={"render_postcompile": True},
+    )
+
+    parametros = compilado.construct_params()
+
+    if compilado.positiontup:
+        parametros = tuple(parametros[nome] for nome in compilado.positiontup)
+
+    if dialeto.name == "postgresql":
+        comando = "EXPLAIN "
+    else:
+        comando = "EXPLAIN QUERY PLAN "
+
+    linhas = conexao.exec_driver_sql(
+        comando + str(compilado),
+        parametros,
+    ).all()
+
+    if dialeto.name == "postgresql":
+        return [linha[0] for linha in linhas]
+
+    return [linha[-1] for linha in linhas]
+
+
+def verificar(detalhar=False):
+    conexao = db.session.connection()
+
+    if conexao.dialect.name == "postgresql":
+        conexao.exec_driver_sql("SET LOCAL enable_seqscan = off")
+
+    criterios = escopo_obra.criterios_obra(obra_service.obra_padrao_id())
+    falhas = 0
+
+    try:
+        for nome, indice, consulta in _consultas():
+            plano = _plano(conexao, consulta.options(*criterios))
+            usado = any(indice in linha for linha in plano)
+
+            if not usado:
+                falhas += 1
+
+            print(f"[{'OK' if usado else 'FALHOU'}] {nome}: {indice}")
+
+            if detalhar or not usado:
+                for linha in plano:
+                    print(f"      {linha}")
+    finally:
+        db.session.rollback()
+
+    return falhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-v", "--detalhar", action="store_true", help="mostra todos os planos")
+    args = parser.parse_args()
+
+    app = create_app()
+
+    with app.app_context():
+        falhas = verificar(args.detalhar)
+
+    if falhas:
+        print(f"{falhas} consulta(s) sem o índice esperado.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()